@@ -0,0 +1,353 @@
+#
+# MIT License
+#
+# (C) Copyright 2021-2022 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Declarative changes to the cloud-init data held in BSS boot parameters.
+
+A rule targets nodes by their HSM role and optionally subrole, and lists
+operations on paths within the cloud-init user-data or meta-data:
+
+    rules:
+      - name: ceph-enable-services
+        role: Management
+        subrole: Storage
+        operations:
+          - {op: remove, path: user-data.runcmd, value: /srv/cray/scripts/common/storage-ceph-cloudinit.sh}
+          - {op: add, path: user-data.runcmd, value: /srv/cray/scripts/common/ceph-enable-services.sh}
+
+add appends a value to a list unless it is already there, creating the list
+when it is missing. remove drops a value from a list, or the key itself when no value is
+given. replace swaps a value for another, in a list or as the value of the
+key. set gives a key a value. Every operation is a no-op when the change is
+already in place, so rules can be applied any number of times.
+
+All rules are applied in a single pass: HSM is queried once per role, the
+boot parameters of every targeted node are fetched in bulk, and each entry is
+patched at most once with the combined changes of every rule that matched it.
+"""
+
+import copy
+import difflib
+import http
+import json
+from csm_api_client import TokenError
+
+# Paths within the BSS and HSM services of CsmApiClient
+BOOTPARAMETERS_PATH = '/bootparameters'
+COMPONENTS_PATH = '/State/Components'
+
+# Number of hosts whose boot parameters are fetched with a single request
+BULK_FETCH_SIZE = 100
+
+OPERATIONS = ('add', 'remove', 'replace', 'set')
+SECTIONS = ('user-data', 'meta-data')
+
+# The change made by patch-ceph-runcmd.py
+CEPH_RUNCMD_RULES = {
+    'rules': [{
+        'name': 'ceph-enable-services',
+        'role': 'Management',
+        'subrole': 'Storage',
+        'operations': [
+            {'op': 'remove', 'path': 'user-data.runcmd', 'value': '/srv/cray/scripts/common/storage-ceph-cloudinit.sh'},
+            {'op': 'add', 'path': 'user-data.runcmd', 'value': '/srv/cray/scripts/common/ceph-enable-services.sh'},
+        ],
+    }],
+}
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Rule:
+    """
+    Operations applied to the cloud-init data of the nodes with a HSM role and subrole
+    """
+
+    def __init__(self, name, role, subrole, operations):
+        self.name = name
+        self.role = role
+        self.subrole = subrole
+        self.operations = operations
+
+    def matches(self, component):
+        return component.get('Role') == self.role and (self.subrole is None or component.get('SubRole') == self.subrole)
+
+    def apply(self, cloud_init):
+        """
+        Apply the operations of the rule. Returns True if anything changed.
+        """
+        changed = False
+        for operation in self.operations:
+            changed |= apply_operation(cloud_init, operation)
+        return changed
+
+
+def _parse_operation(rule_name, operation):
+    if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+        raise RuleError('Rule {} has an operation that is not one of {}: {}'.format(rule_name, ', '.join(OPERATIONS), operation))
+
+    path = operation.get('path')
+    if not isinstance(path, str) or path.split('.')[0] not in SECTIONS or len(path.split('.')) < 2:
+        raise RuleError('Rule {} has an operation without a path within {}: {}'.format(rule_name, ' or '.join(SECTIONS), operation))
+
+    if operation['op'] in ('add', 'set') and 'value' not in operation:
+        raise RuleError('Rule {} has an {} operation without a value: {}'.format(rule_name, operation['op'], operation))
+    if operation['op'] == 'replace' and ('value' not in operation or 'with' not in operation):
+        raise RuleError('Rule {} has a replace operation without a value and with: {}'.format(rule_name, operation))
+
+    return dict(operation, path=path.split('.'))
+
+
+def parse_rules(data):
+    if not isinstance(data, dict) or not isinstance(data.get('rules'), list):
+        raise RuleError('Expected a rules list')
+
+    rules = []
+    for i, rule in enumerate(data['rules'], start=1):
+        if not isinstance(rule, dict):
+            raise RuleError('Rule {} is not a mapping'.format(i))
+
+        name = rule.get('name', 'rule-{}'.format(i))
+        if not rule.get('role'):
+            raise RuleError('Rule {} has no role'.format(name))
+        if not rule.get('operations'):
+            raise RuleError('Rule {} has no operations'.format(name))
+
+        operations = [_parse_operation(name, operation) for operation in rule['operations']]
+        rules.append(Rule(name, rule['role'], rule.get('subrole'), operations))
+
+    return rules
+
+
+def load_rules(path):
+    """
+    Load rules from a YAML or JSON file
+    """
+    with open(path) as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise RuleError('The PyYAML module is required to read {}'.format(path))
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as err:
+                raise RuleError('Unable to parse {}: {}'.format(path, err))
+
+    return parse_rules(data)
+
+
+def apply_operation(cloud_init, operation):
+    """
+    Apply a single operation to the cloud-init data of a BSS entry. Returns
+    True if anything changed.
+    """
+    *parents, key = operation['path']
+
+    container = cloud_init
+    for parent in parents:
+        if not isinstance(container.get(parent), dict):
+            if operation['op'] not in ('add', 'set'):
+                return False
+            container[parent] = {}
+        container = container[parent]
+
+    op = operation['op']
+    value = operation.get('value')
+    current = container.get(key)
+
+    if op == 'set':
+        if key in container and current == value:
+            return False
+        container[key] = copy.deepcopy(value)
+        return True
+
+    if op == 'add':
+        if key not in container:
+            container[key] = [copy.deepcopy(value)]
+            return True
+        if not isinstance(current, list):
+            raise RuleError('Can not add to {}, it is not a list'.format('.'.join(operation['path'])))
+        if value in current:
+            return False
+        current.append(copy.deepcopy(value))
+        return True
+
+    if op == 'remove':
+        if key not in container:
+            return False
+        if 'value' not in operation:
+            del container[key]
+            return True
+        if isinstance(current, list):
+            remaining = [item for item in current if item != value]
+            if len(remaining) == len(current):
+                return False
+            current[:] = remaining
+            return True
+        if current == value:
+            del container[key]
+            return True
+        return False
+
+    # replace
+    replacement = operation['with']
+    if isinstance(current, list):
+        if value not in current:
+            return False
+        # Keep the position of the replaced value, without listing the replacement twice
+        updated = []
+        for item in current:
+            if item == value:
+                item = copy.deepcopy(replacement)
+            if item == replacement and replacement in updated:
+                continue
+            updated.append(item)
+        current[:] = updated
+        return True
+    if key in container and current == value:
+        container[key] = copy.deepcopy(replacement)
+        return True
+    return False
+
+
+def find_targets(client, rules):
+    """
+    Find the nodes targeted by the rules, with one HSM query per role. Returns
+    a dict of xname to the rules matching it, in rule order.
+    """
+    components = {}
+    for role in dict.fromkeys(rule.role for rule in rules):
+        for component in client.get_json('hsm', COMPONENTS_PATH, params={'role': role})['Components']:
+            components[component['ID']] = component
+
+    targets = {}
+    for xname in sorted(components):
+        matching = [rule for rule in rules if rule.matches(components[xname])]
+        if matching:
+            targets[xname] = matching
+    return targets
+
+
+def fetch_boot_parameters(client, xnames):
+    """
+    Fetch the BSS boot parameters of many hosts with one request, by giving
+    the name query parameter once for each host.
+    """
+    return client.get_json('bss', BOOTPARAMETERS_PATH, params={'name': xnames})
+
+
+def fetch_all_boot_parameters(client, executor, xnames):
+    """
+    Fetch the boot parameters of the hosts in chunks of BULK_FETCH_SIZE using
+    the workers of executor. Returns the entries, and the xnames of the
+    chunks that failed with their error.
+    """
+    chunks = [xnames[i:i + BULK_FETCH_SIZE] for i in range(0, len(xnames), BULK_FETCH_SIZE)]
+    entries = []
+    failures = {}
+    for chunk, future in zip(chunks, [executor.submit(fetch_boot_parameters, client, chunk) for chunk in chunks]):
+        try:
+            entries.extend(future.result())
+        # requests exceptions are IOErrors, and a bad response body is a ValueError
+        except (IOError, ValueError, TokenError) as err:
+            for xname in chunk:
+                failures[xname] = 'Failed to get BSS entry: {}'.format(err)
+    return entries, failures
+
+
+class Change:
+    """
+    The combined change of every rule that matched a BSS entry
+    """
+
+    def __init__(self, hosts, original, updated, rules):
+        self.hosts = hosts
+        self.original = original
+        self.updated = updated
+        self.rules = rules
+
+    def describe(self):
+        return describe(self.updated)
+
+    def diff(self):
+        before = json.dumps(self.original.get('cloud-init', {}), indent=2, sort_keys=True).splitlines()
+        after = json.dumps(self.updated['cloud-init'], indent=2, sort_keys=True).splitlines()
+        return difflib.unified_diff(before, after, 'cloud-init', 'cloud-init', lineterm='')
+
+
+def describe(bss_json):
+    user_data = bss_json.get('cloud-init', {}).get('user-data', {})
+    return '{}/{}'.format(','.join(bss_json['hosts']), user_data.get('hostname'))
+
+
+def plan_changes(entries, targets):
+    """
+    Apply the matching rules to each BSS entry locally. Returns the entries
+    that changed, the entries already up to date, and the xnames that could
+    not be changed with the reason.
+    """
+    changes = []
+    unchanged = []
+    failures = {}
+    found = set()
+    for bss_json in entries:
+        hosts = [xname for xname in bss_json.get('hosts', []) if xname in targets]
+        if not hosts:
+            continue
+        found.update(hosts)
+
+        # An entry may cover several targeted hosts, apply each matching rule once
+        rules = list(dict.fromkeys(rule for xname in hosts for rule in targets[xname]))
+
+        original = copy.deepcopy(bss_json)
+        cloud_init = bss_json.setdefault('cloud-init', {})
+        try:
+            applied = [rule.name for rule in rules if rule.apply(cloud_init)]
+        except (RuleError, TypeError, AttributeError) as err:
+            for xname in hosts:
+                failures[xname] = 'Unable to apply rules to BSS entry: {}'.format(err)
+            continue
+
+        if applied:
+            changes.append(Change(hosts, original, bss_json, applied))
+        else:
+            unchanged.append(bss_json)
+
+    for xname in targets:
+        if xname not in found:
+            failures[xname] = 'No BSS entry found'
+
+    return changes, unchanged, failures
+
+
+def patch_boot_parameters(client, bss_json):
+    response = client.request('PATCH', 'bss', BOOTPARAMETERS_PATH, data=json.dumps(bss_json),
+                              headers={'Content-Type': 'application/json'})
+    if response.status_code != http.HTTPStatus.OK:
+        raise RuntimeError('BSS returned HTTP {}'.format(response.status_code))
@@ -0,0 +1,310 @@
+#
+# MIT License
+#
+# (C) Copyright 2022 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Client for the CSM services behind the API gateway.
+
+A single pooled session is shared by every thread, so scripts making many
+calls reuse their connections instead of doing a TLS handshake per request.
+The bearer token is taken from the TOKEN environment variable, or requested
+from Keycloak with the admin client credentials when ADMIN_CLIENT_SECRET is
+set, in which case it is refreshed shortly before it expires.
+
+    client = CsmApiClient('api-gw-service-nmn.local', TokenManager.from_env())
+    components = client.get_json('hsm', '/State/Components', params={'role': 'Management'})
+"""
+
+import base64
+import collections
+import http
+import json
+import os
+import threading
+import time
+import urllib.parse
+import requests
+import urllib3
+
+urllib3.disable_warnings()
+
+DEFAULT_API_GATEWAY = 'api-gw-service-nmn.local'
+
+# Base path of each service behind the API gateway
+SERVICE_PATHS = {
+    'bss': '/apis/bss/boot/v1',
+    'hsm': '/apis/smd/hsm/v2',
+    'sls': '/apis/sls/v1',
+    'keycloak': '/keycloak',
+}
+
+TOKEN_PATH = '/realms/shasta/protocol/openid-connect/token'
+
+# Tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+
+# Responses worth retrying, anything else is returned to the caller right away
+RETRY_STATUS_CODES = {
+    http.HTTPStatus.TOO_MANY_REQUESTS,
+    http.HTTPStatus.BAD_GATEWAY,
+    http.HTTPStatus.SERVICE_UNAVAILABLE,
+    http.HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+# A 500 may come after the change was already made, so it is only retried for
+# methods that are safe to repeat
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class TokenError(Exception):
+    pass
+
+
+def gateway_url(address):
+    """
+    The base URL of the API gateway. A host name gets https, a full URL such as
+    http://localhost:8080 is used as is.
+    """
+    if '://' in address:
+        return address.rstrip('/')
+    return 'https://{}'.format(address)
+
+
+def jwt_expiry(token):
+    """
+    The exp claim of a JWT, or None if the token is not a JWT. The signature is
+    not verified, the gateway does that.
+    """
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, ValueError, KeyError, TypeError):
+        return None
+
+
+class TokenManager:
+    """
+    Hands out a bearer token, requesting a new one from Keycloak when the
+    current one is about to expire and client credentials are available.
+    """
+
+    def __init__(self, token=None, client_id='admin-client', client_secret=None, token_url=None):
+        if token is None and client_secret is None:
+            raise TokenError('TOKEN environment variable must be set!')
+
+        self.token = token
+        self.expires = jwt_expiry(token) if token is not None else None
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, gateway=DEFAULT_API_GATEWAY):
+        return cls(
+            token=os.environ.get('TOKEN'),
+            client_id=os.environ.get('ADMIN_CLIENT_ID', 'admin-client'),
+            client_secret=os.environ.get('ADMIN_CLIENT_SECRET'),
+            token_url=gateway_url(gateway) + SERVICE_PATHS['keycloak'] + TOKEN_PATH,
+        )
+
+    @property
+    def can_refresh(self):
+        return self.client_secret is not None and self.token_url is not None
+
+    def _expiring(self):
+        return self.expires is not None and self.expires - time.time() < TOKEN_REFRESH_MARGIN
+
+    def get(self):
+        with self.lock:
+            if self.can_refresh and (self.token is None or self._expiring()):
+                self._refresh()
+            return self.token
+
+    def invalidate(self, token):
+        """
+        Drop a token the gateway rejected, so the next get requests a new one.
+        Returns True if a new token can be requested.
+        """
+        with self.lock:
+            if self.token == token and self.can_refresh:
+                self.token = None
+            return self.can_refresh
+
+    def _refresh(self):
+        response = requests.post(self.token_url, verify=False, timeout=30, data={
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
+        if response.status_code != http.HTTPStatus.OK:
+            raise TokenError('Unable to get a token from {}: HTTP {}'.format(self.token_url, response.status_code))
+
+        body = response.json()
+        self.token = body['access_token']
+        self.expires = jwt_expiry(self.token)
+        if self.expires is None and 'expires_in' in body:
+            self.expires = time.time() + float(body['expires_in'])
+
+
+class RequestTimer:
+    """
+    Timing hook collecting the number of requests and their latency per
+    service and method
+    """
+
+    def __init__(self):
+        self.stats = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    def __call__(self, method, service, url, status, elapsed):
+        with self.lock:
+            self.stats[(service, method)].append(elapsed)
+
+    def report(self):
+        lines = ['Service  | Method | Requests | Total      | Mean       | Max',
+                 '---------|--------|----------|------------|------------|-----------']
+        for (service, method), times in sorted(self.stats.items()):
+            lines.append('{:<9}| {:<7}| {:<9}| {:>9.3f}s | {:>9.3f}s | {:>8.3f}s'.format(
+                service, method, len(times), sum(times), sum(times) / len(times), max(times)))
+        return '\n'.join(lines)
+
+
+class CsmApiClient:
+    """
+    Pooled and retrying client for the services behind the API gateway. Safe
+    to share between threads.
+    """
+
+    def __init__(self, gateway=DEFAULT_API_GATEWAY, tokens=None, timeout=30, retries=3, backoff=1,
+                 pool_size=16, verify=False, services=None):
+        self.base_url = gateway_url(gateway)
+        self.tokens = tokens
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hooks = []
+
+        # A service may also be given as a full URL, ex: https://host/apis/sls/v1
+        self.services = dict(SERVICE_PATHS)
+        self.services.update(services or {})
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def add_hook(self, hook):
+        """
+        Call hook(method, service, url, status, elapsed) after every request,
+        status is None when the request failed without a response
+        """
+        self.hooks.append(hook)
+
+    def url(self, service, path=''):
+        base = self.services[service]
+        if '://' not in base:
+            base = self.base_url + base
+        return base + path
+
+    def _send(self, method, service, url, **kwargs):
+        headers = dict(kwargs.pop('headers', None) or {})
+        token = None
+        if self.tokens is not None:
+            token = self.tokens.get()
+            headers['Authorization'] = 'Bearer {}'.format(token)
+
+        start = time.perf_counter()
+        status = None
+        try:
+            response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            status = response.status_code
+            return response, token
+        finally:
+            for hook in self.hooks:
+                hook(method, service, url, status, time.perf_counter() - start)
+
+    def request(self, method, service, path='', **kwargs):
+        """
+        Make a request, retrying with exponential backoff on connection errors,
+        timeouts and responses that indicate the service is busy. A rejected
+        token is replaced once when a new one can be requested.
+        """
+        return self._request_url(method, service, self.url(service, path), **kwargs)
+
+    def _request_url(self, method, service, url, **kwargs):
+        refreshed = False
+        attempt = 0
+        while True:
+            try:
+                response, token = self._send(method, service, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code == http.HTTPStatus.UNAUTHORIZED and not refreshed and self.tokens is not None \
+                        and self.tokens.invalidate(token):
+                    refreshed = True
+                    continue
+                retry = response.status_code in RETRY_STATUS_CODES or (
+                    response.status_code == http.HTTPStatus.INTERNAL_SERVER_ERROR and method.upper() in IDEMPOTENT_METHODS)
+                if not retry or attempt == self.retries:
+                    return response
+
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def get_json(self, service, path='', **kwargs):
+        response = self.request('GET', service, path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def paginate(self, service, path='', items_key=None, **kwargs):
+        """
+        Yield the items of a listing, following the rel="next" links of the
+        responses. items_key names the list within each response body, when the
+        body is not the list itself.
+        """
+        url = self.url(service, path)
+        while url is not None:
+            response = self._request_url('GET', service, url, **kwargs)
+            response.raise_for_status()
+
+            body = response.json()
+            yield from body[items_key] if items_key is not None else body
+
+            next_url = response.links.get('next', {}).get('url')
+            url = urllib.parse.urljoin(url, next_url) if next_url else None
+            # The query parameters of the next page are part of its link
+            kwargs.pop('params', None)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+#
+# MIT License
+#
+# (C) Copyright 2022 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Local stand-in for the CSM API gateway and the Aruba switch REST API, to run
+and benchmark the scripts in this repository without a live system.
+
+Emulated endpoints:
+  HSM      GET   /apis/smd/hsm/v2/State/Components?role=&subrole=&type=
+  BSS      GET   /apis/bss/boot/v1/bootparameters?name=...
+           PATCH /apis/bss/boot/v1/bootparameters
+  SLS      GET   /apis/sls/v1/dumpstate, /apis/sls/v1/hardware[/<xname>], /apis/sls/v1/networks[/<name>]
+           PUT   /apis/sls/v1/hardware/<xname>, /apis/sls/v1/networks/<name>
+  Keycloak POST  /keycloak/realms/shasta/protocol/openid-connect/token
+  Aruba          /rest/v10.04/login, logout, system, system/nae_scripts and
+                 /rest/v1/system/nae_scripts[/<name>/nae_agents]
+
+The switch of an Aruba request is taken from a /switches/<name> prefix, ex:
+/switches/sw-spine-001/rest/v10.04/system, or else from the Host header.
+GET /switches lists the emulated switches and GET /mock/stats the number of
+requests served per endpoint.
+
+    ./mock_api_gateway.py --port 8080 --storage-nodes 3 --latency 0.2 --error-rate 0.05 &
+    TOKEN=x python3 patch-ceph-runcmd.py --api_gateway_address http://localhost:8080
+"""
+
+import argparse
+import base64
+import collections
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CEPH_CLOUDINIT_SCRIPT = '/srv/cray/scripts/common/storage-ceph-cloudinit.sh'
+
+SWITCH_PREFIX_REGEX = re.compile(r'^/switches/([^/]+)(/.*)$')
+NAE_AGENTS_REGEX = re.compile(r'^/rest/v[0-9.]+/system/nae_scripts/([^/]+)/nae_agents$')
+NAE_SCRIPT_REGEX = re.compile(r'^/rest/v[0-9.]+/system/nae_scripts/([^/]+)$')
+
+
+def fake_jwt(lifetime):
+    """
+    An unsigned token with an exp claim, enough for clients that read it
+    """
+    def encode(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b'=').decode()
+    return '{}.{}.mock'.format(encode({'alg': 'none', 'typ': 'JWT'}),
+                                encode({'exp': int(time.time() + lifetime), 'sub': 'admin-client'}))
+
+
+class MockState:
+    """
+    The components, boot parameters, SLS state and switches served by the mock
+    """
+
+    def __init__(self, args):
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.components = {}
+        self.bootparameters = {}
+        self.hardware = {}
+        self.networks = {}
+        self.switches = {}
+        self.sessions = {}
+
+        ncns = [('Master', args.master_nodes), ('Worker', args.worker_nodes), ('Storage', args.storage_nodes)]
+        slot = 1
+        for subrole, count in ncns:
+            for i in range(1, count + 1):
+                hostname = 'ncn-{}{:03d}'.format(subrole[0].lower(), i)
+                self.add_node('x3000c0s{}b0n0'.format(slot), 'Management', subrole, 100000 + slot, hostname)
+                slot += 1
+
+        for i in range(args.compute_nodes):
+            xname = 'x{}c{}s{}b{}n{}'.format(1000 + i // 256, i // 32 % 8, i // 4 % 8, i // 2 % 2, i % 2)
+            self.add_node(xname, 'Compute', None, 1000 + i, 'nid{:06d}'.format(1000 + i))
+
+        for i in range(args.switches):
+            if i < 2:
+                alias, platform, hardware_type = 'sw-spine-{:03d}'.format(i + 1), '8325', 'comptype_hl_switch'
+            elif i % 2 == 0:
+                alias, platform, hardware_type = 'sw-leaf-{:03d}'.format(i // 2), '8325', 'comptype_hl_switch'
+            else:
+                alias, platform, hardware_type = 'sw-leaf-bmc-{:03d}'.format(i // 2 + 1), '6300', 'comptype_mgmt_switch'
+            self.add_switch(alias, platform, 'x3000c0h{}s1'.format(40 + i), hardware_type, '10.254.0.{}'.format(2 + i))
+
+        if args.sls_dump is not None:
+            with open(args.sls_dump) as f:
+                dump = json.load(f)
+            self.hardware = dump.get('Hardware', {})
+            self.networks = dump.get('Networks', {})
+
+        self.nae_ready_delay = args.nae_ready_delay
+        self.token_lifetime = args.token_lifetime
+
+    def add_node(self, xname, role, subrole, nid, hostname):
+        component = {'ID': xname, 'Type': 'Node', 'State': 'Ready', 'Flag': 'OK', 'Enabled': True,
+                     'Role': role, 'NID': nid, 'NetType': 'Sling', 'Arch': 'X86', 'Class': 'River'}
+        runcmd = ['/srv/cray/scripts/common/update_ca_certs.py']
+        if subrole is not None:
+            component['SubRole'] = subrole
+        if subrole == 'Storage':
+            runcmd.append(CEPH_CLOUDINIT_SCRIPT)
+        self.components[xname] = component
+
+        self.bootparameters[xname] = {
+            'hosts': [xname],
+            'params': 'console=ttyS0,115200 ip=dhcp quiet',
+            'kernel': 's3://boot-images/k8s/kernel',
+            'initrd': 's3://boot-images/k8s/initrd',
+            'cloud-init': {
+                'meta-data': {'instance-id': 'i-{:06d}'.format(nid)},
+                'user-data': {'hostname': hostname, 'local_hostname': hostname, 'runcmd': runcmd},
+            },
+        }
+
+        extra_properties = {'Role': role, 'NID': nid, 'Aliases': [hostname]}
+        if subrole is not None:
+            extra_properties['SubRole'] = subrole
+        self.hardware[xname] = {'Parent': xname.rsplit('n', 1)[0], 'Xname': xname, 'Type': 'comptype_node',
+                                'Class': 'River', 'TypeString': 'Node', 'ExtraProperties': extra_properties}
+
+    def add_switch(self, alias, platform, xname, hardware_type, ip):
+        self.switches[alias] = {
+            'platform_name': platform,
+            'hostname': alias,
+            'software_version': 'GL.10.08.1021' if platform == '8325' else 'FL.10.08.1021',
+            'nae_scripts': {},
+        }
+        self.hardware[xname] = {'Parent': xname.rsplit('s', 1)[0], 'Xname': xname, 'Type': hardware_type,
+                                'Class': 'River', 'TypeString': 'MgmtHLSwitch' if hardware_type == 'comptype_hl_switch' else 'MgmtSwitch',
+                                'ExtraProperties': {'IP4addr': ip, 'Brand': 'Aruba', 'Aliases': [alias]}}
+
+    def switch(self, name):
+        """
+        Switches that were not configured are created on first use
+        """
+        if name not in self.switches:
+            self.switches[name] = {'platform_name': '8325', 'hostname': name, 'software_version': 'GL.10.08.1021', 'nae_scripts': {}}
+        return self.switches[name]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def read_json(self):
+        body = self.read_body()
+        return json.loads(body) if body else None
+
+    def handle_request(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = url.path
+
+        switch_name = None
+        match = SWITCH_PREFIX_REGEX.match(path)
+        if match:
+            switch_name, path = match.groups()
+
+        # The body is read before failing so the connection can be reused
+        body = self.read_body() if method in ('POST', 'PUT', 'PATCH') else b''
+        state = self.server.state
+        route = re.sub(r'/(x[0-9][0-9a-z]*|sw-[a-z0-9-]+)(?=/|$)', '/{}', path)
+        route = re.sub(r'/nae_scripts/[^/]+', '/nae_scripts/{}', route)
+        with state.lock:
+            state.stats['{} {}'.format(method, route)] += 1
+
+        if self.server.latency or self.server.jitter:
+            time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+        if path != '/mock/stats' and random.random() < self.server.error_rate:
+            return self.send_json(503, {'title': 'Service Unavailable', 'detail': 'Injected error'})
+
+        try:
+            body = json.loads(body) if body and not path.endswith('/login') and not path.endswith('/token') else body
+        except ValueError:
+            return self.send_json(400, {'detail': 'Invalid JSON body'})
+
+        if path == '/mock/stats':
+            with state.lock:
+                return self.send_json(200, dict(state.stats))
+        if path == '/switches':
+            return self.send_json(200, sorted(state.switches))
+        if path.startswith('/keycloak/'):
+            return self.keycloak(method, path)
+        if path.startswith('/apis/'):
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                return self.send_json(401, {'detail': 'Missing bearer token'})
+            if path.startswith('/apis/smd/hsm/v2/'):
+                return self.hsm(method, path[len('/apis/smd/hsm/v2'):], query)
+            if path.startswith('/apis/bss/boot/v1/'):
+                return self.bss(method, path[len('/apis/bss/boot/v1'):], query, body)
+            if path.startswith('/apis/sls/v1/'):
+                return self.sls(method, path[len('/apis/sls/v1'):], body)
+        if path.startswith('/rest/'):
+            if switch_name is None:
+                switch_name = self.headers.get('Host', '').split(':')[0]
+            return self.aruba(method, path, switch_name, body)
+
+        return self.send_json(404, {'detail': 'Not found: {}'.format(path)})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_PATCH(self):
+        self.handle_request('PATCH')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def keycloak(self, method, path):
+        if method != 'POST' or not path.endswith('/protocol/openid-connect/token'):
+            return self.send_json(404, {'detail': 'Not found'})
+        lifetime = self.server.state.token_lifetime
+        return self.send_json(200, {'access_token': fake_jwt(lifetime), 'expires_in': lifetime, 'token_type': 'Bearer'})
+
+    def hsm(self, method, path, query):
+        if method != 'GET' or path != '/State/Components':
+            return self.send_json(404, {'detail': 'Not found'})
+
+        components = list(self.server.state.components.values())
+        for field, key in (('Role', 'role'), ('SubRole', 'subrole'), ('Type', 'type')):
+            if key in query:
+                values = {value.lower() for value in query[key]}
+                components = [component for component in components if str(component.get(field, '')).lower() in values]
+        return self.send_json(200, {'Components': components})
+
+    def bss(self, method, path, query, body):
+        if path != '/bootparameters':
+            return self.send_json(404, {'detail': 'Not found'})
+
+        state = self.server.state
+        with state.lock:
+            if method == 'GET':
+                # Older clients send the hosts in a JSON body
+                names = query.get('name')
+                if not names and isinstance(body, dict):
+                    names = body.get('hosts')
+                if not names:
+                    return self.send_json(200, list(state.bootparameters.values()))
+                return self.send_json(200, [state.bootparameters[name] for name in names if name in state.bootparameters])
+
+            if method in ('PATCH', 'PUT'):
+                if not isinstance(body, dict) or not body.get('hosts'):
+                    return self.send_json(400, {'detail': 'hosts is required'})
+                for host in body['hosts']:
+                    entry = state.bootparameters.setdefault(host, {'hosts': [host]})
+                    if method == 'PUT':
+                        entry.clear()
+                    entry.update(json.loads(json.dumps(body)))
+                    entry['hosts'] = [host]
+                return self.send_json(200)
+
+        return self.send_json(405, {'detail': 'Method not allowed'})
+
+    def sls(self, method, path, body):
+        state = self.server.state
+        with state.lock:
+            if path == '/dumpstate' and method == 'GET':
+                return self.send_json(200, {'Hardware': state.hardware, 'Networks': state.networks})
+
+            collection, _, name = path.strip('/').partition('/')
+            items = {'hardware': state.hardware, 'networks': state.networks}.get(collection)
+            if items is None:
+                return self.send_json(404, {'detail': 'Not found'})
+
+            if method == 'GET':
+                if not name:
+                    return self.send_json(200, list(items.values()))
+                if name not in items:
+                    return self.send_json(404, {'detail': '{} not found'.format(name)})
+                return self.send_json(200, items[name])
+
+            if method == 'PUT' and name:
+                created = name not in items
+                items[name] = body
+                return self.send_json(201 if created else 200, body)
+
+        return self.send_json(405, {'detail': 'Method not allowed'})
+
+    def aruba(self, method, path, switch_name, body):
+        state = self.server.state
+        with state.lock:
+            switch = state.switch(switch_name)
+
+            if path.endswith('/login') and method == 'POST':
+                credentials = urllib.parse.parse_qs(body.decode() if body else '')
+                password = self.server.switch_password
+                if password is not None and credentials.get('password', [None])[0] != password:
+                    return self.send_json(401, {'detail': 'Login failed'})
+                session_id = uuid.uuid4().hex
+                state.sessions[session_id] = switch_name
+                return self.send_json(200, headers={'Set-Cookie': 'id={}; Path=/; HttpOnly'.format(session_id)})
+
+            cookie = self.headers.get('Cookie', '')
+            session_id = dict(part.strip().split('=', 1) for part in cookie.split(';') if '=' in part).get('id')
+            if state.sessions.get(session_id) != switch_name:
+                return self.send_json(401, {'detail': 'Login required'})
+
+            if path.endswith('/logout') and method == 'POST':
+                del state.sessions[session_id]
+                return self.send_json(200)
+
+            if re.match(r'^/rest/v[0-9.]+/system$', path) and method == 'GET':
+                return self.send_json(200, {key: value for key, value in switch.items() if key != 'nae_scripts'})
+
+            scripts = switch['nae_scripts']
+            if re.match(r'^/rest/v[0-9.]+/system/nae_scripts$', path):
+                if method == 'GET':
+                    return self.send_json(200, {name: '/rest/v10.04/system/nae_scripts/{}'.format(name) for name in scripts})
+                if method == 'POST':
+                    if not isinstance(body, dict) or 'name' not in body:
+                        return self.send_json(400, {'detail': 'name is required'})
+                    if body['name'] in scripts:
+                        return self.send_json(400, {'detail': 'Script already exists'})
+                    # Scripts are validated in the background before agents can be created
+                    scripts[body['name']] = {'name': body['name'], 'ready_at': time.time() + state.nae_ready_delay, 'agents': {}}
+                    return self.send_json(201)
+
+            match = NAE_SCRIPT_REGEX.match(path)
+            if match and method == 'GET':
+                script = scripts.get(match.group(1))
+                if script is None:
+                    return self.send_json(404, {'detail': 'Script not found'})
+                status = 'valid' if time.time() >= script['ready_at'] else 'validating'
+                return self.send_json(200, {'name': script['name'], 'status': status})
+
+            match = NAE_AGENTS_REGEX.match(path)
+            if match:
+                script = scripts.get(match.group(1))
+                if script is None:
+                    return self.send_json(404, {'detail': 'Script not found'})
+                if method == 'GET':
+                    return self.send_json(200, {name: '{}/{}'.format(path, name) for name in script['agents']})
+                if method == 'POST':
+                    if time.time() < script['ready_at']:
+                        return self.send_json(503, {'detail': 'Script is still being validated'})
+                    if not isinstance(body, dict) or 'name' not in body:
+                        return self.send_json(400, {'detail': 'name is required'})
+                    if body['name'] in script['agents']:
+                        return self.send_json(409, {'detail': 'Agent already exists'})
+                    script['agents'][body['name']] = body
+                    return self.send_json(201)
+
+        return self.send_json(404, {'detail': 'Not found'})
+
+
+parser = argparse.ArgumentParser(description='Local mock of the CSM API gateway and Aruba switch REST API.')
+parser.add_argument('--host', action='store', default='127.0.0.1', help='Address to listen on.')
+parser.add_argument('--port', action='store', type=int, default=8080, help='Port to listen on.')
+parser.add_argument('--master-nodes', action='store', type=int, default=3, help='Number of master NCNs.')
+parser.add_argument('--worker-nodes', action='store', type=int, default=3, help='Number of worker NCNs.')
+parser.add_argument('--storage-nodes', action='store', type=int, default=3, help='Number of storage NCNs.')
+parser.add_argument('--compute-nodes', action='store', type=int, default=16, help='Number of compute nodes.')
+parser.add_argument('--switches', action='store', type=int, default=4, help='Number of Aruba switches.')
+parser.add_argument('--sls-dump', action='store', help='Serve this SLS dump instead of one built from the nodes and switches.')
+parser.add_argument('--latency', action='store', type=float, default=0, help='Seconds added to every response.')
+parser.add_argument('--jitter', action='store', type=float, default=0, help='Up to this many random seconds added to every response.')
+parser.add_argument('--error-rate', action='store', type=float, default=0, help='Fraction of requests answered with HTTP 503, ex: 0.05.')
+parser.add_argument('--nae-ready-delay', action='store', type=float, default=2,
+                    help='Seconds before an uploaded NAE script is validated and accepts agents.')
+parser.add_argument('--switch-password', action='store', help='Password the switches accept, any password when not given.')
+parser.add_argument('--token-lifetime', action='store', type=int, default=300, help='Lifetime in seconds of issued tokens.')
+parser.add_argument('--seed', action='store', type=int, help='Seed for the injected latency and errors.')
+parser.add_argument('--verbose', action='store_true', help='Log every request.')
+
+args = parser.parse_args()
+
+if args.seed is not None:
+    random.seed(args.seed)
+
+server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+server.daemon_threads = True
+server.state = MockState(args)
+server.latency = args.latency
+server.jitter = args.jitter
+server.error_rate = args.error_rate
+server.switch_password = args.switch_password
+server.verbose = args.verbose
+
+print('Mock API gateway listening on http://{}:{}'.format(args.host, server.server_address[1]), flush=True)
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
@@ -23,12 +23,34 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 import argparse
-import json
 import re
-import netaddr
-
-CDU_MGMT_SWITCH_XNAME_REGEX="^d([0-9]+)w([0-9]+)$"
-MGMT_HL_SWITCH_XNAME_REGEX="^x([0-9]{1,4})c([0-7])h([1-9][0-9]*)s([1-9])$"
+from sls_allocators import AllocationError, IPAllocator
+from sls_io import write_sls_delta
+from sls_metrics import Metrics, add_metrics_arguments
+from sls_validate import check_sls_changes, validate_sls_model
+from sls_workspace import add_workspace_argument, load_model, run_in_workspace, save_model
+from sls_xname import parent_xname, parse_xname, xname_letters
+
+def cdu_switch_type(xname):
+    '''
+    Hardware type of a CDU switch xname. Either a CDU switch within a CDU, ex:
+    d1w1, or within a River cabinet, ex: x3000c0h12s1. Returns None for any
+    other xname.
+    '''
+    key = parse_xname(xname)
+    if key == None:
+        return None
+
+    letters = xname_letters(key)
+    if letters == "dw":
+        return "comptype_cdu_mgmt_switch"
+
+    if letters == "xchs":
+        _, cabinet, _, chassis, _, slot, _, space = key
+        if cabinet <= 9999 and chassis <= 7 and slot >= 1 and 1 <= space <= 9:
+            return "comptype_hl_switch"
+
+    return None
 
 def find_subnet(sls_network, name):
     network_hardware_subnet = None
@@ -39,130 +61,153 @@ def find_subnet(sls_network, name):
     
     return  network_hardware_subnet
 
-def find_next_available_ip(sls_subnet):
-    subnet = netaddr.IPNetwork(sls_subnet["CIDR"])
-
-    existing_ip_reservations = netaddr.IPSet()
-    existing_ip_reservations.add(sls_subnet["Gateway"])
-    for ip_reservation in sls_subnet["IPReservations"]:
-        print("  Found existing IP reservation {} with IP {}".format(ip_reservation["Name"], ip_reservation["IPAddress"]))
-        existing_ip_reservations.add(ip_reservation["IPAddress"])
-
-    for available_ip in list(subnet[1:-2]):
-        if available_ip not in existing_ip_reservations:
-            print("  {} Available for use.".format(available_ip))
-            return available_ip
-
-def add_cdu_ip_reservation(sls_network, xname, alias):
+def add_cdu_ip_reservations(model, sls_network, cdu_switches):
     sls_subnet = find_subnet(sls_network, "network_hardware")
     if sls_subnet == None:
-        print("Error: Unable to find network_hardware subnet in {} network!".format(network_name))
+        print("Error: Unable to find network_hardware subnet in {} network!".format(sls_network["Name"]))
         exit(1)
 
-    print("Selecting IP Reservation for {} CDU Switch in {}'s network_hardware subnet".format(xname, sls_network["Name"]))
-
-    ip = find_next_available_ip(sls_subnet)
-    ip_reservation = {
-        "Name": alias,
-        "IPAddress": str(ip),
-        "Comment": xname
-    }
+    ips = {}
+    allocator = None
+    for xname, alias in cdu_switches:
+        print("Selecting IP Reservation for {} CDU Switch in {}'s network_hardware subnet".format(xname, sls_network["Name"]))
+
+        # The allocator is built once per subnet and shared by all of the switches being added
+        if allocator is None:
+            allocator = IPAllocator.from_sls_subnet(sls_subnet, verbose=True)
+
+        try:
+            ip = allocator.allocate()
+        except AllocationError as err:
+            print("Error: {} in {}'s network_hardware subnet!".format(err, sls_network["Name"]))
+            exit(1)
+        print("  {} Available for use.".format(ip))
+
+        ip_reservation = {
+            "Name": alias,
+            "IPAddress": str(ip),
+            "Comment": xname
+        }
 
-    sls_subnet["IPReservations"].append(ip_reservation)
+        sls_subnet["IPReservations"].append(ip_reservation)
+        model.mark_network_changed(sls_network["Name"])
+        ips[xname] = ip
+
+    return ips
+
+def build_cdu_switch(xname, brand, alias):
+    if cdu_switch_type(xname) == "comptype_cdu_mgmt_switch":
+        # CDU Switch located within a CDU
+        return {
+            "Parent": parent_xname(xname),
+            "Xname": xname,
+            "Type": "comptype_cdu_mgmt_switch",
+            "Class": "Mountain",
+            "TypeString": "CDUMgmtSwitch",
+            "ExtraProperties": {
+                "Brand": brand,
+                "Aliases": [alias]
+            }
+        }
 
-    return ip
+    # CDU Switch located within a River cabinet
+    return {
+        "Parent": parent_xname(xname),
+        "Xname": xname,
+        "Type": "comptype_hl_switch",
+        "Class": "River",
+        "TypeString": "MgmtHLSwitch",
+        "ExtraProperties": {
+            "Brand": brand,
+            "Aliases": [alias]
+        }
+    }
 
 
 # Parse CLI Arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("sls_state_file", type=str, help="SLS State file to modify")
-parser.add_argument("--cdu-switch", type=str, required=True, help="CDU Switch xname to add, ex: d1w1")
-parser.add_argument("--brand", type=str, required=True, help="Switch brand", choices={"Dell", "Aruba"})
-parser.add_argument("--alias", type=str, required=True, help="CDU Switch alias, ex: sw-cdu-003")
+parser.add_argument("--cdu-switch", type=str, required=True, action="append", help="CDU Switch xname to add, ex: d1w1. Can be repeated to add multiple switches")
+parser.add_argument("--brand", type=str, required=True, action="append", help="Switch brand. Either given once for all switches or once per switch", choices={"Dell", "Aruba"})
+parser.add_argument("--alias", type=str, required=True, action="append", help="CDU Switch alias, ex: sw-cdu-003. Given once per switch")
+parser.add_argument("--delta-file", type=str, help="Also write the added and changed SLS objects as a JSON Patch style changeset to this file, to be applied with apply_sls_delta.py")
+parser.add_argument("--compact", action="store_true", help="Write the updated SLS state without indentation")
+add_workspace_argument(parser)
+add_metrics_arguments(parser)
 args = parser.parse_args()
 
-if re.match(CDU_MGMT_SWITCH_XNAME_REGEX, args.cdu_switch) == None and re.match(MGMT_HL_SWITCH_XNAME_REGEX, args.cdu_switch) == None:
-    print("Invalid CDU Switch xname provided: ", args.cdu_switch)
+if args.workspace is not None:
+    exit(run_in_workspace(args.workspace, "add_cdu_switch.py"))
+
+metrics = Metrics.from_args("add_cdu_switch", args)
+
+if len(args.alias) != len(args.cdu_switch):
+    print("Error: Expected {} aliases, one for each CDU Switch, but {} were given".format(len(args.cdu_switch), len(args.alias)))
     exit(1)
 
-if re.match("^sw-cdu-[0-9][0-9][0-9]$", args.alias) == None:
-    print("Invalid CDU Switch alias: ", args.alias)
+if len(args.brand) == 1:
+    args.brand = args.brand * len(args.cdu_switch)
+elif len(args.brand) != len(args.cdu_switch):
+    print("Error: Expected 1 or {} brands but {} were given".format(len(args.cdu_switch), len(args.brand)))
     exit(1)
 
+for cdu_switch_xname in args.cdu_switch:
+    if cdu_switch_type(cdu_switch_xname) == None:
+        print("Invalid CDU Switch xname provided: ", cdu_switch_xname)
+        exit(1)
+
+for alias in args.alias:
+    if re.match("^sw-cdu-[0-9][0-9][0-9]$", alias) == None:
+        print("Invalid CDU Switch alias: ", alias)
+        exit(1)
+
 print("========================")
 print("Configuration")
 print("========================")
 print("SLS State File:", args.sls_state_file)
-print("CDU Switch:    ", args.cdu_switch)
-print("Brand:         ", args.brand)
-print("Alias:         ", args.alias)
+print("CDU Switch:    ", ", ".join(args.cdu_switch))
+print("Brand:         ", ", ".join(args.brand))
+print("Alias:         ", ", ".join(args.alias))
 print()
 
+metrics.begin("load")
 # Load in existing SLS State
-sls_state = None
-with open(args.sls_state_file) as f:
-    sls_state = json.load(f)
-
-allHardware = sls_state["Hardware"]
-allNetworks = sls_state["Networks"]
+model = load_model(args.sls_state_file)
+baseline = validate_sls_model(model)
+allHardware = model.hardware
+allNetworks = model.networks
 
+metrics.begin("hardware")
 #
 # Hardware
 #
-cdu_switch = None
-if re.match(CDU_MGMT_SWITCH_XNAME_REGEX, args.cdu_switch) != None:
-    # CDU Switch located within a CDU
-    cdu_switch = {
-        "Parent": re.compile("w([0-9]+)$").sub("", args.cdu_switch),
-        "Xname": args.cdu_switch,
-        "Type": "comptype_cdu_mgmt_switch",
-        "Class": "Mountain",
-        "TypeString": "CDUMgmtSwitch",
-        "ExtraProperties": {
-            "Brand": args.brand,
-            "Aliases": [args.alias]
-        }
-    }
-else:
-    # CDU Switch located within a River cabinet
-    cdu_switch = {
-        "Parent": re.compile("s([1-9])$").sub("", args.cdu_switch),
-        "Xname": args.cdu_switch,
-        "Type": "comptype_hl_switch",
-        "Class": "River",
-        "TypeString": "MgmtHLSwitch",
-        "ExtraProperties": {
-            "Brand": args.brand,
-            "Aliases": [args.alias]
-        }
-    }
-
-# Verify the CDU switch has a unique xname
-if args.cdu_switch in allHardware:
-    print("Error {} already exists in {}!".format(args.cdu_switch, args.sls_state_file))
-    exit(1)
 
-# Verify the CDU switch has a unique alias
-for xname in allHardware:
-    hardware = allHardware[xname]
-
-    if hardware["Type"] != "comptype_cdu_mgmt_switch" and hardware["Type"] != "comptype_hl_switch":
-        continue
-    
+# Verify the existing CDU switches have aliases
+for hardware in model.hardware_of_type("comptype_cdu_mgmt_switch", "comptype_hl_switch"):
     if "ExtraProperties" not in hardware:
         continue
-    
+
     if "Aliases" not in hardware["ExtraProperties"]:
-        print("Error {} is missing Alias extra property!".format(xname))
+        print("Error {} is missing Alias extra property!".format(hardware["Xname"]))
         exit(1)
 
-    if args.alias in hardware["ExtraProperties"]["Aliases"]:
-        print("Error {} already has alias {}!".format(xname, args.alias))
+for cdu_switch_xname, brand, alias in zip(args.cdu_switch, args.brand, args.alias):
+    cdu_switch = build_cdu_switch(cdu_switch_xname, brand, alias)
+
+    # Verify the CDU switch has a unique xname
+    if cdu_switch_xname in allHardware:
+        print("Error {} already exists in {}!".format(cdu_switch_xname, args.sls_state_file))
         exit(1)
 
+    # Verify the CDU switch has a unique alias
+    for xname in model.alias_owners(alias):
+        if allHardware[xname]["Type"] in ("comptype_cdu_mgmt_switch", "comptype_hl_switch"):
+            print("Error {} already has alias {}!".format(xname, alias))
+            exit(1)
 
-allHardware[args.cdu_switch] = cdu_switch
+    model.add_hardware(cdu_switch)
 
+metrics.begin("networks")
 #
 # Networks
 #
@@ -174,19 +219,28 @@ network_names = ["HMN", "NMN", "MTL"]
 if "CMN" in allNetworks:
     network_names.append("CMN")
 
+cdu_switches = list(zip(args.cdu_switch, args.alias))
 ips = {}
 for network_name in network_names:
-    ips[network_name] = add_cdu_ip_reservation(allNetworks[network_name], args.cdu_switch, args.alias)
-
-print()
-print("HMN IP: {}".format(ips["HMN"]))
-print("NMN IP: {}".format(ips["NMN"]))
-print("MTL IP: {}".format(ips["MTL"]))
-if "CMN" in ips:
-    print("CMN IP: {}".format(ips["CMN"]))
+    ips[network_name] = add_cdu_ip_reservations(model, allNetworks[network_name], cdu_switches)
+
+for cdu_switch_xname in args.cdu_switch:
+    print()
+    if len(args.cdu_switch) > 1:
+        print("{}:".format(cdu_switch_xname))
+    for network_name in network_names:
+        print("{} IP: {}".format(network_name, ips[network_name][cdu_switch_xname]))
 print()
 
+metrics.begin("validate")
+# Verify the changes did not introduce any conflicts before anything is written
+if not check_sls_changes(model, baseline):
+    exit(1)
+
+metrics.begin("write")
 # Write out the updated SLS dump
-print("Writing updated SLS state to", args.sls_state_file)
-with open(args.sls_state_file, "w") as f:
-    json.dump(sls_state, f, indent=2)
+save_model(model, args.sls_state_file, compact=args.compact)
+
+if args.delta_file is not None:
+    print("Writing SLS changes to", args.delta_file)
+    write_sls_delta(args.delta_file, model.build_delta())
@@ -23,27 +23,14 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 import argparse
+import csv
 import json
-import re
-import netaddr
-
-def find_next_available_subnet(sls_network):
-    name = sls_network["Name"]
-    network_subnet = netaddr.IPNetwork(sls_network["ExtraProperties"]["CIDR"])
-
-    existing_subnets = netaddr.IPSet()
-    for sls_subnet in sls_network["ExtraProperties"]["Subnets"]:
-        subnet_name = sls_subnet["Name"]
-        subnet_cidr = sls_subnet["CIDR"]
-        print("  Found existing subnet {} with CIDR {}".format(subnet_name, subnet_cidr))
-        existing_subnets.add(subnet_cidr)
-
-    for available_subnet in list(network_subnet.subnet(22)):
-        if available_subnet not in existing_subnets:
-            print("  {} Available for use.".format(available_subnet))
-            return available_subnet
-
-    return None
+from sls_allocators import MAX_VLAN, MIN_VLAN, AllocationError, NIDAllocator, SubnetAllocator, VLANAllocator
+from sls_io import write_sls_delta
+from sls_metrics import Metrics, add_metrics_arguments
+from sls_validate import check_sls_changes, validate_sls_model
+from sls_workspace import add_workspace_argument, load_model, run_in_workspace, save_model
+from sls_xname import parse_xname, xname_letters
 
 def build_network(name, full_name, cidr, vlan_range):
     return {
@@ -61,9 +48,21 @@ def build_network(name, full_name, cidr, vlan_range):
         }
     }
 
-def add_cabinet_subnet(sls_network, cabinet_xname, vlan):
+def add_cabinet_subnet(model, sls_network, subnet_allocators, cabinet_xname, vlan, prefixlen):
     print("Selecting subnet for {} cabinet in {} network".format(cabinet_xname, sls_network["Name"]))
-    cabinet_subnet = find_next_available_subnet(sls_network)
+
+    # The allocator is built once per network and shared by all of the cabinets being added
+    allocator = subnet_allocators.get(sls_network["Name"])
+    if allocator is None:
+        allocator = SubnetAllocator.from_sls_network(sls_network, verbose=True)
+        subnet_allocators[sls_network["Name"]] = allocator
+
+    try:
+        cabinet_subnet = allocator.allocate(prefixlen)
+    except AllocationError as err:
+        print("Error: {}!".format(err))
+        exit(1)
+    print("  {} Available for use.".format(cabinet_subnet))
 
     sls_subnet = {
         # TODO Figure out preferred order of keys
@@ -77,6 +76,7 @@ def add_cabinet_subnet(sls_network, cabinet_xname, vlan):
     }
 
     sls_network["ExtraProperties"]["Subnets"].append(sls_subnet)
+    model.mark_network_changed(sls_network["Name"])
 
     return sls_subnet
 
@@ -86,214 +86,423 @@ HILL_TDS_CHASSIS_LIST = ["c1", "c3"]
 DEFAULT_HMN_MTN_CIDR="10.104.0.0/17"
 DEFAULT_NMN_MTN_CIDR="10.100.0.0/17"
 
-# Parse CLI Arguments
-parser = argparse.ArgumentParser()
-parser.add_argument("sls_state_file", type=str, help="SLS State file to modify")
-parser.add_argument("--cabinet", type=str, required=True, help="Cabinet xname to add, ex: x1000")
-parser.add_argument("--cabinet-type", type=str, required=True, help="Cabinet type", choices={"Hill", "Mountain"})
-parser.add_argument("--cabinet-vlan-hmn", type=int, required=True, help="Hardware Management Network (HMN) VLAN ID configured on the CEC, ex: 1000")
-parser.add_argument("--cabinet-vlan-nmn", type=int, required=True, help="Cabinet NMN vlan add, ex: 2000")
-parser.add_argument("--starting-nid", type=int, required=True, help="Starting NID for new cabinet, ex: 1000")
-args = parser.parse_args()
-
-if re.match("^x([0-9]{1,4})$", args.cabinet) == None:
-    print("Invalid cabinet xname provided: ", args.cabinet)
-    exit(1)
-
-chassis_list = MOUNTAIN_CHASSIS_LIST
-if args.cabinet_type == "Hill":
-    chassis_list = MOUNTAIN_CHASSIS_LIST
-
-print("========================")
-print("Configuration")
-print("========================")
-print("SLS State File:   ", args.sls_state_file)
-print("Starting NID:     ", args.starting_nid)
-print("Cabinet:          ", args.cabinet)
-print("Cabinet Type:     ", args.cabinet_type)
-print("Cabinet VLAN HMN: ", args.cabinet_vlan_hmn)
-print("Cabinet VLAN NMN: ", args.cabinet_vlan_nmn)
-print()
-
-# Load in existing SLS State
-sls_state = None
-with open(args.sls_state_file) as f:
-    sls_state = json.load(f)
+DEFAULT_CABINET_SUBNET_PREFIX_LENGTH=22
+
+BATCH_FIELDS = ["cabinet", "cabinet_type", "cabinet_vlan_hmn", "cabinet_vlan_nmn", "starting_nid"]
+
+# Fields that are allocated automatically when left out
+OPTIONAL_BATCH_FIELDS = ["cabinet_vlan_hmn", "cabinet_vlan_nmn", "starting_nid"]
+
+def load_batch_file(path):
+    '''
+    Read the list of cabinets to add from a CSV file with a header row, or a
+    YAML/JSON file containing a list of objects. Both use the same field names
+    as the command line flags, ex: cabinet, cabinet_type, cabinet_vlan_hmn,
+    cabinet_vlan_nmn, starting_nid. The VLAN and starting_nid fields may be left
+    empty to allocate them automatically.
+    '''
+    with open(path) as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif path.endswith(".json"):
+            rows = json.load(f)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                print("Error: The PyYAML module is required to read", path)
+                exit(1)
+            rows = yaml.safe_load(f)
+
+    if not isinstance(rows, list):
+        print("Error: Expected a list of cabinets in", path)
+        exit(1)
 
-allHardware = sls_state["Hardware"]
-allNetworks = sls_state["Networks"]
+    cabinets = []
+    for i, row in enumerate(rows, start=1):
+        missing = [field for field in BATCH_FIELDS if field not in OPTIONAL_BATCH_FIELDS and row.get(field) in (None, "")]
+        if missing:
+            print("Error: Cabinet {} in {} is missing {}".format(i, path, ", ".join(missing)))
+            exit(1)
+
+        try:
+            cabinet = {
+                "cabinet": str(row["cabinet"]).strip(),
+                "cabinet_type": str(row["cabinet_type"]).strip(),
+            }
+            for field in OPTIONAL_BATCH_FIELDS:
+                cabinet[field] = int(row[field]) if row.get(field) not in (None, "") else None
+            for field in ("cabinet_vlan_hmn", "cabinet_vlan_nmn"):
+                if cabinet[field] is not None:
+                    vlan_id(cabinet[field])
+            cabinets.append(cabinet)
+        except (ValueError, argparse.ArgumentTypeError) as err:
+            print("Error: Cabinet {} in {} has an invalid value: {}".format(i, path, err))
+            exit(1)
+
+    return cabinets
+
+def vlan_id(value):
+    '''
+    Parse a cabinet VLAN ID, rejecting the reserved VLANs 0 and 4095 and
+    anything outside of them.
+    '''
+    vlan = int(value)
+    if not MIN_VLAN <= vlan <= MAX_VLAN:
+        raise argparse.ArgumentTypeError("VLAN {} is outside of the valid range {}-{}".format(vlan, MIN_VLAN, MAX_VLAN))
+    return vlan
+
+def validate_cabinet(cabinet):
+    key = parse_xname(cabinet["cabinet"])
+    if key == None or xname_letters(key) != "x" or key[1] > 9999:
+        print("Invalid cabinet xname provided: ", cabinet["cabinet"])
+        exit(1)
 
-#
-# Hardware
-#
+    if cabinet["cabinet_type"] not in ("Hill", "Mountain"):
+        print("Invalid cabinet type provided for {}: {}".format(cabinet["cabinet"], cabinet["cabinet_type"]))
+        exit(1)
 
-# Add Hardware required for Hill or Mountain Cabinet
-#   If this pieces of hardware already exists, stop!
-#
-# Cabinet
-# ChassisBMC
-# Node
-
-hardwareToAdd = []
-
-cabinet = {
-    "Parent": "s0",
-    "Xname": args.cabinet,
-    "Class": args.cabinet_type,
-    "Type": "comptype_cabinet",
-    "TypeString": "Cabinet",
-    "ExtraProperties": {
-        "Networks": { # This networks block is only presnet for MEDS compatability
-            "cn": {
-                "HMN": {},
-                "NMN": {},
-            }
-        }
-    }
-}
-
-hardwareToAdd.append(cabinet)
-
-currentNID = args.starting_nid
-for chassis in chassis_list:
-    # Start with the CMM
-    chassisXname = "{}{}".format(args.cabinet, chassis)
-    chassisBMCXname = "{}b0".format(chassisXname)
-    
-    # ChassisBMC SLS Object
-    chassisBMC = {
-        "Parent": chassisXname,
-        "Xname": chassisBMCXname,
-        "Type": "comptype_chassis_bmc",
-        "TypeString": "ChassisBMC",
-        "Class": args.cabinet_type,
-    }
-    hardwareToAdd.append(chassisBMC)
-
-    # Chassis SLS Object
-    chassis = {
-        "Parent": args.cabinet,
-        "Xname": chassisXname,
-        "Type": "comptype_chassis",
-        "TypeString": "Chassis",
-        "Class": args.cabinet_type,
-    }
-    hardwareToAdd.append(chassis)
-
-    for slot in range(8):
-        for bmc in range(2):
-            nodeBMCXname = "{}s{}b{}".format(chassisXname, slot, bmc)
-            for node in range(2):
-                nodeXname = "{}n{}".format(nodeBMCXname, node)
-
-                node = {
-                    "Parent": nodeBMCXname,
-                    "Xname": nodeXname,
-                    "Type": "comptype_node",
-                    "TypeString": "Node",
-                    "Class": args.cabinet_type,
-                    "ExtraProperties": {
-                        "NID": currentNID,
-                        "Role": "Compute",
-                        "Aliases": ["nid%06d" % currentNID]
+class HardwareRecord:
+    '''
+    Compact representation of a piece of cabinet hardware. Records are only
+    turned into SLS hardware objects once the whole cabinet has been checked
+    for conflicts.
+    '''
+    __slots__ = ("parent", "xname", "type", "type_string", "hw_class", "nid")
+
+    def __init__(self, parent, xname, hw_type, type_string, hw_class, nid=None):
+        self.parent = parent
+        self.xname = xname
+        self.type = hw_type
+        self.type_string = type_string
+        self.hw_class = hw_class
+        self.nid = nid
+
+    def to_sls(self):
+        if self.type == "comptype_cabinet":
+            return {
+                "Parent": self.parent,
+                "Xname": self.xname,
+                "Class": self.hw_class,
+                "Type": self.type,
+                "TypeString": self.type_string,
+                "ExtraProperties": {
+                    "Networks": { # This networks block is only presnet for MEDS compatability
+                        "cn": {
+                            "HMN": {},
+                            "NMN": {},
+                        }
                     }
                 }
-                hardwareToAdd.append(node)
+            }
 
-                currentNID += 1
+        hardware = {
+            "Parent": self.parent,
+            "Xname": self.xname,
+            "Type": self.type,
+            "TypeString": self.type_string,
+            "Class": self.hw_class,
+        }
 
-for hardware in hardwareToAdd:
-    xname = hardware["Xname"] 
-    if xname in allHardware:
-        print("Error {} already exists in {}!".format(xname, args.sls_state_file))
-        exit(1)
+        if self.nid is not None:
+            hardware["ExtraProperties"] = {
+                "NID": self.nid,
+                "Role": "Compute",
+                "Aliases": ["nid%06d" % self.nid]
+            }
 
-    allHardware[xname] = hardware
+        return hardware
 
-# Verify no duplicate NIDs
-foundDuplicateNIDs = False
-nidSet = set()
-for xname in allHardware:
-    hardware = allHardware[xname]
+def generate_cabinet_hardware(cabinet_xname, cabinet_type, starting_nid):
+    '''
+    Lazily generate the hardware records for a Hill or Mountain cabinet
+    '''
+    chassis_list = MOUNTAIN_CHASSIS_LIST
+    if cabinet_type == "Hill":
+        chassis_list = MOUNTAIN_CHASSIS_LIST
+
+    # Add Hardware required for Hill or Mountain Cabinet
+    #   If this pieces of hardware already exists, stop!
+    #
+    # Cabinet
+    # ChassisBMC
+    # Node
+
+    yield HardwareRecord("s0", cabinet_xname, "comptype_cabinet", "Cabinet", cabinet_type)
+
+    currentNID = starting_nid
+    for chassis in chassis_list:
+        # Start with the CMM
+        chassisXname = "{}{}".format(cabinet_xname, chassis)
+        chassisBMCXname = "{}b0".format(chassisXname)
+
+        # ChassisBMC SLS Object
+        yield HardwareRecord(chassisXname, chassisBMCXname, "comptype_chassis_bmc", "ChassisBMC", cabinet_type)
+
+        # Chassis SLS Object
+        yield HardwareRecord(cabinet_xname, chassisXname, "comptype_chassis", "Chassis", cabinet_type)
+
+        for slot in range(8):
+            for bmc in range(2):
+                nodeBMCXname = "{}s{}b{}".format(chassisXname, slot, bmc)
+                for node in range(2):
+                    nodeXname = "{}n{}".format(nodeBMCXname, node)
+                    yield HardwareRecord(nodeBMCXname, nodeXname, "comptype_node", "Node", cabinet_type, currentNID)
+
+                    currentNID += 1
+
+def cabinet_node_count(cabinet_type):
+    return sum(1 for record in generate_cabinet_hardware("x0", cabinet_type, 0) if record.nid is not None)
+
+def allocate_cabinet_nids(model, cabinets, align):
+    '''
+    Pick the starting NID of every cabinet that was not given one. The lowest
+    free block of NIDs is used, after the NIDs of the existing hardware and of
+    the cabinets with an explicit starting NID.
+    '''
+    allocator = NIDAllocator.from_sls_model(model)
+    for cabinet in cabinets:
+        if cabinet["starting_nid"] is not None:
+            allocator.reserve_range(cabinet["starting_nid"], cabinet_node_count(cabinet["cabinet_type"]))
+
+    for cabinet in cabinets:
+        if cabinet["starting_nid"] is not None:
+            continue
+
+        count = cabinet_node_count(cabinet["cabinet_type"])
+        try:
+            cabinet["starting_nid"] = allocator.allocate(count, count if align else 1)
+        except AllocationError as err:
+            print("Error: {} for {}!".format(err, cabinet["cabinet"]))
+            exit(1)
+        print("Allocated NIDs {}-{} for {}".format(cabinet["starting_nid"], cabinet["starting_nid"] + count - 1, cabinet["cabinet"]))
+
+def allocate_cabinet_vlans(cabinets, vlan_allocator):
+    '''
+    Pick the HMN and NMN VLANs of every cabinet that was not given them. The
+    VLANs given explicitly are reserved first, so they are never handed out to
+    another cabinet in the same batch.
+    '''
+    foundDuplicateVlans = False
+    for cabinet in cabinets:
+        subnet_name = cabinet["cabinet"].replace("x", "cabinet_")
+        for network, field in [("HMN_MTN", "cabinet_vlan_hmn"), ("NMN_MTN", "cabinet_vlan_nmn")]:
+            vlan = cabinet[field]
+            if vlan is not None and not vlan_allocator.reserve(vlan):
+                foundDuplicateVlans = True
+                print("Error found duplicate VLAN {} with subnet {} in {}".format(vlan, subnet_name, network))
+    if foundDuplicateVlans:
+        exit(1)
 
-    if hardware["Type"] != "comptype_node" or "ExtraProperties" not in hardware:
-        continue
+    for cabinet in cabinets:
+        for network, field in [("HMN_MTN", "cabinet_vlan_hmn"), ("NMN_MTN", "cabinet_vlan_nmn")]:
+            if cabinet[field] is not None:
+                continue
+
+            try:
+                cabinet[field] = vlan_allocator.allocate(network)
+            except AllocationError as err:
+                print("Error: {} for {}!".format(err, cabinet["cabinet"]))
+                exit(1)
+            print("Allocated {} VLAN {} for {}".format(network, cabinet[field], cabinet["cabinet"]))
+
+def add_cabinet(model, cabinet, subnet_allocators, sls_state_file, prefixlen):
+    '''
+    Add a cabinet and its HMN_MTN/NMN_MTN subnets to the SLS model. Every check is
+    made against the indexes of the model, which already contain any cabinets
+    added earlier in the same run.
+    '''
+    allHardware = model.hardware
+    allNetworks = model.networks
+
+    #
+    # Hardware
+    #
+    # Records are checked against the model indexes as they are generated, so the
+    # first conflict stops the cabinet before the rest of its hardware is built
+    hardwareToAdd = []
+    currentNID = cabinet["starting_nid"]
+    for record in generate_cabinet_hardware(cabinet["cabinet"], cabinet["cabinet_type"], cabinet["starting_nid"]):
+        if record.xname in allHardware:
+            print("Error {} already exists in {}!".format(record.xname, sls_state_file))
+            exit(1)
+
+        # Verify no duplicate NIDs, only the new nodes need to be checked against
+        # the NID index of the existing hardware
+        if record.nid is not None:
+            for xname in model.nid_owners(record.nid):
+                if allHardware[xname].get("ExtraProperties", {}).get("Role") == "Compute":
+                    print("Error found duplicate NID {}".format(record.nid))
+                    exit(1)
+
+            currentNID = record.nid + 1
+
+        hardwareToAdd.append(record)
+
+    for record in hardwareToAdd:
+        model.add_hardware(record.to_sls())
+
+    #
+    # Networks
+    #
+    print("========================")
+    print("Network Configuration")
+    print("========================")
+
+    hmn_subnet = add_cabinet_subnet(model, allNetworks["HMN_MTN"], subnet_allocators, cabinet["cabinet"], cabinet["cabinet_vlan_hmn"], prefixlen)
+    nmn_subnet = add_cabinet_subnet(model, allNetworks["NMN_MTN"], subnet_allocators, cabinet["cabinet"], cabinet["cabinet_vlan_nmn"], prefixlen)
+
+    cabinet_networks = allHardware[cabinet["cabinet"]]["ExtraProperties"]["Networks"]["cn"]
+    cabinet_networks["HMN"]["CIDR"] = hmn_subnet["CIDR"]
+    cabinet_networks["HMN"]["Gateway"] = hmn_subnet["Gateway"]
+    cabinet_networks["HMN"]["VLan"] = hmn_subnet["VlanID"]
+
+    cabinet_networks["NMN"]["CIDR"] = nmn_subnet["CIDR"]
+    cabinet_networks["NMN"]["Gateway"] = nmn_subnet["Gateway"]
+    cabinet_networks["NMN"]["VLan"] = nmn_subnet["VlanID"]
+
+    print()
+    print("HMN_MTN Subnet")
+    print("  VlanID:     ", hmn_subnet["VlanID"])
+    print("  CIDR:       ", hmn_subnet["CIDR"])
+    print("  Gateway:    ", hmn_subnet["Gateway"])
+    print("  DHCP Start: ", hmn_subnet["DHCPStart"])
+    print("  DHCP End:   ", hmn_subnet["DHCPEnd"])
+    print("NMN_MTN Subnet")
+    print("  VlanID:     ", nmn_subnet["VlanID"])
+    print("  CIDR:       ", nmn_subnet["CIDR"])
+    print("  Gateway:    ", nmn_subnet["Gateway"])
+    print("  DHCP Start: ", nmn_subnet["DHCPStart"])
+    print("  DHCP End:   ", nmn_subnet["DHCPEnd"])
+    print()
+
+    print("Next available NID", currentNID)
+
+    return currentNID
 
-    extraProperties = hardware["ExtraProperties"]
-    if extraProperties["Role"] != "Compute":
-        continue
+# Parse CLI Arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("sls_state_file", type=str, help="SLS State file to modify")
+parser.add_argument("--cabinet", type=str, help="Cabinet xname to add, ex: x1000")
+parser.add_argument("--cabinet-type", type=str, help="Cabinet type", choices={"Hill", "Mountain"})
+parser.add_argument("--cabinet-vlan-hmn", type=vlan_id, help="Hardware Management Network (HMN) VLAN ID configured on the CEC, ex: 1000. Defaults to the next free VLAN in the HMN_MTN VlanRange")
+parser.add_argument("--cabinet-vlan-nmn", type=vlan_id, help="Cabinet NMN vlan add, ex: 2000. Defaults to the next free VLAN in the NMN_MTN VlanRange")
+parser.add_argument("--starting-nid", type=int, help="Starting NID for new cabinet, ex: 1000. Defaults to the lowest free block of NIDs")
+parser.add_argument("--align-nids", action="store_true", help="Align automatically allocated NIDs to cabinet boundaries, ex: 1000, 1256, 1512")
+parser.add_argument("--cabinet-subnet-prefix-length", type=int, default=DEFAULT_CABINET_SUBNET_PREFIX_LENGTH, help="Prefix length of the HMN_MTN and NMN_MTN subnets allocated for the cabinet, ex: 22")
+parser.add_argument("--batch-file", type=str, help="CSV or YAML file listing multiple cabinets to add. Replaces the --cabinet, --cabinet-type, --cabinet-vlan-hmn, --cabinet-vlan-nmn and --starting-nid flags")
+parser.add_argument("--delta-file", type=str, help="Also write the added and changed SLS objects as a JSON Patch style changeset to this file, to be applied with apply_sls_delta.py")
+parser.add_argument("--compact", action="store_true", help="Write the updated SLS state without indentation")
+add_workspace_argument(parser)
+add_metrics_arguments(parser)
+args = parser.parse_args()
 
-    nid = hardware["ExtraProperties"]["NID"]
+if args.workspace is not None:
+    exit(run_in_workspace(args.workspace, "add_liquid_cooled_cabinet.py"))
 
-    if nid in nidSet:
-        foundDuplicateNIDs = True
-        print("Error found duplicate NID {}".format(nid))
+metrics = Metrics.from_args("add_liquid_cooled_cabinet", args)
 
-    nidSet.add(nid)
+if args.batch_file is not None:
+    for flag in BATCH_FIELDS:
+        if getattr(args, flag) is not None:
+            print("Error: --{} cannot be used with --batch-file".format(flag.replace("_", "-")))
+            exit(1)
 
-if foundDuplicateNIDs:
-    exit(1)
+    cabinets = load_batch_file(args.batch_file)
+else:
+    missing = ["--" + flag.replace("_", "-") for flag in BATCH_FIELDS if flag not in OPTIONAL_BATCH_FIELDS and getattr(args, flag) is None]
+    if missing:
+        parser.error("the following arguments are required: {}".format(", ".join(missing)))
 
-#
-# Networks
-#
+    cabinets = [{flag: getattr(args, flag) for flag in BATCH_FIELDS}]
 
-# Add in the HMN_MTN and NMN_MTN networks if they do not exist
-if "HMN_MTN" not in sls_state["Networks"]:
-    allNetworks["HMN_MTN"] = build_network("HMN_MTN", "Mountain Hardware Management Network", DEFAULT_HMN_MTN_CIDR, [1000, 1256])
-
-if "NMN_MTN" not in sls_state["Networks"]:
-    allNetworks["NMN_MTN"] = build_network("NMN_MTN", "Mountain Node Management Network", DEFAULT_NMN_MTN_CIDR, [1257, 1512])
+for cabinet in cabinets:
+    validate_cabinet(cabinet)
 
 print("========================")
-print("Network Configuration")
+print("Configuration")
 print("========================")
+print("SLS State File:   ", args.sls_state_file)
+if args.batch_file is None:
+    print("Starting NID:     ", args.starting_nid if args.starting_nid is not None else "next available")
+    print("Cabinet:          ", args.cabinet)
+    print("Cabinet Type:     ", args.cabinet_type)
+    print("Cabinet VLAN HMN: ", args.cabinet_vlan_hmn if args.cabinet_vlan_hmn is not None else "next available")
+    print("Cabinet VLAN NMN: ", args.cabinet_vlan_nmn if args.cabinet_vlan_nmn is not None else "next available")
+else:
+    print("Batch File:       ", args.batch_file)
+    print()
+    print("Cabinet  | Type      | VLAN HMN | VLAN NMN | Starting NID")
+    print("---------|-----------|----------|----------|-------------")
+    for cabinet in cabinets:
+        values = [cabinet[field] if cabinet[field] is not None else "auto" for field in OPTIONAL_BATCH_FIELDS]
+        print("{:<9}| {:<10}| {:<9}| {:<9}| {}".format(cabinet["cabinet"], cabinet["cabinet_type"], *values))
+print()
 
-hmn_subnet = add_cabinet_subnet(allNetworks["HMN_MTN"], args.cabinet, args.cabinet_vlan_hmn)
-nmn_subnet = add_cabinet_subnet(allNetworks["NMN_MTN"], args.cabinet, args.cabinet_vlan_nmn)
+metrics.begin("load")
+# Load in existing SLS State
+model = load_model(args.sls_state_file)
+baseline = validate_sls_model(model)
+allNetworks = model.networks
 
-cabinet_networks = allHardware[args.cabinet]["ExtraProperties"]["Networks"]["cn"]
-cabinet_networks["HMN"]["CIDR"] = hmn_subnet["CIDR"]
-cabinet_networks["HMN"]["Gateway"] = hmn_subnet["Gateway"]
-cabinet_networks["HMN"]["VLan"] = hmn_subnet["VlanID"]
+# Add in the HMN_MTN and NMN_MTN networks if they do not exist
+if "HMN_MTN" not in allNetworks:
+    model.add_network(build_network("HMN_MTN", "Mountain Hardware Management Network", DEFAULT_HMN_MTN_CIDR, [1000, 1256]))
 
-cabinet_networks["NMN"]["CIDR"] = nmn_subnet["CIDR"]
-cabinet_networks["NMN"]["Gateway"] = nmn_subnet["Gateway"]
-cabinet_networks["NMN"]["VLan"] = nmn_subnet["VlanID"]
-
-print()
-print("HMN_MTN Subnet")
-print("  VlanID:     ", hmn_subnet["VlanID"])
-print("  CIDR:       ", hmn_subnet["CIDR"])
-print("  Gateway:    ", hmn_subnet["Gateway"])
-print("  DHCP Start: ", hmn_subnet["DHCPStart"])
-print("  DHCP End:   ", hmn_subnet["DHCPEnd"])
-print("NMN_MTN Subnet")
-print("  VlanID:     ", nmn_subnet["VlanID"])
-print("  CIDR:       ", nmn_subnet["CIDR"])
-print("  Gateway:    ", nmn_subnet["Gateway"])
-print("  DHCP Start: ", nmn_subnet["DHCPStart"])
-print("  DHCP End:   ", nmn_subnet["DHCPEnd"])
-print()
+if "NMN_MTN" not in allNetworks:
+    model.add_network(build_network("NMN_MTN", "Mountain Node Management Network", DEFAULT_NMN_MTN_CIDR, [1257, 1512]))
 
+metrics.begin("allocate")
+allocate_cabinet_nids(model, cabinets, args.align_nids)
 
-# Verify no duplicate Cabinet VLANs
+# Verify no duplicate Cabinet VLANs already exist. The allocator keeps track of
+# every VLAN in use, so each new cabinet only needs to check its own VLANs
 foundDuplicateVlans = False
-vlanSet = set()
+vlan_allocator = VLANAllocator()
 for network in ["HMN_MTN", "NMN_MTN"]:
+    vlan_range = allNetworks[network]["ExtraProperties"].get("VlanRange")
+    if vlan_range:
+        vlan_allocator.add_range(network, vlan_range[0], vlan_range[-1])
+
     for subnet in  allNetworks[network]["ExtraProperties"]["Subnets"]:
         vlan = subnet["VlanID"]
-        if vlan in vlanSet:
+        # A VLAN outside of 1-4094 can never be handed out, so it can not
+        # conflict with a new cabinet
+        if not MIN_VLAN <= vlan <= MAX_VLAN:
+            print("Warning subnet {} in {} has VLAN {} outside of the valid range {}-{}".format(subnet["Name"], network, vlan, MIN_VLAN, MAX_VLAN))
+            continue
+
+        if not vlan_allocator.reserve(vlan):
             foundDuplicateVlans = True
             print("Error found duplicate VLAN {} with subnet {} in {}".format(vlan, subnet["Name"], network))
-
-        vlanSet.add(vlan)
 if foundDuplicateVlans:
     exit(1)
 
-print("Next available NID", currentNID)
+# The River cabinet VLANs are in use as well
+for network in ["HMN_RVR", "NMN_RVR"]:
+    if network in allNetworks:
+        for subnet in allNetworks[network]["ExtraProperties"]["Subnets"]:
+            if MIN_VLAN <= subnet["VlanID"] <= MAX_VLAN:
+                vlan_allocator.reserve(subnet["VlanID"])
+
+allocate_cabinet_vlans(cabinets, vlan_allocator)
+
+metrics.begin("cabinets")
+# Every cabinet is applied to the in-memory state before anything is written, so
+# if any cabinet in a batch fails the SLS state file is left untouched
+subnet_allocators = {}
+for cabinet in cabinets:
+    add_cabinet(model, cabinet, subnet_allocators, args.sls_state_file, args.cabinet_subnet_prefix_length)
+
+metrics.begin("validate")
+# Verify the changes did not introduce any conflicts before anything is written
+if not check_sls_changes(model, baseline):
+    exit(1)
 
+metrics.begin("write")
 # Write out the updated SLS dump
-print("Writing updated SLS state to", args.sls_state_file)
-with open(args.sls_state_file, "w") as f:
-    json.dump(sls_state, f, indent=2)
+save_model(model, args.sls_state_file, compact=args.compact)
+
+if args.delta_file is not None:
+    print("Writing SLS changes to", args.delta_file)
+    write_sls_delta(args.delta_file, model.build_delta())
@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import requests
+from sls_io import read_sls_delta
+from sls_metrics import Metrics, add_metrics_arguments
+from sls_xname import parse_xname, xname_depth
+
+# The API gateway client is shared with the scripts two directories up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from csm_api_client import CsmApiClient, TokenError, TokenManager
+
+def put_object(client, collection, name, value):
+    '''
+    PUT a single SLS object. The client retries with exponential backoff on
+    connection errors and server side failures.
+    '''
+    try:
+        response = client.request("PUT", "sls", "/{}/{}".format(collection, name), json=value)
+    except (requests.exceptions.RequestException, TokenError) as err:
+        return False, str(err)
+
+    return response.ok, "{} {}".format(response.status_code, response.reason)
+
+def build_waves(delta):
+    '''
+    Group the delta into waves that are applied one after another. Networks go
+    first, then hardware ordered by xname depth so parents are created before
+    their children. Operations within a wave are independent of each other.
+    '''
+    networks = []
+    hardware = {}
+    for operation in delta:
+        _, section, name = operation["path"].split("/", 2)
+        if section == "Networks":
+            networks.append(("networks", name, operation["value"]))
+        else:
+            key = parse_xname(name)
+            depth = xname_depth(key) if key is not None else 0
+            hardware.setdefault(depth, []).append(("hardware", name, operation["value"]))
+
+    waves = []
+    if networks:
+        waves.append(networks)
+    for depth in sorted(hardware):
+        waves.append(hardware[depth])
+
+    return waves
+
+# Parse CLI Arguments
+parser = argparse.ArgumentParser(description="Apply a SLS changeset written by the --delta-file flag of the SLS scripts through the SLS API")
+parser.add_argument("sls_delta_file", type=str, help="SLS changeset to apply")
+parser.add_argument("--sls-url", type=str, default="https://api-gw-service-nmn.local/apis/sls/v1", help="Base URL of the SLS API")
+parser.add_argument("--workers", type=int, default=8, help="Maximum number of concurrent SLS requests")
+parser.add_argument("--retries", type=int, default=3, help="Number of times to retry a failed SLS request")
+parser.add_argument("--timeout", type=float, default=30, help="Timeout in seconds of each SLS request")
+parser.add_argument("--dry-run", action="store_true", help="Only print the changes that would be applied")
+add_metrics_arguments(parser)
+args = parser.parse_args()
+
+metrics = Metrics.from_args("apply_sls_delta", args)
+
+metrics.begin("read")
+delta = read_sls_delta(args.sls_delta_file)
+waves = build_waves(delta)
+
+print("Applying {} SLS changes from {} to {}".format(len(delta), args.sls_delta_file, args.sls_url))
+if args.dry_run:
+    for wave in waves:
+        for collection, name, _ in wave:
+            print("  PUT {}/{}/{}".format(args.sls_url, collection, name))
+    exit(0)
+
+# Check to make sure we have a token. New tokens come from the gateway in front of SLS.
+gateway = args.sls_url.split("/apis/")[0]
+try:
+    tokens = TokenManager.from_env(gateway)
+except TokenError as err:
+    print(err)
+    sys.exit(1)
+
+client = CsmApiClient(gateway, tokens, timeout=args.timeout, retries=args.retries, pool_size=args.workers, services={"sls": args.sls_url})
+
+completed = 0
+failures = []
+
+metrics.begin("apply")
+with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+    for wave in waves:
+        futures = {}
+        for collection, name, value in wave:
+            url = client.url("sls", "/{}/{}".format(collection, name))
+            futures[executor.submit(put_object, client, collection, name, value)] = url
+
+        for future in concurrent.futures.as_completed(futures):
+            ok, status = future.result()
+            completed += 1
+            print("[{}/{}] PUT {} {}".format(completed, len(delta), futures[future], status))
+            if not ok:
+                failures.append((futures[future], status))
+
+        # Children are not created if any of their parents failed
+        if failures:
+            break
+
+print()
+if failures:
+    print("Failed to apply {} of {} SLS changes:".format(len(failures), len(delta)))
+    for url, status in failures:
+        print("  {} {}".format(url, status))
+    exit(1)
+
+print("Applied {} SLS changes".format(len(delta)))
@@ -0,0 +1,227 @@
+#! /usr/bin/env python3
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from sls_io import iter_sls_state
+from sls_xname import parse_xname, xname_letters
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = ["generate", "inspect", "validate", "add_cabinet", "add_cdu_switch"]
+
+# Runs shorter than this are dominated by interpreter start up, so they are
+# not used to estimate how a script scales
+MIN_SCALING_SECONDS = 1.0
+
+def run(command, log_path):
+    '''
+    Run one of the SLS scripts and return its wall time, CPU time and peak RSS,
+    along with the timings of each phase from its metrics file
+    '''
+    metrics_path = log_path + ".metrics.json"
+    command = command + ["--metrics-file", metrics_path]
+
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    phases = []
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            phases = json.load(f)["phases"]
+        os.unlink(metrics_path)
+
+    return {
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "max_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "exit_code": process.returncode,
+        "log": log_path,
+        "phases": phases,
+    }
+
+def find_free_names(dump):
+    '''
+    Stream through a dump to find a cabinet xname, CDU switch xname and CDU
+    switch alias that are not in use, and the prefix length of the existing
+    cabinet subnets
+    '''
+    cabinets = set()
+    cdus = set()
+    aliases = set()
+    prefixlen = None
+    for section, key, value in iter_sls_state(dump):
+        if section == "Hardware":
+            parsed = parse_xname(key)
+            if parsed is not None and xname_letters(parsed) == "x":
+                cabinets.add(parsed[1])
+            elif parsed is not None and xname_letters(parsed) == "dw":
+                cdus.add(parsed[1])
+            aliases.update(value.get("ExtraProperties", {}).get("Aliases", []))
+        elif section == "Networks" and key == "HMN_MTN":
+            for subnet in value["ExtraProperties"]["Subnets"]:
+                prefixlen = int(subnet["CIDR"].split("/")[1])
+                break
+
+    cabinet = next(("x{}".format(number) for number in range(1000, 10000) if number not in cabinets), None)
+    cdu = "d{}w1".format(max(cdus, default=-1) + 1)
+    alias = next(("sw-cdu-%03d" % number for number in range(1, 1000) if "sw-cdu-%03d" % number not in aliases), None)
+
+    return cabinet, cdu, alias, prefixlen
+
+def scaling_exponent(n1, t1, n2, t2):
+    if t1 < MIN_SCALING_SECONDS or t2 < MIN_SCALING_SECONDS or n1 == n2:
+        return None
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+# Parse CLI Arguments
+parser = argparse.ArgumentParser(description="Measure how the SLS scripts scale with the size of the system, using generated SLS state files")
+parser.add_argument("--sizes", type=str, default="10,100,1000", help="Comma separated numbers of cabinets to benchmark, ex: 10,100,1000,10000")
+parser.add_argument("--mix", type=str, default="80,10,10", help="Percentages of Mountain, Hill and River cabinets, ex: 80,10,10")
+parser.add_argument("--benchmarks", type=str, default=",".join(BENCHMARKS), help="Comma separated benchmarks to run, from: {}".format(", ".join(BENCHMARKS)))
+parser.add_argument("--work-dir", type=str, help="Directory for the generated SLS state files and script output, defaults to a temporary directory that is removed afterwards")
+parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+parser.add_argument("--max-exponent", type=float, default=1.5, help="Report scripts whose run time grows faster than the number of cabinets to this power")
+parser.add_argument("--strict", action="store_true", help="Exit with an error if any script fails or exceeds --max-exponent")
+args = parser.parse_args()
+
+try:
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+except ValueError:
+    print("Error: Invalid --sizes", args.sizes)
+    exit(1)
+
+benchmarks = args.benchmarks.split(",")
+for benchmark in benchmarks:
+    if benchmark not in BENCHMARKS:
+        print("Error: Unknown benchmark", benchmark)
+        exit(1)
+
+work_dir = args.work_dir or tempfile.mkdtemp(prefix="sls-benchmark.")
+os.makedirs(work_dir, exist_ok=True)
+
+results = []
+try:
+    for size in sizes:
+        print("========================")
+        print("{} Cabinets".format(size))
+        print("========================")
+
+        dump = os.path.join(work_dir, "sls_dump_{}.json".format(size))
+        result = run([sys.executable, os.path.join(SCRIPT_DIR, "generate_sls_dump.py"), dump, "--cabinets", str(size), "--mix", args.mix], os.path.join(work_dir, "generate_{}.log".format(size)))
+        if "generate" in benchmarks:
+            results.append(dict(result, benchmark="generate", cabinets=size))
+        if result["exit_code"] != 0:
+            print("Error: Failed to generate {}, see {}".format(dump, result["log"]))
+            exit(1)
+
+        cabinet, cdu, alias, prefixlen = find_free_names(dump)
+
+        commands = {
+            "inspect": ["inspect_sls_cabinets.py", dump],
+            "validate": ["validate_sls.py", dump],
+        }
+        if cabinet is not None:
+            commands["add_cabinet"] = ["add_liquid_cooled_cabinet.py", None, "--cabinet", cabinet, "--cabinet-type", "Mountain"]
+            if prefixlen is not None:
+                commands["add_cabinet"] += ["--cabinet-subnet-prefix-length", str(prefixlen)]
+        if alias is not None:
+            commands["add_cdu_switch"] = ["add_cdu_switch.py", None, "--cdu-switch", cdu, "--brand", "Aruba", "--alias", alias]
+
+        for benchmark in benchmarks:
+            if benchmark == "generate":
+                continue
+            if benchmark not in commands:
+                print("Skipping {}, there is no free xname or alias left".format(benchmark))
+                continue
+
+            command = list(commands[benchmark])
+            if command[1] is None:
+                # Scripts that modify the SLS state get their own copy
+                command[1] = os.path.join(work_dir, "sls_dump_{}_{}.json".format(size, benchmark))
+                shutil.copyfile(dump, command[1])
+
+            command[0] = os.path.join(SCRIPT_DIR, command[0])
+            result = run([sys.executable] + command, os.path.join(work_dir, "{}_{}.log".format(benchmark, size)))
+            results.append(dict(result, benchmark=benchmark, cabinets=size))
+
+            if command[1] != dump:
+                os.unlink(command[1])
+
+        for result in results:
+            if result["cabinets"] == size:
+                status = "ok" if result["exit_code"] == 0 else "failed, see {}".format(result["log"])
+                print("{:<16} {:>9.2f}s wall {:>9.2f}s cpu {:>9.1f}MB max RSS  {}".format(result["benchmark"], result["wall_seconds"], result["cpu_seconds"], result["max_rss_mb"], status))
+                for phase in result["phases"]:
+                    print("  {:<14} {:>9.2f}s wall {:>9.2f}s cpu {:>9.1f}MB max RSS".format(phase["name"], phase["wall_seconds"], phase["cpu_seconds"], phase["max_rss_mb"]))
+        print()
+
+        os.unlink(dump)
+finally:
+    if args.work_dir is None:
+        shutil.rmtree(work_dir)
+
+# Look for scripts that grow faster than the number of cabinets
+print("========================")
+print("Scaling")
+print("========================")
+flagged = []
+for benchmark in benchmarks:
+    runs = [result for result in results if result["benchmark"] == benchmark and result["exit_code"] == 0]
+    for first, second in zip(runs, runs[1:]):
+        # Compare the whole script and each of its phases
+        timings = [(benchmark, first["wall_seconds"], second["wall_seconds"])]
+        second_phases = {phase["name"]: phase for phase in second["phases"]}
+        for phase in first["phases"]:
+            if phase["name"] in second_phases:
+                timings.append(("{}/{}".format(benchmark, phase["name"]), phase["wall_seconds"], second_phases[phase["name"]]["wall_seconds"]))
+
+        for name, first_seconds, second_seconds in timings:
+            exponent = scaling_exponent(first["cabinets"], first_seconds, second["cabinets"], second_seconds)
+            if exponent is None:
+                continue
+
+            print("{:<24} {} -> {} cabinets grows as n^{:.2f}".format(name, first["cabinets"], second["cabinets"], exponent))
+            if exponent > args.max_exponent:
+                flagged.append(name)
+                print("Warning: {} grows faster than n^{}".format(name, args.max_exponent))
+
+if args.output is not None:
+    with open(args.output, "w") as f:
+        json.dump({"sizes": sizes, "mix": args.mix, "results": results}, f, indent=2)
+    print("Wrote results to", args.output)
+
+failed = [result for result in results if result["exit_code"] != 0]
+if args.strict and (failed or flagged):
+    exit(1)
@@ -0,0 +1,415 @@
+#! /usr/bin/env python3
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import argparse
+import math
+import netaddr
+from sls_allocators import AllocationError, SubnetAllocator
+from sls_io import write_sls_state
+from sls_metrics import Metrics, add_metrics_arguments
+
+MOUNTAIN_CHASSIS_LIST = ["c0", "c1", "c2", "c3", "c4", "c5", "c6", "c7"]
+HILL_TDS_CHASSIS_LIST = ["c1", "c3"]
+
+NCN_ALIASES = ["ncn-m001", "ncn-m002", "ncn-m003", "ncn-s001", "ncn-s002", "ncn-s003", "ncn-w001", "ncn-w002", "ncn-w003"]
+NCN_SUB_ROLES = {"m": "Master", "s": "Storage", "w": "Worker"}
+NCN_STARTING_NID = 100001
+
+RIVER_COMPUTE_NODES = 16
+CABINETS_PER_CDU = 6
+STARTING_NID = 1000
+
+# Networks that are the same size on every system
+FIXED_NETWORKS = [
+    # Name, full name, CIDR, VLAN
+    ("MTL", "Provisioning Network (untagged)", "10.1.0.0/16", 0),
+    ("NMN", "Node Management Network", "10.252.0.0/17", 2),
+    ("HMN", "Hardware Management Network", "10.254.0.0/17", 4),
+    ("CMN", "Customer Management Network", "10.103.0.0/17", 7),
+]
+
+# Networks holding a subnet per cabinet, with the CIDR they have on a typical system
+CABINET_NETWORKS = [
+    # Name, full name, class, CIDR, VlanRange
+    ("HMN_MTN", "Mountain Hardware Management Network", "Mountain", "10.104.0.0/17", [3000, 3999]),
+    ("NMN_MTN", "Mountain Node Management Network", "Mountain", "10.100.0.0/17", [2000, 2999]),
+    ("HMN_RVR", "River Hardware Management Network", "River", "10.107.0.0/17", [1513, 1769]),
+    ("NMN_RVR", "River Node Management Network", "River", "10.106.0.0/17", [1770, 1999]),
+]
+
+# Extra room left in each cabinet network, so cabinets can be added to the dump
+CABINET_NETWORK_SPARE = 1.25
+
+class LazySection:
+    '''
+    Stand-in for the Hardware section that generates its objects while the
+    dump is written, so the whole system is never held in memory
+    '''
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def items(self):
+        return self.factory()
+
+def plan_cabinets(mountain, hill, river):
+    '''
+    Pick the xname of every cabinet. River cabinets start at x3000, liquid-cooled
+    cabinets at x1000 skipping over the River cabinets.
+    '''
+    river_cabinets = ["x{}".format(3000 + i) for i in range(river)]
+    used = set(river_cabinets)
+
+    numbers = (number for number in list(range(1000, 10000)) + list(range(0, 1000)) if "x{}".format(number) not in used)
+    liquid_cooled = []
+    for cabinet_type, count in [("Mountain", mountain), ("Hill", hill)]:
+        for _ in range(count):
+            try:
+                liquid_cooled.append(("x{}".format(next(numbers)), cabinet_type))
+            except StopIteration:
+                print("Error: Unable to fit {} cabinets into the xname space".format(mountain + hill + river))
+                exit(1)
+
+    return liquid_cooled + [(xname, "River") for xname in river_cabinets]
+
+def build_network(name, full_name, cidr, vlan_range, subnets):
+    return {
+        "Name": name,
+        "FullName": full_name,
+        "IPRanges": [
+            cidr
+        ],
+        "Type": "ethernet",
+        "ExtraProperties": {
+            "CIDR": cidr,
+            "VlanRange": vlan_range,
+            "MTU": 9000,
+            "Subnets": subnets
+        }
+    }
+
+def build_subnet(name, full_name, cidr, vlan, reservations=()):
+    subnet = netaddr.IPNetwork(cidr)
+    sls_subnet = {
+        "Name": name,
+        "FullName": full_name,
+        "CIDR": str(subnet),
+        "VlanID": vlan,
+        "Gateway": str(subnet[1]),
+    }
+
+    if reservations:
+        sls_subnet["IPReservations"] = [
+            {"Name": alias, "IPAddress": str(subnet[2 + i]), "Comment": xname}
+            for i, (xname, alias) in enumerate(reservations)
+        ]
+    else:
+        sls_subnet["DHCPStart"] = str(subnet[10])
+        sls_subnet["DHCPEnd"] = str(subnet[-2])
+
+    return sls_subnet
+
+def plan_cabinet_networks(cabinets):
+    '''
+    Pick the CIDR of every cabinet network and the prefix length of the cabinet
+    subnets within them. Networks keep their usual /17 and cabinets their /22
+    while they fit, larger systems get larger networks elsewhere in 10.0.0.0/8
+    and smaller cabinet subnets.
+    '''
+    counts = {
+        "Mountain": sum(1 for _, cabinet_class in cabinets if cabinet_class != "River"),
+        "River": sum(1 for _, cabinet_class in cabinets if cabinet_class == "River"),
+    }
+
+    for cabinet_prefixlen in range(22, 27):
+        allocator = SubnetAllocator("10.0.0.0/8")
+        for _, _, cidr, _ in FIXED_NETWORKS:
+            allocator.reserve(cidr)
+
+        # Prefix length of each network when sized for its cabinets
+        prefixlens = {}
+        for name, _, cabinet_class, _, _ in CABINET_NETWORKS:
+            prefixlens[name] = cabinet_prefixlen - math.ceil(math.log2(max(counts[cabinet_class] * CABINET_NETWORK_SPARE, 1)))
+
+        plan = {}
+        for name, _, _, cidr, _ in CABINET_NETWORKS:
+            if prefixlens[name] >= 17:
+                allocator.reserve(cidr)
+                plan[name] = netaddr.IPNetwork(cidr)
+
+        try:
+            for name, _, _, _, _ in CABINET_NETWORKS:
+                if name not in plan:
+                    plan[name] = allocator.allocate(prefixlens[name])
+        except AllocationError:
+            continue
+
+        return plan, cabinet_prefixlen
+
+    print("Error: Unable to fit the cabinet networks of {} cabinets into 10.0.0.0/8".format(len(cabinets)))
+    exit(1)
+
+def generate_networks(cabinets, network_plan, cabinet_prefixlen, switches, ncns):
+    networks = {}
+
+    #
+    # Networks shared by the whole system
+    #
+    for name, full_name, cidr, vlan in FIXED_NETWORKS:
+        allocator = SubnetAllocator(cidr)
+
+        # Room for every switch plus the network and gateway addresses
+        hardware_prefixlen = min(32 - math.ceil(math.log2(len(switches) + 4)), 24)
+        subnets = [build_subnet("network_hardware", "{} Management Network Infrastructure".format(name), allocator.allocate(hardware_prefixlen), vlan, switches)]
+
+        if name in ("NMN", "HMN", "MTL"):
+            aliases = [(xname, alias if name != "HMN" else alias + "-mgmt") for xname, alias in ncns]
+            subnets.append(build_subnet("bootstrap_dhcp", "{} Bootstrap DHCP Subnet".format(name), allocator.allocate(24), vlan, aliases))
+
+        networks[name] = build_network(name, full_name, cidr, [vlan, vlan], subnets)
+
+    #
+    # Cabinet networks
+    #
+    for name, full_name, cabinet_class, _, vlan_range in CABINET_NETWORKS:
+        network = network_plan[name]
+        subnets = []
+        vlans = vlan_range[1] - vlan_range[0] + 1
+
+        class_cabinets = [xname for xname, other_class in cabinets if (other_class == "River") == (cabinet_class == "River")]
+        for i, xname in enumerate(class_cabinets):
+            # VLANs are reused once the VlanRange is exhausted
+            vlan = vlan_range[0] + i % vlans
+            cidr = "{}/{}".format(netaddr.IPAddress(network.first + (i << (32 - cabinet_prefixlen))), cabinet_prefixlen)
+            subnets.append(build_subnet(xname.replace("x", "cabinet_"), "", cidr, vlan))
+
+        networks[name] = build_network(name, full_name, str(network), vlan_range, subnets)
+
+    return networks
+
+def skip_ncn_nids(nid):
+    '''
+    Compute NIDs go around the NIDs of the management nodes
+    '''
+    if NCN_STARTING_NID <= nid < NCN_STARTING_NID + len(NCN_ALIASES):
+        return NCN_STARTING_NID + len(NCN_ALIASES)
+    return nid
+
+def generate_hardware(cabinets, cabinet_subnets, switches):
+    '''
+    Yield (xname, hardware) for every piece of hardware in the system
+    '''
+    for xname, alias in switches:
+        if xname.startswith("d"):
+            yield xname, {
+                "Parent": xname.split("w")[0],
+                "Xname": xname,
+                "Type": "comptype_cdu_mgmt_switch",
+                "Class": "Mountain",
+                "TypeString": "CDUMgmtSwitch",
+                "ExtraProperties": {
+                    "Brand": "Aruba",
+                    "Aliases": [alias]
+                }
+            }
+        else:
+            yield xname, {
+                "Parent": xname[:xname.rindex("s")],
+                "Xname": xname,
+                "Type": "comptype_hl_switch",
+                "Class": "River",
+                "TypeString": "MgmtHLSwitch",
+                "ExtraProperties": {
+                    "Brand": "Aruba",
+                    "Aliases": [alias]
+                }
+            }
+
+    currentNID = STARTING_NID
+    for cabinet_xname, cabinet_class in cabinets:
+        hmn_subnet, nmn_subnet = cabinet_subnets[cabinet_xname]
+        yield cabinet_xname, {
+            "Parent": "s0",
+            "Xname": cabinet_xname,
+            "Class": cabinet_class,
+            "Type": "comptype_cabinet",
+            "TypeString": "Cabinet",
+            "ExtraProperties": {
+                "Networks": {
+                    "cn": {
+                        "HMN": {"CIDR": hmn_subnet["CIDR"], "Gateway": hmn_subnet["Gateway"], "VLan": hmn_subnet["VlanID"]},
+                        "NMN": {"CIDR": nmn_subnet["CIDR"], "Gateway": nmn_subnet["Gateway"], "VLan": nmn_subnet["VlanID"]},
+                    }
+                }
+            }
+        }
+
+        if cabinet_class == "River":
+            nodes = []
+            if cabinet_xname == "x3000":
+                for slot, alias in enumerate(NCN_ALIASES, start=1):
+                    nodes.append(("{}c0s{}b0n0".format(cabinet_xname, slot), "Management", alias))
+            for slot in range(len(nodes) + 1, len(nodes) + RIVER_COMPUTE_NODES + 1):
+                nodes.append(("{}c0s{}b0n0".format(cabinet_xname, slot), "Compute", None))
+
+            for i, (xname, role, alias) in enumerate(nodes):
+                extraProperties = {"Role": role}
+                if role == "Management":
+                    extraProperties["SubRole"] = NCN_SUB_ROLES[alias[4]]
+                    extraProperties["NID"] = NCN_STARTING_NID + i
+                    extraProperties["Aliases"] = [alias]
+                else:
+                    currentNID = skip_ncn_nids(currentNID)
+                    extraProperties["NID"] = currentNID
+                    extraProperties["Aliases"] = ["nid%06d" % currentNID]
+                    currentNID += 1
+
+                yield xname, {
+                    "Parent": xname[:-2],
+                    "Xname": xname,
+                    "Type": "comptype_node",
+                    "Class": "River",
+                    "TypeString": "Node",
+                    "ExtraProperties": extraProperties
+                }
+            continue
+
+        chassis_list = MOUNTAIN_CHASSIS_LIST if cabinet_class == "Mountain" else HILL_TDS_CHASSIS_LIST
+        for chassis in chassis_list:
+            chassisXname = "{}{}".format(cabinet_xname, chassis)
+            yield chassisXname + "b0", {
+                "Parent": chassisXname,
+                "Xname": chassisXname + "b0",
+                "Type": "comptype_chassis_bmc",
+                "TypeString": "ChassisBMC",
+                "Class": cabinet_class,
+            }
+            yield chassisXname, {
+                "Parent": cabinet_xname,
+                "Xname": chassisXname,
+                "Type": "comptype_chassis",
+                "TypeString": "Chassis",
+                "Class": cabinet_class,
+            }
+
+            for slot in range(8):
+                for bmc in range(2):
+                    nodeBMCXname = "{}s{}b{}".format(chassisXname, slot, bmc)
+                    for node in range(2):
+                        nodeXname = "{}n{}".format(nodeBMCXname, node)
+                        currentNID = skip_ncn_nids(currentNID)
+                        yield nodeXname, {
+                            "Parent": nodeBMCXname,
+                            "Xname": nodeXname,
+                            "Type": "comptype_node",
+                            "TypeString": "Node",
+                            "Class": cabinet_class,
+                            "ExtraProperties": {
+                                "NID": currentNID,
+                                "Role": "Compute",
+                                "Aliases": ["nid%06d" % currentNID]
+                            }
+                        }
+                        currentNID += 1
+
+def split_cabinets(total, mix):
+    '''
+    Split a number of cabinets by Mountain, Hill and River percentages. There
+    is always at least one River cabinet holding the management nodes.
+    '''
+    weights = [float(value) for value in mix.split(",")]
+    if len(weights) != 3 or sum(weights) <= 0 or min(weights) < 0:
+        raise ValueError("expected three percentages for Mountain, Hill and River cabinets, ex: 80,10,10")
+
+    river = max(1, round(total * weights[2] / sum(weights)))
+    hill = min(round(total * weights[1] / sum(weights)), total - river)
+    mountain = max(total - river - hill, 0)
+
+    return mountain, hill, river
+
+# Parse CLI Arguments
+parser = argparse.ArgumentParser(description="Write a synthetic SLS state file with populated networks and IP reservations, for testing and benchmarking the SLS scripts")
+parser.add_argument("sls_state_file", type=str, help="SLS State file to write")
+parser.add_argument("--cabinets", type=int, default=5, help="Total number of cabinets, between 1 and 10000")
+parser.add_argument("--mix", type=str, default="80,10,10", help="Percentages of Mountain, Hill and River cabinets, ex: 80,10,10")
+parser.add_argument("--compact", action="store_true", help="Write the SLS state without indentation")
+add_metrics_arguments(parser)
+args = parser.parse_args()
+
+metrics = Metrics.from_args("generate_sls_dump", args)
+
+if not 1 <= args.cabinets <= 10000:
+    print("Error: Expected between 1 and 10000 cabinets but {} were given".format(args.cabinets))
+    exit(1)
+
+try:
+    mountain, hill, river = split_cabinets(args.cabinets, args.mix)
+except ValueError as err:
+    print("Error: Invalid --mix {}: {}".format(args.mix, err))
+    exit(1)
+
+metrics.begin("plan")
+cabinets = plan_cabinets(mountain, hill, river)
+network_plan, cabinet_prefixlen = plan_cabinet_networks(cabinets)
+
+# Every River cabinet has a leaf BMC switch and every group of liquid-cooled
+# cabinets a pair of CDU switches
+switches = [("x3000c0h33s1", "sw-spine-001"), ("x3000c0h34s1", "sw-spine-002")]
+for i, (xname, _) in enumerate(cabinet for cabinet in cabinets if cabinet[1] == "River"):
+    switches.append(("{}c0h38s1".format(xname), "sw-leaf-bmc-%03d" % (i + 1)))
+for cdu in range(math.ceil((mountain + hill) / CABINETS_PER_CDU)):
+    for switch in range(2):
+        switches.append(("d{}w{}".format(cdu, switch + 1), "sw-cdu-%03d" % (2 * cdu + switch + 1)))
+ncns = [("x3000c0s{}b0n0".format(slot), alias) for slot, alias in enumerate(NCN_ALIASES, start=1)]
+
+networks = generate_networks(cabinets, network_plan, cabinet_prefixlen, switches, ncns)
+
+cabinet_subnets = {}
+for hmnNetwork, nmnNetwork in [("HMN_MTN", "NMN_MTN"), ("HMN_RVR", "NMN_RVR")]:
+    for hmn_subnet, nmn_subnet in zip(networks[hmnNetwork]["ExtraProperties"]["Subnets"], networks[nmnNetwork]["ExtraProperties"]["Subnets"]):
+        cabinet_subnets[hmn_subnet["Name"].replace("cabinet_", "x")] = (hmn_subnet, nmn_subnet)
+
+print("========================")
+print("Configuration")
+print("========================")
+print("SLS State File:        ", args.sls_state_file)
+print("Mountain Cabinets:     ", mountain)
+print("Hill Cabinets:         ", hill)
+print("River Cabinets:        ", river)
+print("Switches:              ", len(switches))
+print("Cabinet Subnet Prefix: ", "/{}".format(cabinet_prefixlen))
+for name, network in network_plan.items():
+    print("{:<23}".format(name + " CIDR:"), network)
+if mountain + hill > 1000 or river > 230:
+    print("Warning: There are more cabinets than VLANs in the cabinet VlanRanges, so cabinet VLANs are reused")
+print()
+
+sls_state = {
+    "Hardware": LazySection(lambda: generate_hardware(cabinets, cabinet_subnets, switches)),
+    "Networks": networks,
+}
+
+metrics.begin("write")
+print("Writing SLS state to", args.sls_state_file)
+write_sls_state(args.sls_state_file, sls_state, compact=args.compact)
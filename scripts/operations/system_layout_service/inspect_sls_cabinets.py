@@ -22,93 +22,56 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 
 import argparse
-import json
-from itertools import groupby
-from operator import itemgetter
-
-def find_cabinet_nids(allHardware, cabinetXname):
-    nids = []
-    for xname in allHardware:
-        hardware = allHardware[xname]
-
-        if not xname.startswith(cabinetXname):
-            continue
-
-        if hardware["Type"] != "comptype_node" or "ExtraProperties" not in hardware:
-            continue
-
-        if "NID" not in hardware["ExtraProperties"]:
-            continue
-
-        nids.append(hardware["ExtraProperties"]["NID"])
-
-    nids.sort()
-
-    return nids
-
-def get_nid_ranges(nids):
-    '''
-    Create a nicely formated array of nid ranges
-    '''
-    ranges = []
-
-    for k, g in groupby( enumerate(nids), lambda x: x[1]-x[0]):
-        consecutive_nids = list(map(itemgetter(1), g))
-
-        if len(consecutive_nids) == 1:
-            ranges.append(str(consecutive_nids[0]))
-        else:
-            ranges.append("{}-{}".format(consecutive_nids[0], consecutive_nids[-1]))
-    
-    return ranges
-
+from sls_cache import DEFAULT_CACHE_DIR
+from sls_metrics import Metrics, add_metrics_arguments
+from sls_query import CabinetQuery, find_cabinets, format_csv, format_json, parse_range
+from sls_workspace import add_workspace_argument, load_model, run_in_workspace
 
 # Parse CLI Arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("sls_state_file", type=str, help="SLS State file to modify")
-
+parser.add_argument("--cache", action="store_true", help="Reuse a cached snapshot of the parsed SLS state when the file has not changed")
+parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="Directory holding SLS state snapshots, defaults to {}".format(DEFAULT_CACHE_DIR))
+parser.add_argument("--format", type=str, choices=["table", "json", "csv"], default="table", help="Output format")
+parser.add_argument("--class", type=str, dest="classes", action="append", help="Only show cabinets of this class, can be given multiple times. ex: Mountain")
+parser.add_argument("--xname-range", type=str, help="Only show cabinets within this xname range. ex: x1000-x1999")
+parser.add_argument("--vlan-range", type=str, help="Only show cabinets with a HMN or NMN VLAN within this range. ex: 3000-3100")
+parser.add_argument("--nid-range", type=str, help="Only show cabinets containing a NID within this range. ex: 1000-1999")
+add_workspace_argument(parser)
+add_metrics_arguments(parser)
 args = parser.parse_args()
 
-# Load in existing SLS State
-sls_state = None
-with open(args.sls_state_file) as f:
-    sls_state = json.load(f)
-
-allHardware = sls_state["Hardware"]
-allNetworks = sls_state["Networks"]
-
-# Find Mountain/Hill VLANs
-
-cabinets = {}
-for networks in [("HMN_MTN", "NMN_MTN"), ("HMN_RVR", "NMN_RVR")]:
-    hmnNetwork, nmnNetwork = networks
+if args.workspace is not None:
+    exit(run_in_workspace(args.workspace, "inspect_sls_cabinets.py"))
 
-    if hmnNetwork not in allNetworks or nmnNetwork not in allNetworks:
-        continue
+metrics = Metrics.from_args("inspect_sls_cabinets", args)
 
-    for subnet in allNetworks[hmnNetwork]["ExtraProperties"]["Subnets"]:
-        xname = subnet["Name"].replace("cabinet_", "x")
+try:
+    query = CabinetQuery(
+        classes=args.classes,
+        xname_range=parse_range(args.xname_range) if args.xname_range else None,
+        vlan_range=parse_range(args.vlan_range) if args.vlan_range else None,
+        nid_range=parse_range(args.nid_range) if args.nid_range else None,
+    )
+except ValueError as err:
+    print("Error invalid range: {}".format(err))
+    exit(1)
 
-        if xname not in cabinets:
-            cabinets[xname] = {"xname": xname}
-
-        cabinets[xname]["xname"] = xname
-        cabinets[xname]["hmn_vlan"] = subnet["VlanID"]
-        cabinets[xname]["hmn_cidr"] = subnet["CIDR"]
-
-    for subnet in allNetworks[nmnNetwork]["ExtraProperties"]["Subnets"]:
-        xname = subnet["Name"].replace("cabinet_", "x")
-
-        cabinets[xname]["xname"] = xname
-        cabinets[xname]["nmn_vlan"] = subnet["VlanID"]
-        cabinets[xname]["nmn_cidr"] = subnet["CIDR"]
+metrics.begin("load")
+# Load in existing SLS State
+model = load_model(args.sls_state_file, cache_dir=args.cache_dir if args.cache else None)
 
-cabinet_xnames = []
-for xname in cabinets:
-    cabinet_xnames.append(xname)
-    cabinets[xname]["class"] = allHardware[xname]["Class"] 
+metrics.begin("query")
+# Find Mountain/Hill VLANs
+cabinets = query.filter(find_cabinets(model))
 
-cabinet_xnames.sort()
+metrics.begin("output")
+if args.format == "json":
+    print(format_json(cabinets))
+    exit(0)
+elif args.format == "csv":
+    print(format_csv(cabinets), end="")
+    exit(0)
 
 print("=================================")
 print("Cabinet NID Allocations")
@@ -116,11 +79,9 @@ print("=================================")
 
 print("Cabinet             | NID Ranges")
 print("--------------------|---------------------")
-for xname in cabinet_xnames:
-    cabinet = cabinets[xname]
-    cabinetStr = "{} ({})".format(xname, cabinet["class"])
-    cabinet_nids = find_cabinet_nids(allHardware, xname)
-    nidRangeStr = ', '.join(get_nid_ranges(cabinet_nids))
+for cabinet in cabinets:
+    cabinetStr = "{} ({})".format(cabinet["xname"], cabinet["class"])
+    nidRangeStr = ', '.join(cabinet["nid_ranges"])
 
     print("{:<20}| {:<10}".format(cabinetStr, nidRangeStr))
 
@@ -132,7 +93,6 @@ print("=================================")
 
 print("Cabinet             | HMN VLAN  | HMN CIDR            | NMN VLAN  | NMN CIDR")
 print("--------------------|-----------|---------------------|-----------|---------------------")
-for xname in cabinet_xnames:
-    cabinet = cabinets[xname]
-    cabinetStr = "{} ({})".format(xname, cabinet["class"])
-    print("{:<20}| {:<10}| {:<20}| {:<10}| {:<10}".format(cabinetStr, cabinet["hmn_vlan"], cabinet["hmn_cidr"], cabinet["nmn_vlan"], cabinet["nmn_cidr"]))
+for cabinet in cabinets:
+    cabinetStr = "{} ({})".format(cabinet["xname"], cabinet["class"])
+    print("{:<20}| {:<10}| {:<20}| {:<10}| {:<10}".format(cabinetStr, cabinet.get("hmn_vlan", ""), cabinet.get("hmn_cidr", ""), cabinet.get("nmn_vlan", ""), cabinet.get("nmn_cidr", "")))
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sls_cache import DEFAULT_CACHE_DIR
+from sls_fleet import analyze_sls_dump, find_sls_dumps, format_csv, format_json, format_table, merge_summaries
+from sls_metrics import Metrics, add_metrics_arguments
+
+# Parse CLI Arguments
+parser = argparse.ArgumentParser(description="Run the cabinet, NID and VLAN reports and the validation checks against many SLS state files in parallel, and print one summary")
+parser.add_argument("sls_state_files", type=str, nargs="+", help="SLS State files, directories holding them or glob patterns, ex: '/var/backups/sls/*.json'")
+parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of SLS state files analyzed at the same time, defaults to the number of CPUs")
+parser.add_argument("--cache", action="store_true", help="Reuse a cached snapshot of the parsed SLS state when the file has not changed")
+parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="Directory holding SLS state snapshots, defaults to {}".format(DEFAULT_CACHE_DIR))
+parser.add_argument("--format", type=str, choices=["table", "json", "csv"], default="table", help="Output format")
+parser.add_argument("--strict", action="store_true", help="Treat warnings as errors")
+add_metrics_arguments(parser)
+args = parser.parse_args()
+
+metrics = Metrics.from_args("inspect_sls_fleet", args)
+
+paths = find_sls_dumps(args.sls_state_files)
+if not paths:
+    print("Error: No SLS state files found")
+    exit(1)
+
+if args.jobs < 1:
+    print("Error: --jobs must be at least 1")
+    exit(1)
+
+metrics.begin("analyze")
+# Each SLS state file is loaded and checked in its own process. Forked workers
+# do not import this script again, which would parse the arguments again.
+cache_dir = args.cache_dir if args.cache else None
+jobs = min(args.jobs, len(paths))
+with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+    summaries = list(executor.map(analyze_sls_dump, paths, [cache_dir] * len(paths)))
+
+totals = merge_summaries(summaries)
+
+metrics.begin("output")
+if args.format == "json":
+    print(format_json(summaries, totals))
+elif args.format == "csv":
+    print(format_csv(summaries), end="")
+else:
+    print(format_table(summaries, totals))
+
+if totals["failed"] or totals["errors"] or (args.strict and totals["warnings"]):
+    exit(1)
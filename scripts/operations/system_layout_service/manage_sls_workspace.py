@@ -0,0 +1,72 @@
+#! /usr/bin/env python3
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import argparse
+import os
+from sls_workspace import request_workspace, serve_workspace
+
+# Parse CLI Arguments
+parser = argparse.ArgumentParser(description="Keep SLS state files parsed and indexed in memory across many edits. Scripts run with --workspace use the in-memory state, and changes are only written to disk on commit")
+parser.add_argument("socket", type=str, help="Unix socket of the workspace, ex: /tmp/sls-workspace.sock")
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+start_parser = subparsers.add_parser("start", help="Run the workspace in the foreground until it is stopped")
+start_parser.add_argument("sls_state_file", type=str, nargs="*", help="SLS State files to load right away instead of on first use")
+
+commit_parser = subparsers.add_parser("commit", help="Write the changes made in the workspace to disk")
+commit_parser.add_argument("sls_state_file", type=str, nargs="?", help="Only commit this SLS State file")
+commit_parser.add_argument("--delta-file", type=str, help="Also write the committed changes as a JSON Patch style changeset to this file")
+commit_parser.add_argument("--compact", action="store_true", help="Write the updated SLS state without indentation")
+commit_parser.add_argument("--force", action="store_true", help="Overwrite SLS State files that changed on disk since they were loaded")
+
+subparsers.add_parser("status", help="Show the SLS State files held in the workspace and their uncommitted changes")
+subparsers.add_parser("discard", help="Drop all uncommitted changes")
+
+stop_parser = subparsers.add_parser("stop", help="Stop the workspace")
+stop_parser.add_argument("--discard", action="store_true", help="Stop even if there are uncommitted changes, dropping them")
+args = parser.parse_args()
+
+if args.command == "start":
+    try:
+        serve_workspace(args.socket, preload=args.sls_state_file)
+    except OSError as err:
+        print("Error: {}".format(err))
+        exit(1)
+    except KeyboardInterrupt:
+        exit(130)
+    exit(0)
+
+request = {"command": args.command}
+if args.command == "commit":
+    # The workspace runs in its own directory, so send absolute paths
+    request.update(
+        path=os.path.abspath(args.sls_state_file) if args.sls_state_file else None,
+        delta_file=os.path.abspath(args.delta_file) if args.delta_file else None,
+        compact=args.compact,
+        force=args.force,
+    )
+elif args.command == "stop":
+    request["discard"] = args.discard
+
+exit(request_workspace(args.socket, request))
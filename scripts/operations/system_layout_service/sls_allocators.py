@@ -0,0 +1,388 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+from bisect import bisect_left, bisect_right, insort
+import netaddr
+
+class AllocationError(Exception):
+    pass
+
+class IPAllocator:
+    '''
+    Tracks the free addresses of a subnet as sorted, non-overlapping integer
+    intervals. Lookups are a binary search over the interval starts, so the
+    cost depends on the number of reservations and not on the subnet size.
+    '''
+
+    def __init__(self, first, last):
+        # Parallel lists of inclusive [start, end] free intervals
+        self.starts = []
+        self.ends = []
+        if first <= last:
+            self.starts.append(first)
+            self.ends.append(last)
+
+    @classmethod
+    def from_sls_subnet(cls, sls_subnet, verbose=False):
+        '''
+        Build an allocator for the usable addresses of a SLS subnet with the
+        gateway and all existing IP reservations already reserved
+        '''
+        subnet = netaddr.IPNetwork(sls_subnet["CIDR"])
+
+        # Same usable range as subnet[1:-2]
+        allocator = cls(subnet.first + 1, subnet.last - 2)
+        if "Gateway" in sls_subnet:
+            allocator.reserve(sls_subnet["Gateway"])
+
+        for ip_reservation in sls_subnet.get("IPReservations", []):
+            if verbose:
+                print("  Found existing IP reservation {} with IP {}".format(ip_reservation["Name"], ip_reservation["IPAddress"]))
+            allocator.reserve(ip_reservation["IPAddress"])
+
+        return allocator
+
+    def _find(self, ip):
+        '''
+        Index of the free interval containing ip, or -1
+        '''
+        i = bisect_right(self.starts, ip) - 1
+        if i >= 0 and ip <= self.ends[i]:
+            return i
+        return -1
+
+    def is_reserved(self, ip):
+        return self._find(int(netaddr.IPAddress(ip))) == -1
+
+    def reserve(self, ip):
+        '''
+        Mark a single address as reserved. Reserving an address that is already
+        reserved or outside of the usable range is a no-op.
+        '''
+        ip = int(netaddr.IPAddress(ip))
+        self.reserve_range(ip, ip)
+
+    def reserve_range(self, first, last):
+        i = bisect_right(self.starts, last) - 1
+        while i >= 0 and self.ends[i] >= first:
+            start, end = self.starts[i], self.ends[i]
+            del self.starts[i]
+            del self.ends[i]
+
+            # Keep whatever is left over on either side of the reserved range
+            if last < end:
+                self.starts.insert(i, last + 1)
+                self.ends.insert(i, end)
+            if start < first:
+                self.starts.insert(i, start)
+                self.ends.insert(i, first - 1)
+                break
+            i -= 1
+
+    def free_count(self):
+        return sum(end - start + 1 for start, end in zip(self.starts, self.ends))
+
+    def next_free(self):
+        if not self.starts:
+            return None
+        return netaddr.IPAddress(self.starts[0])
+
+    def allocate(self):
+        '''
+        Reserve and return the lowest free address
+        '''
+        return self.allocate_contiguous(1)[0]
+
+    def allocate_contiguous(self, count):
+        '''
+        Reserve and return the lowest block of count contiguous free addresses
+        '''
+        for start, end in zip(self.starts, self.ends):
+            if end - start + 1 >= count:
+                self.reserve_range(start, start + count - 1)
+                return [netaddr.IPAddress(ip) for ip in range(start, start + count)]
+
+        raise AllocationError("Unable to find {} contiguous free IP addresses".format(count))
+
+    def allocate_many(self, count):
+        '''
+        Reserve and return the lowest count free addresses, which do not need to
+        be contiguous
+        '''
+        if self.free_count() < count:
+            raise AllocationError("Unable to find {} free IP addresses".format(count))
+
+        return [self.allocate() for _ in range(count)]
+
+class SubnetAllocator:
+    '''
+    Buddy allocator for carving subnets of any prefix length out of a parent
+    network. Free space is kept as sorted lists of block start addresses per
+    prefix length, so allocations only split as much of a free block as is
+    needed and released blocks are merged back with their buddy.
+    '''
+
+    def __init__(self, network_cidr):
+        self.network = netaddr.IPNetwork(network_cidr).cidr
+        self.max_prefixlen = 32 if self.network.version == 4 else 128
+        self.free = {}  # Prefix length -> sorted list of free block starts
+
+        self._add_free(self.network.first, self.network.prefixlen)
+
+    @classmethod
+    def from_sls_network(cls, sls_network, verbose=False):
+        '''
+        Build an allocator for a SLS network with all of its existing subnets
+        already allocated
+        '''
+        allocator = cls(sls_network["ExtraProperties"]["CIDR"])
+        for sls_subnet in sls_network["ExtraProperties"]["Subnets"]:
+            if verbose:
+                print("  Found existing subnet {} with CIDR {}".format(sls_subnet["Name"], sls_subnet["CIDR"]))
+            allocator.reserve(sls_subnet["CIDR"])
+
+        return allocator
+
+    def _block_size(self, prefixlen):
+        return 1 << (self.max_prefixlen - prefixlen)
+
+    def _add_free(self, start, prefixlen):
+        insort(self.free.setdefault(prefixlen, []), start)
+
+    def _remove_free(self, start, prefixlen):
+        blocks = self.free.get(prefixlen, [])
+        i = bisect_left(blocks, start)
+        if i < len(blocks) and blocks[i] == start:
+            del blocks[i]
+            return True
+        return False
+
+    def _split(self, start, prefixlen, target_start, target_prefixlen):
+        '''
+        Split the free block at start down to target_prefixlen, returning every
+        half that does not contain target_start to the free lists
+        '''
+        while prefixlen < target_prefixlen:
+            prefixlen += 1
+            upper = start + self._block_size(prefixlen)
+            if target_start >= upper:
+                self._add_free(start, prefixlen)
+                start = upper
+            else:
+                self._add_free(upper, prefixlen)
+
+    def reserve(self, cidr):
+        '''
+        Mark an existing subnet as allocated. Subnets outside of the network or
+        space that is already allocated are ignored.
+        '''
+        subnet = netaddr.IPNetwork(cidr).cidr
+        if subnet not in self.network:
+            return
+
+        # The subnet is inside of a single free block
+        for prefixlen in range(subnet.prefixlen, self.network.prefixlen - 1, -1):
+            start = subnet.first & ~(self._block_size(prefixlen) - 1)
+            if self._remove_free(start, prefixlen):
+                self._split(start, prefixlen, subnet.first, subnet.prefixlen)
+                return
+
+        # The subnet covers smaller free blocks, or overlaps space that is already allocated
+        for prefixlen in range(subnet.prefixlen + 1, self.max_prefixlen + 1):
+            blocks = self.free.get(prefixlen, [])
+            del blocks[bisect_left(blocks, subnet.first):bisect_right(blocks, subnet.last)]
+
+    def allocate(self, prefixlen, strategy="first-fit"):
+        '''
+        Allocate a subnet with the given prefix length.
+
+        first-fit returns the lowest addressed subnet available, best-fit takes
+        it from the smallest free block that can hold it to keep larger blocks
+        intact.
+        '''
+        if prefixlen < self.network.prefixlen or prefixlen > self.max_prefixlen:
+            raise AllocationError("Unable to allocate a /{} subnet from {}".format(prefixlen, self.network))
+
+        block = None
+        for candidate_prefixlen in range(prefixlen, self.network.prefixlen - 1, -1):
+            blocks = self.free.get(candidate_prefixlen)
+            if not blocks:
+                continue
+
+            if strategy == "best-fit":
+                block = (blocks[0], candidate_prefixlen)
+                break
+
+            if block is None or blocks[0] < block[0]:
+                block = (blocks[0], candidate_prefixlen)
+
+        if block is None:
+            raise AllocationError("Unable to find an available /{} subnet in {}".format(prefixlen, self.network))
+
+        start, block_prefixlen = block
+        self._remove_free(start, block_prefixlen)
+        self._split(start, block_prefixlen, start, prefixlen)
+
+        return netaddr.IPNetwork("{}/{}".format(netaddr.IPAddress(start, self.network.version), prefixlen))
+
+    def allocate_many(self, prefixlen, count, strategy="first-fit"):
+        return [self.allocate(prefixlen, strategy) for _ in range(count)]
+
+    def release(self, cidr):
+        '''
+        Return a previously allocated subnet, merging it with its buddy blocks
+        '''
+        subnet = netaddr.IPNetwork(cidr).cidr
+        start, prefixlen = subnet.first, subnet.prefixlen
+        while prefixlen > self.network.prefixlen:
+            buddy = start ^ self._block_size(prefixlen)
+            if not self._remove_free(buddy, prefixlen):
+                break
+            start = min(start, buddy)
+            prefixlen -= 1
+
+        self._add_free(start, prefixlen)
+
+# Compute NIDs handed out to liquid-cooled cabinets start here
+DEFAULT_MIN_NID = 1000
+
+class NIDAllocator:
+    '''
+    Bitmap of the used NIDs, one byte per NID from min_nid up to the highest
+    used NID. A free block is a run of zero bytes, which bytearray.find locates
+    without looping over the NIDs in Python. Everything past the end of the
+    bitmap is free.
+    '''
+
+    def __init__(self, used_nids=(), min_nid=DEFAULT_MIN_NID):
+        self.min_nid = min_nid
+
+        used_nids = [nid for nid in used_nids if isinstance(nid, int) and nid >= min_nid]
+        self.bitmap = bytearray(max(used_nids) - min_nid + 1 if used_nids else 0)
+        for nid in used_nids:
+            self.bitmap[nid - min_nid] = 1
+
+    @classmethod
+    def from_sls_model(cls, model, min_nid=DEFAULT_MIN_NID):
+        return cls(model.by_nid.keys(), min_nid)
+
+    def is_used(self, nid):
+        offset = nid - self.min_nid
+        return 0 <= offset < len(self.bitmap) and self.bitmap[offset] == 1
+
+    def reserve_range(self, first, count):
+        last = max(first - self.min_nid + count, 0)
+        first = max(first - self.min_nid, 0)
+        if last > len(self.bitmap):
+            self.bitmap.extend(bytes(last - len(self.bitmap)))
+        self.bitmap[first:last] = b"\x01" * (last - first)
+
+    def find_block(self, count, align=1):
+        '''
+        Lowest NID starting a block of count free NIDs. With align the block
+        starts at a multiple of align NIDs from min_nid, ex: on a cabinet boundary.
+        '''
+        free_block = bytes(count)
+        offset = 0
+        while True:
+            found = self.bitmap.find(free_block, offset)
+            if found == -1:
+                # The block may start inside a run of free NIDs at the end of the bitmap
+                found = max(len(self.bitmap.rstrip(b"\x00")), offset)
+
+            aligned = -(-found // align) * align
+            if self.bitmap.find(1, aligned, aligned + count) == -1:
+                return self.min_nid + aligned
+            offset = aligned
+
+    def allocate(self, count, align=1):
+        '''
+        Reserve and return the starting NID of the lowest free block of count NIDs
+        '''
+        if count < 1:
+            raise AllocationError("Unable to allocate a block of {} NIDs".format(count))
+
+        nid = self.find_block(count, align)
+        self.reserve_range(nid, count)
+        return nid
+
+# VLAN IDs 0 and 4095 are reserved
+MIN_VLAN = 1
+MAX_VLAN = 4094
+
+class VLANAllocator:
+    '''
+    One byte per VLAN ID shared by a set of networks, so a VLAN handed out in
+    one network is never handed out again in another. Each network allocates
+    from its own VlanRange, starting after the last VLAN it allocated.
+    '''
+
+    def __init__(self):
+        self.used = bytearray(MAX_VLAN + 2)
+        self.used[0] = 1
+        self.used[MAX_VLAN + 1] = 1
+
+        self.ranges = {}  # Network name -> (first, last)
+        self.cursors = {} # Network name -> next VLAN to look at
+
+    def add_range(self, name, first, last):
+        self.ranges[name] = (max(first, MIN_VLAN), min(last, MAX_VLAN))
+        self.cursors[name] = max(first, MIN_VLAN)
+
+    def _check_vlan(self, vlan):
+        if not MIN_VLAN <= vlan <= MAX_VLAN:
+            raise AllocationError("VLAN {} is outside of the valid range {}-{}".format(vlan, MIN_VLAN, MAX_VLAN))
+
+    def is_used(self, vlan):
+        self._check_vlan(vlan)
+        return self.used[vlan] == 1
+
+    def reserve(self, vlan):
+        '''
+        Mark a VLAN as used, returns False if it was already in use
+        '''
+        self._check_vlan(vlan)
+        if self.used[vlan]:
+            return False
+
+        self.used[vlan] = 1
+        return True
+
+    def allocate(self, name):
+        '''
+        Reserve and return the next free VLAN in the VlanRange of a network
+        '''
+        if name not in self.ranges:
+            raise AllocationError("Network {} does not have a VlanRange".format(name))
+
+        first, last = self.ranges[name]
+        # VLANs are never released, so everything before the cursor is in use
+        vlan = self.used.find(0, self.cursors[name], last + 1)
+        if vlan == -1:
+            raise AllocationError("Unable to find a free VLAN in the VlanRange {}-{} of {}".format(first, last, name))
+
+        self.used[vlan] = 1
+        self.cursors[name] = vlan + 1
+        return vlan
+
+    def allocate_many(self, name, count):
+        return [self.allocate(name) for _ in range(count)]
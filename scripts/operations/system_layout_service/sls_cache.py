@@ -0,0 +1,134 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import tempfile
+from sls_io import load_sls_state, paused_gc
+from sls_model import SLSModel
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "csm-sls")
+
+# Bump when the layout of SLSModel changes so old snapshots are not used
+SNAPSHOT_VERSION = 2
+
+# Number of snapshots kept in the cache directory
+MAX_SNAPSHOTS = 8
+
+def dump_digest(path):
+    '''
+    SHA-256 of the contents of a SLS dump
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+
+    return digest.hexdigest()
+
+def _snapshot_path(cache_dir, digest):
+    return os.path.join(cache_dir, "sls-v{}-{}.pickle".format(SNAPSHOT_VERSION, digest))
+
+class UntrustedCacheError(Exception):
+    pass
+
+def _check_trusted(path, st):
+    '''
+    Unpickling a snapshot runs code chosen by whoever wrote it, so snapshots
+    and their directory have to belong to the current user and must not be
+    writable by anyone else
+    '''
+    if st.st_uid != os.getuid():
+        raise UntrustedCacheError("{} is not owned by the current user".format(path))
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise UntrustedCacheError("{} is writable by other users".format(path))
+
+def _read_snapshot(snapshot):
+    _check_trusted(os.path.dirname(snapshot), os.stat(os.path.dirname(snapshot)))
+
+    # Never follow a symlink planted in place of a snapshot
+    fd = os.open(snapshot, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    with os.fdopen(fd, "rb") as f:
+        _check_trusted(snapshot, os.fstat(f.fileno()))
+        with paused_gc():
+            return pickle.load(f)
+
+def _write_snapshot(cache_dir, snapshot, model):
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    _check_trusted(cache_dir, os.stat(cache_dir))
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".sls-snapshot.", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # Only keep the most recently used snapshots around
+    snapshots = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.startswith("sls-v") and name.endswith(".pickle")]
+    snapshots.sort(key=os.path.getmtime, reverse=True)
+    for old_snapshot in snapshots[MAX_SNAPSHOTS:]:
+        os.unlink(old_snapshot)
+
+def load_sls_model(path, cache_dir=None):
+    '''
+    Load a SLS dump into a SLSModel. When a cache directory is given the model
+    and its indexes are pickled there in a snapshot keyed by the SHA-256 of
+    the dump, and later loads of an identical dump unpickle the snapshot
+    instead of parsing the JSON again. A changed dump has a different hash, so
+    it never matches an old snapshot. Snapshots are only read from a directory
+    and file owned by the current user that no one else can write to.
+    '''
+    if cache_dir is None:
+        sls_state = load_sls_state(path)
+        with paused_gc():
+            return SLSModel(sls_state)
+
+    snapshot = _snapshot_path(cache_dir, dump_digest(path))
+    if os.path.exists(snapshot):
+        try:
+            model = _read_snapshot(snapshot)
+            os.utime(snapshot)
+            return model
+        except UntrustedCacheError as err:
+            print("Warning: Not using SLS snapshot: {}".format(err))
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+            # Fall back to parsing the dump, which also replaces the bad snapshot
+            pass
+
+    sls_state = load_sls_state(path)
+    with paused_gc():
+        model = SLSModel(sls_state)
+        # Store the xname index in the snapshot as well, it is costly to build
+        model.xname_index
+    try:
+        _write_snapshot(cache_dir, snapshot, model)
+    except (OSError, UntrustedCacheError) as err:
+        print("Warning: Unable to write SLS snapshot to {}: {}".format(cache_dir, err))
+
+    return model
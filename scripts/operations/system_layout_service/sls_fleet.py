@@ -0,0 +1,166 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import collections
+import csv
+import glob
+import io
+import json
+import os
+from sls_cache import load_sls_model
+from sls_query import cabinet_record, find_cabinets
+from sls_validate import ERROR, WARNING, validate_sls_model
+
+SUMMARY_FIELDS = ["path", "cabinets", "mountain", "hill", "river", "nodes", "first_nid", "last_nid", "vlans", "errors", "warnings"]
+
+def find_sls_dumps(patterns):
+    '''
+    Expand the SLS dumps given on the command line. Each may be a file, a
+    directory whose *.json files are used, or a glob pattern.
+    '''
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "*.json"))
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern)
+        else:
+            matches = [pattern]
+        paths.extend(sorted(matches))
+
+    # Keep the order given, but only analyze each file once
+    return list(dict.fromkeys(paths))
+
+def analyze_sls_dump(path, cache_dir=None):
+    '''
+    Run the cabinet, NID and VLAN reports and the validation checks against a
+    single SLS dump. Runs in a worker process, so only a small summary that is
+    cheap to send back is returned, never the model itself. A dump that can not
+    be loaded or analyzed is reported in the summary's error field, so it does
+    not stop the rest of the fleet.
+    '''
+    summary = _empty_summary(path)
+    try:
+        _analyze_sls_model(load_sls_model(path, cache_dir=cache_dir), summary)
+    except Exception as err:
+        # Drop whatever was filled in before the failure
+        summary = _empty_summary(path)
+        summary["error"] = "{}: {}".format(type(err).__name__, err)
+
+    return summary
+
+def _empty_summary(path):
+    summary = {field: 0 for field in SUMMARY_FIELDS}
+    summary.update(path=path, first_nid=None, last_nid=None, cabinet_records=[], issues=[], error=None)
+    return summary
+
+def _analyze_sls_model(model, summary):
+    cabinets = find_cabinets(model)
+    classes = collections.Counter(cabinet["class"] for cabinet in cabinets)
+    vlans = set()
+    for cabinet in cabinets:
+        vlans.update(cabinet[key] for key in ("hmn_vlan", "nmn_vlan") if cabinet.get(key) is not None)
+
+        nids = cabinet["nids"]
+        summary["nodes"] += len(nids)
+        if len(nids):
+            summary["first_nid"] = nids[0] if summary["first_nid"] is None else min(summary["first_nid"], nids[0])
+            summary["last_nid"] = nids[-1] if summary["last_nid"] is None else max(summary["last_nid"], nids[-1])
+
+    summary["cabinets"] = len(cabinets)
+    summary["mountain"] = classes["Mountain"]
+    summary["hill"] = classes["Hill"]
+    summary["river"] = classes["River"]
+    summary["vlans"] = len(vlans)
+    summary["cabinet_records"] = [cabinet_record(cabinet) for cabinet in cabinets]
+
+    issues = validate_sls_model(model)
+    summary["errors"] = sum(1 for issue in issues if issue.severity == ERROR)
+    summary["warnings"] = sum(1 for issue in issues if issue.severity == WARNING)
+    summary["issues"] = [tuple(issue) for issue in issues]
+
+def merge_summaries(summaries):
+    '''
+    Totals over every analyzed dump. Dumps that could not be loaded or
+    analyzed are only counted as failed.
+    '''
+    loaded = [summary for summary in summaries if summary["error"] is None]
+    totals = {field: sum(summary[field] for summary in loaded) for field in SUMMARY_FIELDS if field not in ("path", "first_nid", "last_nid")}
+    totals["systems"] = len(summaries)
+    totals["failed"] = len(summaries) - len(loaded)
+
+    return totals
+
+def format_table(summaries, totals):
+    lines = [
+        "=================================",
+        "SLS Fleet Summary",
+        "=================================",
+        "SLS State File                 | Cabinets | Mountain | Hill  | River | Nodes    | NID Range          | VLANs | Errors | Warnings",
+        "-------------------------------|----------|----------|-------|-------|----------|--------------------|-------|--------|---------",
+    ]
+    for summary in summaries:
+        if summary["error"] is not None:
+            lines.append("{:<31}| failed: {}".format(summary["path"], summary["error"]))
+            continue
+
+        nid_range = "{}-{}".format(summary["first_nid"], summary["last_nid"]) if summary["nodes"] else ""
+        lines.append("{:<31}| {:<9}| {:<9}| {:<6}| {:<6}| {:<9}| {:<19}| {:<6}| {:<7}| {}".format(
+            summary["path"], summary["cabinets"], summary["mountain"], summary["hill"], summary["river"],
+            summary["nodes"], nid_range, summary["vlans"], summary["errors"], summary["warnings"]))
+
+    lines.append("-------------------------------|----------|----------|-------|-------|----------|--------------------|-------|--------|---------")
+    lines.append("{:<31}| {:<9}| {:<9}| {:<6}| {:<6}| {:<9}| {:<19}| {:<6}| {:<7}| {}".format(
+        "Total ({} systems)".format(totals["systems"]), totals["cabinets"], totals["mountain"], totals["hill"], totals["river"],
+        totals["nodes"], "", totals["vlans"], totals["errors"], totals["warnings"]))
+
+    issues = [(summary["path"], severity, message) for summary in summaries for severity, message in summary["issues"]]
+    if issues:
+        lines.append("")
+        lines.append("=================================")
+        lines.append("Issues")
+        lines.append("=================================")
+        for path, severity, message in issues:
+            lines.append("{}: {} {}".format(path, "Error" if severity == ERROR else "Warning", message))
+
+    return "\n".join(lines)
+
+def format_json(summaries, totals):
+    systems = []
+    for summary in summaries:
+        system = {field: summary[field] for field in SUMMARY_FIELDS}
+        system["error"] = summary["error"]
+        system["cabinet_details"] = summary["cabinet_records"]
+        system["issues"] = [{"severity": severity, "message": message} for severity, message in summary["issues"]]
+        systems.append(system)
+
+    return json.dumps({"totals": totals, "systems": systems}, indent=2)
+
+def format_csv(summaries):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=SUMMARY_FIELDS + ["error"], extrasaction="ignore", lineterminator="\n")
+    writer.writeheader()
+    for summary in summaries:
+        writer.writerow(summary)
+
+    return output.getvalue()
@@ -0,0 +1,330 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+import contextlib
+import gc
+import json
+import os
+import re
+import shutil
+import tempfile
+
+CHUNK_SIZE = 1 << 20
+STREAMING_THRESHOLD = 64 << 20
+
+# Top level sections of a SLS dump that are read and written one entry at a time
+STREAMED_SECTIONS = ("Hardware", "Networks")
+
+WHITESPACE_REGEX = re.compile(r"[ \t\n\r]*")
+KEY_REGEX = re.compile(r'[ \t\n\r]*"((?:[^"\\]|\\.)*)"[ \t\n\r]*:[ \t\n\r]*')
+SEPARATOR_REGEX = re.compile(r"[ \t\n\r]*([,}])")
+NUMBER_CHARS = "0123456789.eE+-"
+
+class _StreamReader:
+    '''
+    Incremental JSON reader over a file. Only the current chunk of the file is
+    held in memory, and values are decoded one at a time with the C decoder
+    from the standard json module.
+    '''
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _match(self, regex):
+        '''
+        Match regex at the current position, reading more of the file when the
+        match could continue past the end of the buffer
+        '''
+        while True:
+            match = regex.match(self.buf, self.pos)
+            if match is not None and match.end() < len(self.buf):
+                return match
+            if not self._fill():
+                return match
+
+    def peek(self):
+        self.pos = self._match(WHITESPACE_REGEX).end()
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError("Expected '{}' but found '{}' while reading SLS state".format(char, found))
+        self.pos += 1
+
+    def value(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    self.pos = WHITESPACE_REGEX.match(self.buf, self.pos).end()
+                    continue
+                raise
+
+            # A number at the end of the buffer may continue in the next chunk
+            if (end == len(self.buf) or self.buf[end] in NUMBER_CHARS) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def object_items(self):
+        '''
+        Yield the keys of the object at the current position. The caller reads
+        the value of each key before advancing the generator.
+        '''
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            match = self._match(KEY_REGEX)
+            if match is None:
+                raise ValueError("Expected an object key at offset {} while reading SLS state".format(self.pos))
+            self.pos = match.end()
+
+            key = match.group(1)
+            if "\\" in key:
+                key = json.loads('"{}"'.format(key))
+            yield key
+
+            match = self._match(SEPARATOR_REGEX)
+            if match is None:
+                raise ValueError("Expected ',' or '}}' at offset {} while reading SLS state".format(self.pos))
+            self.pos = match.end()
+            if match.group(1) == "}":
+                return
+
+def _share_keys(value, memo):
+    '''
+    Each entry is decoded on its own, so unlike json.load the object keys are
+    not shared between entries. Share them here to keep the memory used by
+    many small hardware objects down.
+    '''
+    if type(value) is not dict:
+        return value
+    return {memo.setdefault(key, key): _share_keys(item, memo) for key, item in value.items()}
+
+def iter_sls_state(path):
+    '''
+    Stream a SLS dump, yielding (section, key, value) tuples. Entries of the
+    Hardware and Networks sections are yielded one at a time with the section
+    name, any other top level value is yielded as (key, None, value).
+    '''
+    key_memo = {}
+    with open(path) as f:
+        reader = _StreamReader(f)
+        for section in reader.object_items():
+            if section in STREAMED_SECTIONS and reader.peek() == "{":
+                for key in reader.object_items():
+                    yield section, key, _share_keys(reader.value(), key_memo)
+            else:
+                yield section, None, reader.value()
+
+@contextlib.contextmanager
+def paused_gc():
+    '''
+    Loading a dump creates millions of small containers and none of them can be
+    garbage yet, so the cyclic garbage collector only adds overhead while it
+    runs. Afterwards everything is moved to the permanent generation so later
+    collections do not walk the loaded state again. Reference counting still
+    frees those objects as usual.
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.freeze()
+        if enabled:
+            gc.enable()
+
+def load_sls_state(path, stream=None):
+    '''
+    Load a SLS dump. Dumps larger than STREAMING_THRESHOLD are streamed one
+    entry at a time, so the text of the file is never held in memory next to
+    the decoded objects. That is about 3x slower than json.load, so smaller
+    dumps are read with json.load.
+    '''
+    if stream is None:
+        stream = os.path.getsize(path) > STREAMING_THRESHOLD
+
+    if not stream:
+        with open(path) as f, paused_gc():
+            return json.load(f)
+
+    sls_state = {}
+    with paused_gc():
+        for section, key, value in iter_sls_state(path):
+            if key is None:
+                sls_state[section] = value
+            else:
+                sls_state.setdefault(section, {})[key] = value
+
+    for section in STREAMED_SECTIONS:
+        sls_state.setdefault(section, {})
+
+    return sls_state
+
+INDENTED_ENCODER = json.JSONEncoder(indent=2)
+COMPACT_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+def _write_entries(f, entries, compact):
+    '''
+    Write the items of a dict one at a time, in the same format as json.dump
+    with indent=2 or with compact separators
+    '''
+    encode_key = COMPACT_ENCODER.encode
+    if compact:
+        encode = COMPACT_ENCODER.encode
+        separator, entry_format = ",", "{}:{}"
+    else:
+        encode = INDENTED_ENCODER.encode
+        separator, entry_format = ",", "\n    {}: {}"
+
+    first = True
+    for key, value in entries.items():
+        if not first:
+            f.write(separator)
+        text = encode(value)
+        if not compact and "\n" in text:
+            text = text.replace("\n", "\n    ")
+        f.write(entry_format.format(encode_key(key), text))
+        first = False
+
+    return not first
+
+def _replace(tmp_path, path):
+    '''
+    Rename a fully written temporary file over path, keeping the permissions of
+    the file being replaced
+    '''
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+    os.replace(tmp_path, path)
+
+def _write_streamed(f, sls_state, compact):
+    f.write("{")
+    first = True
+    for section, value in sls_state.items():
+        f.write("" if first else ",")
+        if not compact:
+            f.write("\n  ")
+        f.write(COMPACT_ENCODER.encode(section) + (":" if compact else ": "))
+
+        if section in STREAMED_SECTIONS and hasattr(value, "items"):
+            f.write("{")
+            if _write_entries(f, value, compact) and not compact:
+                f.write("\n  ")
+            f.write("}")
+        elif compact:
+            f.write(COMPACT_ENCODER.encode(value))
+        else:
+            f.write(INDENTED_ENCODER.encode(value).replace("\n", "\n  "))
+        first = False
+
+    if not first and not compact:
+        f.write("\n")
+    f.write("}")
+
+def write_sls_state(path, sls_state, compact=False):
+    '''
+    Write a SLS dump. The dump is written to a temporary file in the same
+    directory that is renamed over path once complete, so an interrupted write
+    never leaves a partial SLS state file behind.
+
+    The indented format is written with json.dump. Compact dumps are written one
+    entry at a time with the C encoder, which is faster than json.dump. The
+    Hardware and Networks sections may also be any object with an items method,
+    so large sections can be generated while they are written.
+    '''
+    streamed = compact or any(
+        section in STREAMED_SECTIONS and not isinstance(value, dict) for section, value in sls_state.items()
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(path)), dir=directory)
+    try:
+        with os.fdopen(fd, "w", buffering=CHUNK_SIZE) as f:
+            if streamed:
+                _write_streamed(f, sls_state, compact)
+            else:
+                json.dump(sls_state, f, indent=2)
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        _replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def write_sls_delta(path, delta):
+    '''
+    Atomically write a JSON Patch style changeset built by SLSModel.build_delta
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(path)), dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(delta, f, indent=2)
+        _replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def read_sls_delta(path):
+    with open(path) as f:
+        delta = json.load(f)
+
+    for operation in delta:
+        if operation.get("op") not in ("add", "replace") or "value" not in operation:
+            raise ValueError("Unsupported SLS delta operation: {}".format(operation))
+
+        _, section, name = operation["path"].split("/", 2)
+        if section not in STREAMED_SECTIONS:
+            raise ValueError("Unsupported SLS delta path: {}".format(operation["path"]))
+
+    return delta
@@ -0,0 +1,140 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import atexit
+import cProfile
+import datetime
+import json
+import resource
+import sys
+import time
+
+# Metrics waiting for their report at exit
+_pending = []
+
+def max_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def add_metrics_arguments(parser):
+    '''
+    Add the --timings, --profile and --metrics-file flags shared by the SLS scripts
+    '''
+    parser.add_argument("--timings", action="store_true", help="Print the wall time, CPU time and peak memory of each phase of the script")
+    parser.add_argument("--profile", type=str, help="Write cProfile output of the script to this file, for use with pstats or snakeviz")
+    parser.add_argument("--metrics-file", type=str, help="Write the timings of each phase as JSON to this file")
+
+class Metrics:
+    '''
+    Wall time, CPU time and peak RSS of the phases of a script. A phase lasts
+    until the next one begins. The report is made when the interpreter exits,
+    so it is also made when a script exits early with an error.
+    '''
+
+    def __init__(self, script, timings=False, profile=None, metrics_file=None):
+        self.script = script
+        self.timings = timings
+        self.profile_file = profile
+        self.metrics_file = metrics_file
+
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.phases = []
+        self.current = None
+
+        self.profiler = None
+        if profile is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        if timings or profile is not None or metrics_file is not None:
+            atexit.register(self.finish)
+            _pending.append(self)
+
+    @classmethod
+    def from_args(cls, script, args):
+        return cls(script, timings=args.timings, profile=args.profile, metrics_file=args.metrics_file)
+
+    def begin(self, name):
+        '''
+        End the current phase and start a new one
+        '''
+        self.end()
+        self.current = (name, time.perf_counter(), time.process_time())
+
+    def end(self):
+        if self.current is None:
+            return
+
+        name, start_wall, start_cpu = self.current
+        self.phases.append({
+            "name": name,
+            "wall_seconds": round(time.perf_counter() - start_wall, 4),
+            "cpu_seconds": round(time.process_time() - start_cpu, 4),
+            "max_rss_mb": max_rss_mb(),
+        })
+        self.current = None
+
+    def to_dict(self):
+        return {
+            "script": self.script,
+            "argv": sys.argv[1:],
+            "started": self.started.isoformat(),
+            "wall_seconds": round(time.perf_counter() - self.start_wall, 4),
+            "cpu_seconds": round(time.process_time() - self.start_cpu, 4),
+            "max_rss_mb": max_rss_mb(),
+            "phases": self.phases,
+        }
+
+    def finish(self):
+        if self in _pending:
+            _pending.remove(self)
+        self.end()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+
+        metrics = self.to_dict()
+
+        if self.metrics_file is not None:
+            with open(self.metrics_file, "w") as f:
+                json.dump(metrics, f, indent=2)
+
+        # Timings go to stderr so they do not mix with JSON or CSV output
+        if self.timings:
+            print("", file=sys.stderr)
+            print("Phase                | Wall       | CPU        | Max RSS", file=sys.stderr)
+            print("---------------------|------------|------------|------------", file=sys.stderr)
+            for phase in self.phases + [dict(metrics, name="total")]:
+                print("{:<21}| {:>9.3f}s | {:>9.3f}s | {:>8.1f}MB".format(phase["name"], phase["wall_seconds"], phase["cpu_seconds"], phase["max_rss_mb"]), file=sys.stderr)
+
+def flush_metrics():
+    '''
+    Report the pending metrics now instead of at exit. A long running process
+    that runs scripts in-process, like the SLS workspace, calls this after each
+    script.
+    '''
+    while _pending:
+        metrics = _pending[-1]
+        atexit.unregister(metrics.finish)
+        metrics.finish()
@@ -0,0 +1,218 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+import copy
+from sls_xname import XnameIndex
+
+class SLSModel:
+    '''
+    In-memory view of a SLS state dump with indexes that are built once at
+    load time and kept up to date as hardware is added.
+
+    The underlying SLS state dict is modified in place, so it can be written
+    back out as-is after any changes.
+    '''
+
+    def __init__(self, sls_state):
+        self.state = sls_state
+        self.hardware = sls_state["Hardware"]
+        self.networks = sls_state["Networks"]
+
+        self.by_type = {}     # Type -> [xname]
+        self.children = {}    # Parent xname -> [xname]
+        self.by_alias = {}    # Alias -> [xname]
+        self.by_nid = {}      # NID -> [xname]
+
+        # Sorted xname index, only built once a subtree query is made
+        self._xname_index = None
+
+        # Hardware and networks that were added or modified since the dump was
+        # loaded, in the order they were changed. Maps the name to the JSON Patch
+        # operation for the change, either add or replace.
+        self.changed_hardware = {}
+        self.changed_networks = {}
+
+        for xname, hardware in self.hardware.items():
+            self._index_hardware(xname, hardware)
+
+    def _index_hardware(self, xname, hardware):
+        self.by_type.setdefault(hardware["Type"], []).append(xname)
+
+        if "Parent" in hardware:
+            self.children.setdefault(hardware["Parent"], []).append(xname)
+
+        extraProperties = hardware.get("ExtraProperties", {})
+        for alias in extraProperties.get("Aliases", []):
+            self.by_alias.setdefault(alias, []).append(xname)
+
+        if hardware["Type"] == "comptype_node" and "NID" in extraProperties:
+            self.by_nid.setdefault(extraProperties["NID"], []).append(xname)
+
+    def add_hardware(self, hardware):
+        '''
+        Add a hardware object to the SLS state and update all of the indexes
+        '''
+        xname = hardware["Xname"]
+        if xname in self.hardware:
+            raise KeyError(xname)
+
+        self.hardware[xname] = hardware
+        self._index_hardware(xname, hardware)
+        if self._xname_index is not None:
+            self._xname_index.add(xname)
+        self.changed_hardware[xname] = "add"
+
+    def _remove_hardware(self, xnames):
+        '''
+        Remove hardware objects and their index entries. Each index list is
+        filtered once, however many objects are removed.
+        '''
+        removed = {}
+        for xname in xnames:
+            removed[xname] = self.hardware.pop(xname)
+
+        def remove(index, key):
+            remaining = [xname for xname in index.get(key, []) if xname not in removed]
+            if remaining:
+                index[key] = remaining
+            else:
+                index.pop(key, None)
+
+        for hardware in removed.values():
+            remove(self.by_type, hardware["Type"])
+            if "Parent" in hardware:
+                remove(self.children, hardware["Parent"])
+
+            extraProperties = hardware.get("ExtraProperties", {})
+            for alias in extraProperties.get("Aliases", []):
+                remove(self.by_alias, alias)
+            if "NID" in extraProperties:
+                remove(self.by_nid, extraProperties["NID"])
+
+        if self._xname_index is not None:
+            self._xname_index.remove(removed)
+
+    def mark_hardware_changed(self, xname):
+        self.changed_hardware.setdefault(xname, "replace")
+
+    def add_network(self, network):
+        name = network["Name"]
+        self.changed_networks[name] = "replace" if name in self.networks else "add"
+        self.networks[name] = network
+
+    def mark_network_changed(self, name):
+        self.changed_networks.setdefault(name, "replace")
+
+    def checkpoint(self):
+        '''
+        Record the networks and the changes made so far, so that any changes
+        made afterwards can be undone with rollback. Hardware added afterwards is
+        removed on rollback, changes made in place to hardware that already
+        existed are not undone.
+        '''
+        return copy.deepcopy(self.networks), dict(self.changed_hardware), dict(self.changed_networks)
+
+    def rollback(self, checkpoint):
+        networks, changed_hardware, changed_networks = checkpoint
+
+        added = [xname for xname, op in self.changed_hardware.items() if op == "add" and xname not in changed_hardware]
+        self._remove_hardware(added)
+
+        # Update the networks dict in place, it is shared with the SLS state
+        self.networks.clear()
+        self.networks.update(networks)
+
+        self.changed_hardware = changed_hardware
+        self.changed_networks = changed_networks
+
+    def clear_changes(self):
+        self.changed_hardware = {}
+        self.changed_networks = {}
+
+    def build_delta(self):
+        '''
+        JSON Patch style list of operations with every hardware and network
+        object that was added or changed since the dump was loaded
+        '''
+        delta = []
+        for name, op in self.changed_networks.items():
+            delta.append({
+                "op": op,
+                "path": "/Networks/{}".format(name),
+                "value": self.networks[name],
+            })
+
+        for xname, op in self.changed_hardware.items():
+            delta.append({
+                "op": op,
+                "path": "/Hardware/{}".format(xname),
+                "value": self.hardware[xname],
+            })
+
+        return delta
+
+    def hardware_of_type(self, *types):
+        for hardware_type in types:
+            for xname in self.by_type.get(hardware_type, []):
+                yield self.hardware[xname]
+
+    def get_children(self, xname):
+        return self.children.get(xname, [])
+
+    def alias_owners(self, alias):
+        return self.by_alias.get(alias, [])
+
+    def nid_owners(self, nid):
+        return self.by_nid.get(nid, [])
+
+    @property
+    def xname_index(self):
+        if self._xname_index is None:
+            self._xname_index = XnameIndex(self.hardware)
+        return self._xname_index
+
+    def subtree(self, xname):
+        '''
+        Xnames of the hardware at and below xname, in numeric order
+        '''
+        return self.xname_index.subtree(xname)
+
+    def cabinet_hardware(self, cabinet_xname):
+        return self.subtree(cabinet_xname)
+
+    def cabinet_nids(self, cabinet_xname):
+        '''
+        Sorted list of node NIDs contained within a cabinet
+        '''
+        nids = []
+        for xname in self.cabinet_hardware(cabinet_xname):
+            hardware = self.hardware[xname]
+            if hardware["Type"] != "comptype_node":
+                continue
+
+            nid = hardware.get("ExtraProperties", {}).get("NID")
+            if nid is not None:
+                nids.append(nid)
+
+        nids.sort()
+
+        return nids
@@ -0,0 +1,165 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+import csv
+import io
+import json
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from sls_xname import parse_xname, xname_letters, xname_sort_key
+
+CABINET_NETWORKS = [("HMN_MTN", "NMN_MTN"), ("HMN_RVR", "NMN_RVR")]
+
+CSV_FIELDS = ["xname", "class", "nid_ranges", "hmn_vlan", "hmn_cidr", "nmn_vlan", "nmn_cidr"]
+
+def compress_nid_ranges(nids):
+    '''
+    Compress a sorted sequence of NIDs into (first, last) pairs of consecutive
+    NIDs. The breaks between runs are found with a single pass over adjacent
+    pairs instead of grouping every NID.
+    '''
+    if len(nids) == 0:
+        return []
+
+    breaks = [i for i, (a, b) in enumerate(zip(nids, islice(nids, 1, None)), start=1) if b - a != 1]
+    starts = [0] + breaks
+    ends = breaks + [len(nids)]
+
+    return [(nids[start], nids[end - 1]) for start, end in zip(starts, ends)]
+
+def get_nid_ranges(nids):
+    '''
+    Create a nicely formated array of nid ranges
+    '''
+    ranges = []
+    for first, last in compress_nid_ranges(nids):
+        if first == last:
+            ranges.append(str(first))
+        else:
+            ranges.append("{}-{}".format(first, last))
+
+    return ranges
+
+def parse_range(value):
+    '''
+    Parse a range given on the command line, ex: 1000-1999 or 1000. Xname ranges
+    like x1000-x1999 are accepted as well.
+    '''
+    first, _, last = value.partition("-")
+    first = int(first.lstrip("x"))
+    last = int(last.lstrip("x")) if last else first
+
+    return first, last
+
+def find_cabinets(model):
+    '''
+    Build a record for every cabinet that has a HMN and NMN cabinet subnet. NIDs
+    are kept as a sorted integer array for range queries.
+    '''
+    allNetworks = model.networks
+
+    cabinets = {}
+    for hmnNetwork, nmnNetwork in CABINET_NETWORKS:
+        if hmnNetwork not in allNetworks or nmnNetwork not in allNetworks:
+            continue
+
+        for subnet in allNetworks[hmnNetwork]["ExtraProperties"]["Subnets"]:
+            xname = subnet["Name"].replace("cabinet_", "x")
+
+            cabinet = cabinets.setdefault(xname, {"xname": xname})
+            cabinet["hmn_vlan"] = subnet["VlanID"]
+            cabinet["hmn_cidr"] = subnet["CIDR"]
+
+        for subnet in allNetworks[nmnNetwork]["ExtraProperties"]["Subnets"]:
+            xname = subnet["Name"].replace("cabinet_", "x")
+
+            cabinet = cabinets.setdefault(xname, {"xname": xname})
+            cabinet["nmn_vlan"] = subnet["VlanID"]
+            cabinet["nmn_cidr"] = subnet["CIDR"]
+
+    for xname, cabinet in cabinets.items():
+        cabinet["class"] = model.hardware.get(xname, {}).get("Class")
+        cabinet["nids"] = array("q", model.cabinet_nids(xname))
+        cabinet["nid_ranges"] = get_nid_ranges(cabinet["nids"])
+
+    return [cabinets[xname] for xname in sorted(cabinets, key=xname_sort_key)]
+
+class CabinetQuery:
+    '''
+    Filters over cabinet records. Each filter that is left as None matches
+    every cabinet.
+    '''
+
+    def __init__(self, classes=None, xname_range=None, vlan_range=None, nid_range=None):
+        self.classes = set(classes) if classes else None
+        self.xname_range = xname_range
+        self.vlan_range = vlan_range
+        self.nid_range = nid_range
+
+    def matches(self, cabinet):
+        if self.classes is not None and cabinet["class"] not in self.classes:
+            return False
+
+        if self.xname_range is not None:
+            first, last = self.xname_range
+            # Names that are not cabinet xnames are never within a range
+            key = parse_xname(cabinet["xname"])
+            if key is None or xname_letters(key) != "x" or not first <= key[1] <= last:
+                return False
+
+        if self.vlan_range is not None:
+            first, last = self.vlan_range
+            vlans = [cabinet.get("hmn_vlan"), cabinet.get("nmn_vlan")]
+            if not any(vlan is not None and first <= vlan <= last for vlan in vlans):
+                return False
+
+        if self.nid_range is not None:
+            first, last = self.nid_range
+            nids = cabinet["nids"]
+            i = bisect_left(nids, first)
+            if i == len(nids) or nids[i] > last:
+                return False
+
+        return True
+
+    def filter(self, cabinets):
+        return [cabinet for cabinet in cabinets if self.matches(cabinet)]
+
+def cabinet_record(cabinet):
+    record = {field: cabinet.get(field) for field in CSV_FIELDS}
+    record["nid_count"] = len(cabinet["nids"])
+    return record
+
+def format_json(cabinets):
+    return json.dumps([cabinet_record(cabinet) for cabinet in cabinets], indent=2)
+
+def format_csv(cabinets):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=CSV_FIELDS, extrasaction="ignore", lineterminator="\n")
+    writer.writeheader()
+    for cabinet in cabinets:
+        record = cabinet_record(cabinet)
+        record["nid_ranges"] = " ".join(record["nid_ranges"])
+        writer.writerow(record)
+
+    return output.getvalue()
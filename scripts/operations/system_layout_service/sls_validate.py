@@ -0,0 +1,179 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import collections
+import netaddr
+
+ERROR = "error"
+WARNING = "warning"
+
+# Networks holding a subnet per cabinet, the VLAN of each cabinet subnet has to be
+# unique across all of them
+CABINET_NETWORKS = ["HMN_MTN", "NMN_MTN", "HMN_RVR", "NMN_RVR"]
+
+# Subnets spanning the supernet of a network, other address pools of the same
+# network are carved out of them
+SUPERNET_SUBNETS = {"bootstrap_dhcp", "network_hardware"}
+
+Issue = collections.namedtuple("Issue", ["severity", "message"])
+
+def _parse_cidr(cidr):
+    try:
+        network = netaddr.IPNetwork(cidr)
+    except (netaddr.AddrFormatError, TypeError, ValueError):
+        return None
+    return network.first, network.last
+
+def find_overlaps(intervals):
+    '''
+    Sweep over (first, last, label, ...) intervals sorted by their start, keeping a
+    stack of the intervals that contain the current position. Yields
+    (outer, inner, nested) for every interval that overlaps an earlier one, where
+    nested is True when inner lies completely within outer.
+    '''
+    stack = []
+    for interval in sorted(intervals, key=lambda interval: (interval[0], -interval[1])):
+        first, last = interval[:2]
+
+        # Intervals ending before this one starts can not overlap anything else
+        while stack and stack[-1][1] < first:
+            stack.pop()
+
+        # Intervals ending inside this one partially overlap it. Any later
+        # interval overlapping them also overlaps this one, so they are dropped.
+        while stack and stack[-1][1] < last:
+            yield stack.pop(), interval, False
+
+        if stack:
+            yield stack[-1], interval, True
+
+        stack.append(interval)
+
+def _check_unique(index, description, issues):
+    for key, xnames in index.items():
+        if len(xnames) > 1:
+            issues.append(Issue(ERROR, "Found duplicate {} {} on {}".format(description, key, ", ".join(sorted(xnames)))))
+
+def _check_subnet(network_name, subnet, network_range, issues):
+    subnet_range = _parse_cidr(subnet.get("CIDR"))
+    if subnet_range is None:
+        issues.append(Issue(ERROR, "Subnet {} in {} has an invalid CIDR {}".format(subnet.get("Name"), network_name, subnet.get("CIDR"))))
+        return None
+
+    if network_range is not None and not (network_range[0] <= subnet_range[0] and subnet_range[1] <= network_range[1]):
+        issues.append(Issue(ERROR, "Subnet {} {} is outside of the {} network".format(subnet["Name"], subnet["CIDR"], network_name)))
+
+    reserved = {}
+    for reservation in subnet.get("IPReservations") or []:
+        try:
+            ip = int(netaddr.IPAddress(reservation.get("IPAddress")))
+        except (netaddr.AddrFormatError, TypeError, ValueError):
+            issues.append(Issue(ERROR, "IP reservation {} in subnet {} of {} has an invalid IP {}".format(reservation.get("Name"), subnet["Name"], network_name, reservation.get("IPAddress"))))
+            continue
+
+        if not subnet_range[0] <= ip <= subnet_range[1]:
+            issues.append(Issue(ERROR, "IP reservation {} with IP {} is outside of subnet {} {} in {}".format(reservation.get("Name"), reservation["IPAddress"], subnet["Name"], subnet["CIDR"], network_name)))
+
+        if ip in reserved:
+            issues.append(Issue(ERROR, "IP reservations {} and {} in subnet {} of {} have the same IP {}".format(reserved[ip], reservation.get("Name"), subnet["Name"], network_name, reservation["IPAddress"])))
+        else:
+            reserved[ip] = reservation.get("Name")
+
+    return subnet_range
+
+def validate_sls_model(model):
+    '''
+    Check the invariants of a SLS state in one pass, returning a list of issues.
+    Uniqueness of NIDs and aliases comes from the model indexes, overlapping
+    CIDRs are found with a sweep over the sorted network and subnet ranges.
+    '''
+    issues = []
+
+    #
+    # Hardware
+    #
+    _check_unique(model.by_nid, "NID", issues)
+    _check_unique(model.by_alias, "alias", issues)
+
+    #
+    # Networks
+    #
+    cabinet_vlans = {}
+    network_intervals = []
+    for network_name, network in model.networks.items():
+        extraProperties = network.get("ExtraProperties") or {}
+
+        network_range = None
+        if extraProperties.get("CIDR"):
+            network_range = _parse_cidr(extraProperties["CIDR"])
+            if network_range is None:
+                issues.append(Issue(ERROR, "Network {} has an invalid CIDR {}".format(network_name, extraProperties["CIDR"])))
+            else:
+                network_intervals.append((network_range[0], network_range[1], "{} {}".format(network_name, extraProperties["CIDR"])))
+
+        subnet_intervals = []
+        for subnet in extraProperties.get("Subnets") or []:
+            subnet_range = _check_subnet(network_name, subnet, network_range, issues)
+            if subnet_range is not None:
+                subnet_intervals.append((subnet_range[0], subnet_range[1], "{} {}".format(subnet["Name"], subnet["CIDR"]), subnet["Name"]))
+
+            if network_name in CABINET_NETWORKS and subnet.get("Name", "").startswith("cabinet_"):
+                cabinet_vlans.setdefault(subnet.get("VlanID"), []).append("{} in {}".format(subnet["Name"], network_name))
+
+        # Subnets of a network are address pools that may only share addresses
+        # when one of them is a supernet subnet the other is carved out of
+        for outer, inner, nested in find_overlaps(subnet_intervals):
+            if nested and (outer[3] in SUPERNET_SUBNETS or (outer[:2] == inner[:2] and inner[3] in SUPERNET_SUBNETS)):
+                continue
+            issues.append(Issue(ERROR, "Subnet {} overlaps subnet {} in {}".format(inner[2], outer[2], network_name)))
+
+    for outer, inner, nested in find_overlaps(network_intervals):
+        if nested:
+            issues.append(Issue(WARNING, "Network {} is nested within network {}".format(inner[2], outer[2])))
+        else:
+            issues.append(Issue(ERROR, "Network {} overlaps network {}".format(inner[2], outer[2])))
+
+    for vlan, subnets in cabinet_vlans.items():
+        if len(subnets) > 1:
+            issues.append(Issue(ERROR, "Found duplicate cabinet VLAN {} with subnets {}".format(vlan, ", ".join(subnets))))
+
+    return issues
+
+def check_sls_changes(model, baseline):
+    '''
+    Validate a modified SLS model before it is written out. Issues already
+    present in the baseline, the result of validate_sls_model on the state as it
+    was loaded, are not caused by the changes and are not reported again.
+    Returns False if the changes introduced any errors.
+    '''
+    baseline = set(baseline)
+
+    ok = True
+    for issue in validate_sls_model(model):
+        if issue.severity == ERROR and issue not in baseline:
+            print("Error {}".format(issue.message))
+            ok = False
+        elif issue not in baseline:
+            print("Warning {}".format(issue.message))
+
+    return ok
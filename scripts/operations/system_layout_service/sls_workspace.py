@@ -0,0 +1,363 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import contextlib
+import io
+import json
+import os
+import runpy
+import socket
+import socketserver
+import sys
+import traceback
+from sls_cache import load_sls_model
+from sls_io import write_sls_delta, write_sls_state
+from sls_metrics import flush_metrics
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Scripts that can be run inside a workspace, and the ones among them that change the SLS state
+WORKSPACE_SCRIPTS = ["add_cdu_switch.py", "add_liquid_cooled_cabinet.py", "inspect_sls_cabinets.py", "validate_sls.py"]
+MODIFYING_SCRIPTS = ["add_cdu_switch.py", "add_liquid_cooled_cabinet.py"]
+
+# The workspace running a script in this process, if any
+_workspace = None
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+class LoadedDump:
+    '''
+    A SLS dump held in a workspace, with the size and modification time of the
+    file when it was loaded so changes made on disk behind its back are noticed
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.model = load_sls_model(path)
+        self.model.xname_index
+        self.stat = _file_stat(path)
+        self.dirty = False
+        # Set when a staged change asked for the file to be written without indentation
+        self.compact = False
+
+    def changed_on_disk(self):
+        try:
+            return _file_stat(self.path) != self.stat
+        except FileNotFoundError:
+            return True
+
+class Workspace:
+    '''
+    Parsed and indexed SLS dumps kept in memory between commands. Scripts run
+    inside the workspace read the in-memory model instead of the file, and
+    their changes are only written to disk on commit. A command that fails is
+    rolled back, so the workspace never holds half of a change.
+    '''
+
+    def __init__(self):
+        self.dumps = {}
+        self.checkpoints = None
+        self.stopped = False
+
+    def get(self, path):
+        path = os.path.realpath(path)
+        dump = self.dumps.get(path)
+        if dump is None or (not dump.dirty and dump.changed_on_disk()):
+            dump = LoadedDump(path)
+            self.dumps[path] = dump
+
+        if self.checkpoints is not None and path not in self.checkpoints:
+            self.checkpoints[path] = dump.model.checkpoint()
+
+        return dump
+
+    def run(self, script, argv, cwd):
+        global _workspace
+
+        if script not in WORKSPACE_SCRIPTS:
+            return "Error: {} cannot be run in a workspace\n".format(script), 1
+
+        output = io.StringIO()
+        exit_code = 0
+        self.checkpoints = {} if script in MODIFYING_SCRIPTS else None
+
+        saved_argv, saved_cwd = sys.argv, os.getcwd()
+        try:
+            script_path = os.path.join(SCRIPT_DIR, script)
+            sys.argv = [script_path] + argv
+            os.chdir(cwd)
+            _workspace = self
+
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                try:
+                    runpy.run_path(script_path, run_name="__main__")
+                except SystemExit as err:
+                    if isinstance(err.code, str):
+                        print(err.code)
+                        exit_code = 1
+                    else:
+                        exit_code = err.code or 0
+                except Exception:
+                    traceback.print_exc()
+                    exit_code = 1
+
+                flush_metrics()
+
+                if exit_code != 0 and self.checkpoints:
+                    for path, checkpoint in self.checkpoints.items():
+                        self.dumps[path].model.rollback(checkpoint)
+                    print("Rolled back the changes made by {}".format(script))
+        finally:
+            _workspace = None
+            self.checkpoints = None
+            sys.argv = saved_argv
+            os.chdir(saved_cwd)
+
+        return output.getvalue(), exit_code
+
+    def commit(self, path=None, delta_file=None, compact=False, force=False):
+        '''
+        Write the dumps with uncommitted changes, or only the given dump. A dump
+        is written without indentation when compact is set or when any of its
+        staged changes was made with --compact.
+        '''
+        dumps = [dump for dump in self.dumps.values() if dump.dirty]
+        if path is not None:
+            dumps = [dump for dump in dumps if dump.path == os.path.realpath(path)]
+
+        if not dumps:
+            return "No uncommitted changes in the workspace\n", 0
+
+        if delta_file is not None and len(dumps) > 1:
+            return "Error: A delta file can only be written for a single SLS state file, give the file to commit\n", 1
+
+        if not force:
+            changed = [dump.path for dump in dumps if dump.changed_on_disk()]
+            if changed:
+                return "Error: {} changed on disk since it was loaded into the workspace, use --force to overwrite it\n".format(", ".join(changed)), 1
+
+        output = io.StringIO()
+        for dump in dumps:
+            print("Writing updated SLS state to", dump.path, file=output)
+            write_sls_state(dump.path, dump.model.state, compact=compact or dump.compact)
+
+            if delta_file is not None:
+                print("Writing SLS changes to", delta_file, file=output)
+                write_sls_delta(delta_file, dump.model.build_delta())
+
+            dump.model.clear_changes()
+            dump.stat = _file_stat(dump.path)
+            dump.dirty = False
+            dump.compact = False
+
+        return output.getvalue(), 0
+
+    def status(self):
+        output = io.StringIO()
+        if not self.dumps:
+            print("No SLS state files are loaded in the workspace", file=output)
+
+        for dump in self.dumps.values():
+            model = dump.model
+            print("{}: {} hardware, {} networks, {} uncommitted hardware changes, {} uncommitted network changes{}".format(
+                dump.path, len(model.hardware), len(model.networks), len(model.changed_hardware), len(model.changed_networks),
+                ", changed on disk" if dump.changed_on_disk() else ""), file=output)
+
+        return output.getvalue(), 0
+
+    def discard(self):
+        '''
+        Drop uncommitted changes, the dumps are loaded again on their next use
+        '''
+        discarded = [path for path, dump in self.dumps.items() if dump.dirty]
+        for path in discarded:
+            del self.dumps[path]
+
+        return "".join("Discarded uncommitted changes to {}\n".format(path) for path in discarded), 0
+
+    def stop(self, discard=False):
+        dirty = [dump.path for dump in self.dumps.values() if dump.dirty]
+        if dirty and not discard:
+            return "Error: Uncommitted changes to {}, commit them or stop with --discard\n".format(", ".join(dirty)), 1
+
+        self.stopped = True
+        return "Stopping the SLS workspace\n", 0
+
+    def handle(self, request):
+        command = request.get("command")
+        if command == "run":
+            output, exit_code = self.run(request["script"], request["argv"], request["cwd"])
+        elif command == "commit":
+            output, exit_code = self.commit(request.get("path"), request.get("delta_file"), request.get("compact", False), request.get("force", False))
+        elif command == "status":
+            output, exit_code = self.status()
+        elif command == "discard":
+            output, exit_code = self.discard()
+        elif command == "stop":
+            output, exit_code = self.stop(request.get("discard", False))
+        else:
+            output, exit_code = "Error: Unknown workspace command {}\n".format(command), 1
+
+        return {"output": output, "exit_code": exit_code}
+
+def load_model(path, cache_dir=None):
+    '''
+    Load a SLS dump into a SLSModel, or use the model held in memory when
+    running inside a workspace
+    '''
+    if _workspace is not None:
+        return _workspace.get(path).model
+
+    return load_sls_model(path, cache_dir=cache_dir)
+
+def save_model(model, path, compact=False):
+    '''
+    Write the SLS state of a model. Inside a workspace the change is only
+    staged, and the file is written when the workspace is committed.
+    '''
+    if _workspace is not None:
+        dump = _workspace.get(path)
+        dump.dirty = True
+        dump.compact = dump.compact or compact
+        print("Staged the changes to {} in the SLS workspace, they are written to the file on commit".format(path))
+        return
+
+    print("Writing updated SLS state to", path)
+    write_sls_state(path, model.state, compact=compact)
+
+#
+# Client
+#
+
+def send_request(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+
+        with sock.makefile("rb") as f:
+            response = f.readline()
+
+    if not response:
+        raise ConnectionError("The SLS workspace closed the connection without a response")
+
+    return json.loads(response)
+
+def request_workspace(socket_path, request):
+    '''
+    Send a request to a workspace and print its output. Returns the exit code
+    of the request.
+    '''
+    try:
+        response = send_request(socket_path, request)
+    except OSError as err:
+        print("Error: Unable to reach the SLS workspace at {}: {}".format(socket_path, err))
+        return 1
+
+    sys.stdout.write(response["output"])
+    return response["exit_code"]
+
+def _strip_workspace_flag(argv):
+    stripped = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--workspace":
+            skip = True
+        elif not arg.startswith("--workspace="):
+            stripped.append(arg)
+
+    return stripped
+
+def add_workspace_argument(parser):
+    parser.add_argument("--workspace", type=str, help="Run the command in the SLS workspace listening on this socket, see manage_sls_workspace.py")
+
+def run_in_workspace(socket_path, script):
+    '''
+    Hand the command line of a script over to a workspace. Returns the exit
+    code of the command.
+    '''
+    return request_workspace(socket_path, {
+        "command": "run",
+        "script": script,
+        "argv": _strip_workspace_flag(sys.argv[1:]),
+        "cwd": os.getcwd(),
+    })
+
+#
+# Server
+#
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.workspace.handle(request)
+        except (ValueError, KeyError, TypeError) as err:
+            response = {"output": "Error: Invalid workspace request: {}\n".format(err), "exit_code": 1}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+def _socket_in_use(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+
+    return True
+
+def serve_workspace(socket_path, preload=()):
+    '''
+    Serve a workspace on a Unix socket until it is stopped. Requests are
+    handled one at a time, so commands never see each other's partial changes.
+    '''
+    workspace = Workspace()
+    for path in preload:
+        print("Loading", path)
+        workspace.get(path)
+
+    if os.path.exists(socket_path):
+        if _socket_in_use(socket_path):
+            raise OSError("A SLS workspace is already listening on {}".format(socket_path))
+        os.unlink(socket_path)
+
+    # Only the user running the workspace may connect to it
+    umask = os.umask(0o077)
+    try:
+        server = socketserver.UnixStreamServer(socket_path, _RequestHandler)
+    finally:
+        os.umask(umask)
+
+    server.workspace = workspace
+    print("SLS workspace listening on", socket_path)
+    sys.stdout.flush()
+    try:
+        with server:
+            while not workspace.stopped:
+                server.handle_request()
+    finally:
+        os.unlink(socket_path)
@@ -0,0 +1,140 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+import re
+from bisect import bisect_left
+
+XNAME_REGEX = re.compile(r"(?:[a-z]+(?:0|[1-9][0-9]*))+")
+XNAME_TOKEN_REGEX = re.compile(r"([a-z]+)(0|[1-9][0-9]*)")
+
+# Sorts after every xname token letter, used as the upper bound of a subtree
+_SUBTREE_END = "{"
+
+def parse_xname(xname):
+    '''
+    Parse an xname into a tuple alternating between the letters and the
+    integer value of each token, ex: x1000c3s0b1 -> ("x", 1000, "c", 3, "s", 0, "b", 1).
+    The tuples sort numerically, so x9 comes before x1000, and every xname
+    below another one starts with the tuple of its parent. Returns None for
+    strings that are not xnames.
+    '''
+    if XNAME_REGEX.fullmatch(xname) is None:
+        return None
+
+    key = []
+    for letters, number in XNAME_TOKEN_REGEX.findall(xname):
+        key.append(letters)
+        key.append(int(number))
+
+    return tuple(key)
+
+def format_xname(key):
+    return "".join(str(part) for part in key)
+
+def xname_letters(key):
+    '''
+    Letters of each token of a parsed xname, ex: xchs for x3000c0h12s1
+    '''
+    return "".join(key[0::2])
+
+def xname_depth(key):
+    return len(key) // 2
+
+def parent_xname(xname):
+    '''
+    Xname with its last token removed, ex: x3000c0h12s1 -> x3000c0h12
+    '''
+    key = parse_xname(xname)
+    if key is None or len(key) <= 2:
+        return None
+
+    return format_xname(key[:-2])
+
+def xname_sort_key(xname):
+    '''
+    Sort key ordering xnames numerically, strings that are not xnames are
+    sorted after all xnames
+    '''
+    key = parse_xname(xname)
+    if key is None:
+        return (1, xname)
+    return (0, key)
+
+class XnameIndex:
+    '''
+    Sorted index of xnames by their parsed tuple. Everything contained within an
+    xname is a contiguous range of the index, so subtree queries are two binary
+    searches instead of a scan over all hardware.
+    '''
+
+    def __init__(self, xnames=()):
+        entries = []
+        for xname in xnames:
+            key = parse_xname(xname)
+            if key is not None:
+                entries.append((key, xname))
+        entries.sort()
+
+        self.keys = [key for key, _ in entries]
+        self.xnames = [xname for _, xname in entries]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, xname):
+        key = parse_xname(xname)
+        if key is None:
+            return
+
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.xnames.insert(i, xname)
+
+    def remove(self, xnames):
+        '''
+        Remove a collection of xnames with a single pass over the index
+        '''
+        entries = [(key, xname) for key, xname in zip(self.keys, self.xnames) if xname not in xnames]
+        self.keys = [key for key, _ in entries]
+        self.xnames = [xname for _, xname in entries]
+
+    def subtree(self, xname):
+        '''
+        Sorted list of xname and every xname below it, ex: x1000c3 matches
+        x1000c3b0 and x1000c3s0b0n0 but not x1000c30
+        '''
+        key = parse_xname(xname)
+        if key is None:
+            return []
+
+        first = bisect_left(self.keys, key)
+        last = bisect_left(self.keys, key + (_SUBTREE_END,), first)
+        return self.xnames[first:last]
+
+    def range(self, first_xname, last_xname):
+        '''
+        Sorted list of the xnames between two xnames, inclusive, including
+        everything below last_xname
+        '''
+        first = bisect_left(self.keys, parse_xname(first_xname))
+        last = bisect_left(self.keys, parse_xname(last_xname) + (_SUBTREE_END,), first)
+        return self.xnames[first:last]
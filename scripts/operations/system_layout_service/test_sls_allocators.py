@@ -0,0 +1,223 @@
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os
+import sys
+import unittest
+import netaddr
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sls_allocators import AllocationError, IPAllocator, NIDAllocator, SubnetAllocator, VLANAllocator
+
+def ips(*addresses):
+    return [netaddr.IPAddress(address) for address in addresses]
+
+class IPAllocatorTest(unittest.TestCase):
+
+    def subnet(self, cidr="10.0.0.0/29", gateway="10.0.0.1", reservations=()):
+        return IPAllocator.from_sls_subnet({
+            "CIDR": cidr,
+            "Gateway": gateway,
+            "IPReservations": [{"Name": "r{}".format(i), "IPAddress": ip} for i, ip in enumerate(reservations)],
+        })
+
+    def test_network_and_broadcast_are_not_usable(self):
+        allocator = self.subnet()
+        self.assertTrue(allocator.is_reserved("10.0.0.0"))
+        self.assertTrue(allocator.is_reserved("10.0.0.7"))
+        # Same usable range as subnet[1:-2], so the address below broadcast is not handed out either
+        self.assertTrue(allocator.is_reserved("10.0.0.6"))
+        self.assertEqual(allocator.free_count(), 4)
+
+    def test_allocate_skips_gateway_and_reservations(self):
+        allocator = self.subnet(reservations=["10.0.0.2", "10.0.0.4"])
+        self.assertEqual(allocator.allocate_many(2), ips("10.0.0.3", "10.0.0.5"))
+
+    def test_full_pool(self):
+        allocator = self.subnet()
+        allocator.allocate_many(4)
+        self.assertIsNone(allocator.next_free())
+        with self.assertRaises(AllocationError):
+            allocator.allocate()
+
+    def test_allocate_many_leaves_pool_untouched_when_short(self):
+        allocator = self.subnet()
+        with self.assertRaises(AllocationError):
+            allocator.allocate_many(5)
+        self.assertEqual(allocator.free_count(), 4)
+
+    def test_reserve_outside_or_twice_is_a_noop(self):
+        allocator = self.subnet()
+        allocator.reserve("10.0.1.1")
+        allocator.reserve("10.0.0.2")
+        allocator.reserve("10.0.0.2")
+        self.assertEqual(allocator.free_count(), 3)
+
+    def test_allocate_contiguous_skips_fragmented_space(self):
+        allocator = IPAllocator(1, 10)
+        allocator.reserve_range(3, 3)
+        allocator.reserve_range(6, 6)
+        self.assertEqual(allocator.allocate_contiguous(3), ips(7, 8, 9))
+        self.assertEqual(allocator.allocate_contiguous(2), ips(1, 2))
+        self.assertEqual(allocator.allocate_contiguous(2), ips(4, 5))
+        # Only 10 is left
+        with self.assertRaises(AllocationError):
+            allocator.allocate_contiguous(2)
+        self.assertEqual(allocator.allocate_contiguous(1), ips(10))
+
+    def test_allocate_contiguous_uses_exactly_fitting_interval(self):
+        allocator = IPAllocator(1, 5)
+        allocator.reserve_range(3, 3)
+        self.assertEqual(allocator.allocate_contiguous(2), ips(1, 2))
+        self.assertEqual(allocator.allocate_contiguous(2), ips(4, 5))
+        self.assertEqual(allocator.free_count(), 0)
+
+    def test_reserve_range_spanning_intervals(self):
+        allocator = IPAllocator(1, 10)
+        allocator.reserve_range(3, 3)
+        allocator.reserve_range(6, 6)
+        allocator.reserve_range(2, 8)
+        self.assertEqual(list(zip(allocator.starts, allocator.ends)), [(1, 1), (9, 10)])
+
+class SubnetAllocatorTest(unittest.TestCase):
+
+    def test_allocate_in_address_order_until_full(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        self.assertEqual([str(subnet) for subnet in allocator.allocate_many(24, 4)],
+                         ["10.100.0.0/24", "10.100.1.0/24", "10.100.2.0/24", "10.100.3.0/24"])
+        with self.assertRaises(AllocationError):
+            allocator.allocate(24)
+
+    def test_prefix_outside_network(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        with self.assertRaises(AllocationError):
+            allocator.allocate(21)
+        with self.assertRaises(AllocationError):
+            allocator.allocate(33)
+
+    def test_release_merges_buddies(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        subnets = allocator.allocate_many(24, 4)
+        for subnet in reversed(subnets):
+            allocator.release(subnet)
+        self.assertEqual(allocator.free, {22: [netaddr.IPNetwork("10.100.0.0/22").first], 23: [], 24: []})
+        self.assertEqual(str(allocator.allocate(22)), "10.100.0.0/22")
+
+    def test_release_does_not_merge_with_allocated_buddy(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        first, second, _, _ = allocator.allocate_many(24, 4)
+        allocator.release(second)
+        with self.assertRaises(AllocationError):
+            allocator.allocate(23)
+        self.assertEqual(str(allocator.allocate(24)), "10.100.1.0/24")
+
+    def test_reserve_splits_free_block(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        allocator.reserve("10.100.2.0/24")
+        self.assertEqual([str(subnet) for subnet in allocator.allocate_many(24, 3)],
+                         ["10.100.0.0/24", "10.100.1.0/24", "10.100.3.0/24"])
+
+    def test_unaligned_reservation_covers_its_whole_block(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        allocator.reserve("10.100.1.5/24")
+        self.assertEqual(str(allocator.allocate(23)), "10.100.2.0/23")
+        self.assertEqual(str(allocator.allocate(24)), "10.100.0.0/24")
+        with self.assertRaises(AllocationError):
+            allocator.allocate(24)
+
+    def test_reserve_over_smaller_free_blocks(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        allocator.allocate(24)
+        allocator.reserve("10.100.0.0/23")
+        self.assertEqual(str(allocator.allocate(24)), "10.100.2.0/24")
+
+    def test_reserve_outside_network_is_ignored(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        allocator.reserve("10.200.0.0/24")
+        allocator.reserve("10.100.0.0/16")
+        self.assertEqual(str(allocator.allocate(22)), "10.100.0.0/22")
+
+    def test_best_fit_keeps_larger_blocks(self):
+        allocator = SubnetAllocator("10.100.0.0/22")
+        allocator.reserve("10.100.0.0/24")
+        allocator.reserve("10.100.2.0/24")
+        # Free: 10.100.1.0/24 and 10.100.3.0/24, both /24 blocks
+        allocator.release("10.100.2.0/24")
+        # Free: 10.100.1.0/24 and 10.100.2.0/23
+        self.assertEqual(str(allocator.allocate(24, strategy="best-fit")), "10.100.1.0/24")
+        self.assertEqual(str(allocator.allocate(23)), "10.100.2.0/23")
+
+class NIDAllocatorTest(unittest.TestCase):
+
+    def test_allocate_fills_gaps(self):
+        allocator = NIDAllocator([1000, 1001, 1004])
+        self.assertEqual(allocator.allocate(2), 1002)
+        self.assertEqual(allocator.allocate(2), 1005)
+        self.assertTrue(allocator.is_used(1006))
+        self.assertFalse(allocator.is_used(1007))
+
+    def test_allocate_aligned(self):
+        allocator = NIDAllocator([1000, 1300])
+        self.assertEqual(allocator.allocate(256, align=256), 1512)
+        self.assertEqual(allocator.allocate(4, align=256), 1256)
+
+    def test_nids_below_minimum_are_ignored(self):
+        allocator = NIDAllocator([1, 999, "x"])
+        self.assertEqual(allocator.allocate(1), 1000)
+
+    def test_invalid_count(self):
+        with self.assertRaises(AllocationError):
+            NIDAllocator().allocate(0)
+
+class VLANAllocatorTest(unittest.TestCase):
+
+    def test_allocate_skips_used_vlans_and_runs_out(self):
+        allocator = VLANAllocator()
+        allocator.add_range("HMN_MTN", 3000, 3002)
+        self.assertTrue(allocator.reserve(3001))
+        self.assertFalse(allocator.reserve(3001))
+        self.assertEqual(allocator.allocate_many("HMN_MTN", 2), [3000, 3002])
+        with self.assertRaises(AllocationError):
+            allocator.allocate("HMN_MTN")
+
+    def test_vlans_are_shared_between_networks(self):
+        allocator = VLANAllocator()
+        allocator.add_range("HMN_MTN", 3000, 3001)
+        allocator.add_range("NMN_MTN", 3000, 3001)
+        self.assertEqual(allocator.allocate("HMN_MTN"), 3000)
+        self.assertEqual(allocator.allocate("NMN_MTN"), 3001)
+
+    def test_reserved_and_out_of_range_vlans(self):
+        allocator = VLANAllocator()
+        allocator.add_range("HMN_MTN", 0, 5000)
+        self.assertEqual(allocator.allocate("HMN_MTN"), 1)
+        for vlan in (-1, 0, 4095, 4096):
+            with self.assertRaises(AllocationError):
+                allocator.reserve(vlan)
+
+    def test_network_without_range(self):
+        with self.assertRaises(AllocationError):
+            VLANAllocator().allocate("HMN_MTN")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+# MIT License
+#
+# (C) Copyright [2022] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+import argparse
+from sls_cache import DEFAULT_CACHE_DIR
+from sls_metrics import Metrics, add_metrics_arguments
+from sls_validate import ERROR, WARNING, validate_sls_model
+from sls_workspace import add_workspace_argument, load_model, run_in_workspace
+
+# Parse CLI Arguments
+parser = argparse.ArgumentParser(description="Check a SLS state file for duplicate NIDs, aliases and cabinet VLANs, overlapping CIDRs and invalid IP reservations")
+parser.add_argument("sls_state_file", type=str, help="SLS State file to validate")
+parser.add_argument("--cache", action="store_true", help="Reuse a cached snapshot of the parsed SLS state when the file has not changed")
+parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="Directory holding SLS state snapshots, defaults to {}".format(DEFAULT_CACHE_DIR))
+parser.add_argument("--strict", action="store_true", help="Treat warnings as errors")
+add_workspace_argument(parser)
+add_metrics_arguments(parser)
+args = parser.parse_args()
+
+if args.workspace is not None:
+    exit(run_in_workspace(args.workspace, "validate_sls.py"))
+
+metrics = Metrics.from_args("validate_sls", args)
+
+metrics.begin("load")
+# Load in existing SLS State
+model = load_model(args.sls_state_file, cache_dir=args.cache_dir if args.cache else None)
+
+metrics.begin("validate")
+issues = validate_sls_model(model)
+errors = [issue for issue in issues if issue.severity == ERROR]
+warnings = [issue for issue in issues if issue.severity == WARNING]
+
+for issue in errors:
+    print("Error {}".format(issue.message))
+for issue in warnings:
+    print("Warning {}".format(issue.message))
+
+print("Found {} errors and {} warnings in {}".format(len(errors), len(warnings), args.sls_state_file))
+if errors or (args.strict and warnings):
+    exit(1)
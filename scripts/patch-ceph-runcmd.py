@@ -23,64 +23,106 @@
 #
 
 import argparse
-import http
+import concurrent.futures
 import sys
 import requests
-import json
-import os
-import urllib3
+from bss_cloud_init import CEPH_RUNCMD_RULES, describe, fetch_all_boot_parameters, find_targets, load_rules, parse_rules, \
+    patch_boot_parameters, plan_changes
+from csm_api_client import DEFAULT_API_GATEWAY, CsmApiClient, RequestTimer, TokenError, TokenManager
 
-urllib3.disable_warnings()
+parser = argparse.ArgumentParser(description='CEPH runcmd utility.')
+parser.add_argument('--api_gateway_address', action='store', default=DEFAULT_API_GATEWAY,
+                    help='Address of the API gateway. A full URL such as http://localhost:8080 may be given as well.')
+parser.add_argument('--workers', action='store', type=int, default=8,
+                    help='Number of requests made at the same time.')
+parser.add_argument('--timeout', action='store', type=float, default=30,
+                    help='Timeout in seconds of each request.')
+parser.add_argument('--retries', action='store', type=int, default=3,
+                    help='Number of times a failed request is retried.')
+parser.add_argument('--backoff', action='store', type=float, default=1,
+                    help='Seconds to wait before the first retry, doubled for each retry after it.')
+parser.add_argument('--rules', action='append',
+                    help='YAML or JSON file of cloud-init rules to apply instead of the built-in ceph runcmd rule. '
+                         'Can be given multiple times, see bss_cloud_init.py for the format.')
+parser.add_argument('--dry-run', action='store_true',
+                    help='Show the cloud-init changes that would be made without patching BSS.')
+parser.add_argument('--timings', action='store_true',
+                    help='Print the number and latency of the requests made to each service.')
+
+args = parser.parse_args()
 
 # Check to make sure we have a token.
-token = os.environ.get('TOKEN')
-if token is None:
-    print("TOKEN environment variable must be set!")
+try:
+    tokens = TokenManager.from_env(args.api_gateway_address)
+except TokenError as err:
+    print(err)
     sys.exit(1)
 
-parser = argparse.ArgumentParser(description='CEPH runcmd utility.')
-parser.add_argument('--api_gateway_address', action='store', default='api-gw-service-nmn.local',
-                    help='Address of the API gateway.')
+workers = max(args.workers, 1)
+client = CsmApiClient(args.api_gateway_address, tokens, timeout=args.timeout, retries=args.retries,
+                      backoff=args.backoff, pool_size=workers)
+timer = RequestTimer()
+if args.timings:
+    client.add_hook(timer)
 
-args = parser.parse_args()
+try:
+    if args.rules:
+        rules = [rule for path in args.rules for rule in load_rules(path)]
+    else:
+        rules = parse_rules(CEPH_RUNCMD_RULES)
+except (OSError, ValueError) as err:
+    print('Failed to load rules: {}'.format(err))
+    sys.exit(1)
+
+# Get the nodes targeted by the rules.
+try:
+    targets = find_targets(client, rules)
+except (requests.RequestException, TokenError, ValueError, KeyError) as err:
+    print('Failed to get the nodes from HSM: {}'.format(err))
+    sys.exit(1)
 
-session = requests.Session()
-session.verify = False
+with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    # Fetch the boot parameters of all of the nodes in a few bulk requests
+    entries, failures = fetch_all_boot_parameters(client, executor, list(targets))
 
-# Get the storage nodes.
-components_response = session.get('https://{}/apis/smd/hsm/v2/State/Components?role=Management&subrole=Storage'.format(
-        args.api_gateway_address),
-        headers={'Authorization': 'Bearer {}'.format(token)})
-components_json = components_response.json()
+    # Work out the changes locally, so entries that are already up to date are never patched
+    changes, unchanged, plan_failures = plan_changes(entries, targets)
+    for xname, reason in plan_failures.items():
+        failures.setdefault(xname, reason)
 
-for storage_component in components_json['Components']:
-    body = {'hosts': [storage_component['ID']]}
-    bss_response = session.get('https://{}/apis/bss/boot/v1/bootparameters'.format(args.api_gateway_address),
-                               headers={'Authorization': 'Bearer {}'.format(token),
-                                        "Content-Type": "application/json"},
-                               data=json.dumps(body))
-    bss_json = bss_response.json()[0]
+    for bss_json in unchanged:
+        print('BSS entry for {} is already up to date.'.format(describe(bss_json)))
 
-    run_cmd = bss_json['cloud-init']['user-data']['runcmd']
+    if args.dry_run:
+        for change in changes:
+            print('Would patch BSS entry for {} ({}):'.format(change.describe(), ', '.join(change.rules)))
+            for line in change.diff():
+                print('    {}'.format(line))
+    else:
+        # Each changed entry is patched independently, so a slow node only holds up its own worker
+        futures = {executor.submit(patch_boot_parameters, client, change.updated): change for change in changes}
+        for future in concurrent.futures.as_completed(futures):
+            change = futures[future]
+            try:
+                future.result()
+            except (requests.RequestException, TokenError, RuntimeError) as err:
+                for xname in change.hosts:
+                    failures[xname] = err
+                print('Failed to patch BSS entry for {}: {}'.format(change.describe(), err))
+            else:
+                print('BSS entry for {} patched.'.format(change.describe()))
 
-    # Out with the old (if it exists)...
-    cloudinit_script = "/srv/cray/scripts/common/storage-ceph-cloudinit.sh"
-    if cloudinit_script in run_cmd:
-        run_cmd.remove(cloudinit_script)
+if args.dry_run:
+    print()
+    print('{} of {} nodes would be patched.'.format(sum(len(change.hosts) for change in changes), len(targets)))
 
-    # ...and in with the new (if it's not already there)
-    enable_script = "/srv/cray/scripts/common/ceph-enable-services.sh"
-    if enable_script not in run_cmd:
-        run_cmd.append(enable_script)
+if args.timings:
+    print()
+    print(timer.report())
 
-    # Now patch BSS.
-    patch_response = session.patch('https://{}/apis/bss/boot/v1/bootparameters'.format(args.api_gateway_address),
-                               headers={'Authorization': 'Bearer {}'.format(token),
-                                        "Content-Type": "application/json"},
-                               data=json.dumps(bss_json))
-    if patch_response.status_code != http.HTTPStatus.OK:
-        print('Failed to patch BSS entry for {}/{}!'.format(storage_component['ID'],
-                                                            bss_json['cloud-init']['user-data']['hostname']))
-    else:
-        print('BSS entry for {}/{} patched.'.format(storage_component['ID'],
-                                                    bss_json['cloud-init']['user-data']['hostname']))
+if failures:
+    print()
+    print('Failed to patch {} of {} nodes:'.format(len(failures), len(targets)))
+    for xname in sorted(failures):
+        print('    {}: {}'.format(xname, failures[xname]))
+    sys.exit(1)
@@ -23,12 +23,16 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 #
 
+import argparse
+import concurrent.futures
+import os
 import requests
 import urllib3
 import sys
 import json
 import getpass
 import time
+from switch_inventory import DEFAULT_CACHE_FILE, DEFAULT_CACHE_TTL, SwitchCache, load_sls_switches
 
 
 def get_etc_hostnames():
@@ -49,61 +53,240 @@ def get_etc_hostnames():
     return hosts
 
 
+INSTALLED = "installed"
+ALREADY_INSTALLED = "already installed"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# States of an uploaded NAE script that is not ready for agents yet
+PENDING_SCRIPT_STATES = {"validating", "loading", "pending"}
+
+# Responses to an agent POST while the switch has not finished creating the
+# script. Anything else is final and is not retried.
+SCRIPT_NOT_READY_STATUS_CODES = {404, 503}
+
+# Delays between readiness checks, doubled after every check up to the maximum
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 2
+
+DEFAULT_URL_FORMAT = "https://{switch}"
+
+parser = argparse.ArgumentParser(description="Install the L2X-Watchdog NAE script and agent on the Aruba 8325 switches.")
+parser.add_argument("--switches", nargs="+", help="Switches to update, defaults to the Aruba switches in --sls-dump or else every host in /etc/hosts with sw in its name.")
+parser.add_argument("--sls-dump", help="SLS dump to take the Aruba management switches from, ex: the output of cray sls dumpstate list.")
+parser.add_argument("--cache-file", help=f"File caching the platform and firmware of each switch, defaults to {DEFAULT_CACHE_FILE}. "
+                                          "Runs with a --url-format other than the default only use a cache when this is given.")
+parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL, help="Seconds the cached platform of a switch is used before it is checked again.")
+parser.add_argument("--no-cache", action="store_true", help="Check the platform of every switch and do not update the cache.")
+parser.add_argument("--username", default="admin", help="Switch login user name.")
+parser.add_argument("--workers", type=int, default=16, help="Number of switches updated at the same time.")
+parser.add_argument("--timeout", type=float, default=30, help="Timeout in seconds of each request to a switch.")
+parser.add_argument("--ready-timeout", type=float, default=60,
+                    help="Seconds to wait for an uploaded NAE script to be ready for its agent.")
+parser.add_argument("--url-format", default=DEFAULT_URL_FORMAT,
+                    help="Base URL of the switch REST API, ex: http://localhost:8080/switches/{switch} for a mock. "
+                         "{ip} is replaced with the IP address of the switch from --sls-dump.")
+args = parser.parse_args()
+
 #
 # get list of switches
 #
-switches = []
-for line in get_etc_hostnames():
-    if "sw" in line:
-        switches.append(line)
+switch_ips = {}
+if args.sls_dump:
+    try:
+        inventory = load_sls_switches(args.sls_dump, brand="Aruba")
+    except (OSError, ValueError) as err:
+        print(f"Unable to read switches from {args.sls_dump}: {err}")
+        sys.exit(1)
+    switch_ips = {switch.alias: switch.ip for switch in inventory}
+
+if args.switches:
+    switches = args.switches
+elif args.sls_dump:
+    switches = [switch.alias for switch in inventory]
+else:
+    switches = []
+    for line in get_etc_hostnames():
+        if "sw" in line:
+            switches.append(line)
+    # /etc/hosts may list a switch more than once
+    switches = list(dict.fromkeys(switches))
+
+# The switches behind another URL, ex: a mock, are not the ones in the default
+# cache, so they are kept out of it
+if args.cache_file is None and args.url_format == DEFAULT_URL_FORMAT:
+    args.cache_file = DEFAULT_CACHE_FILE
+cache = None if args.no_cache or args.cache_file is None else SwitchCache(args.cache_file, args.cache_ttl)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # get switch password
-password = getpass.getpass("Switch login password: ")
+password = os.environ.get("SWITCH_PASSWORD") or getpass.getpass("Switch login password: ")
 
-creds = {"username": "admin", "password": password}
+creds = {"username": args.username, "password": password}
 script = {
     "name": "L2X-Watchdog",
     "script": "IyAtKi0gY29kaW5nOiB1dGYtOCAtKi0KIwojIChjKSBDb3B5cmlnaHQgMjAxOC0yMDE5IEhld2xldHQgUGFja2FyZCBFbnRlcnByaXNlIERldmVsb3BtZW50IExQCiMKIyBMaWNlbnNlZCB1bmRlciB0aGUgQXBhY2hlIExpY2Vuc2UsIFZlcnNpb24gMi4wICh0aGUgIkxpY2Vuc2UiKTsKIyB5b3UgbWF5IG5vdCB1c2UgdGhpcyBmaWxlIGV4Y2VwdCBpbiBjb21wbGlhbmNlIHdpdGggdGhlIExpY2Vuc2UuCiMgWW91IG1heSBvYnRhaW4gYSBjb3B5IG9mIHRoZSBMaWNlbnNlIGF0CiMKIyBodHRwOi8vd3d3LmFwYWNoZS5vcmcvbGljZW5zZXMvTElDRU5TRS0yLjAKIwojIFVubGVzcyByZXF1aXJlZCBieSBhcHBsaWNhYmxlIGxhdyBvciBhZ3JlZWQgdG8gaW4gd3JpdGluZywKIyBzb2Z0d2FyZSBkaXN0cmlidXRlZCB1bmRlciB0aGUgTGljZW5zZSBpcyBkaXN0cmlidXRlZCBvbiBhbgojICJBUyBJUyIgQkFTSVMsIFdJVEhPVVQgV0FSUkFOVElFUyBPUiBDT05ESVRJT05TIE9GIEFOWQojIEtJTkQsIGVpdGhlciBleHByZXNzIG9yIGltcGxpZWQuIFNlZSB0aGUgTGljZW5zZSBmb3IgdGhlCiMgc3BlY2lmaWMgbGFuZ3VhZ2UgZ292ZXJuaW5nIHBlcm1pc3Npb25zIGFuZCBsaW1pdGF0aW9ucwojIHVuZGVyIHRoZSBMaWNlbnNlLgoKTWFuaWZlc3QgPSB7CiAgICAnTmFtZSc6ICdMMlgtV2F0Y2hkb2cnLAogICAgJ0Rlc2NyaXB0aW9uJzogJ01vbml0b3IgZm9yIEwyIE1BQyBsZWFybmluZyBzeXN0ZW0gcHJvY2VzcyAnCiAgICAgICAgICAgICAgICAgICAnYW5kIGF0dGVtcHQgdG8gcmVzdGFydCB0byByZWNvdmVyIHN5c3RlbSBoZWFsdGguJywKICAgICdWZXJzaW9uJzogJzEuMCcsCiAgICAnVGFyZ2V0U29mdHdhcmVWZXJzaW9uJzogJzEwLjA0JywKICAgICdBdXRob3InOiAnQXJ1YmEgTmV0d29ya3MgLSBDRUUgVGVhbScKICAgIAp9CgpjbGFzcyBQb2xpY3koTkFFKToKICAgIGRlZiBfX2luaXRfXyhzZWxmKToKICAgICAgICBzZWxmLnIxID0gUnVsZSgiTDJYIFdhdGNoZG9nIikKICAgICAgICBzZWxmLnIxLmNvbmRpdGlvbigiZXZlcnkgNjAgc2Vjb25kcyIpCiAgICAgICAgc2VsZi5yMS5hY3Rpb24oc2VsZi5hY3Rpb25fdXBvbl9ib290KQogICAgICAgIHNlbGYudmFyaWFibGVzWydjb25maWd1cmVkJ10gPSAnMCcKCiAgICBkZWYgYWN0aW9uX3Vwb25fYm9vdChzZWxmLCBldmVudCk6CiAgICAgICAgaWYgaW50KHNlbGYudmFyaWFibGVzWydjb25maWd1cmVkJ10pID09IDE6CiAgICAgICAgICAgIEFjdGlvblNoZWxsKCJzdWRvIC90bXAvdG9wYmNtLnNoIikKICAgICAgICBlbHNlOgogICAgICAgICAgICBzZWxmLndyaXRlU2NyaXB0KCkKCiAgICBkZWYgd3JpdGVTY3JpcHQgKHNlbGYpOgogICAgICAgIHNlbGYudmFyaWFibGVzWydjb25maWd1cmVkJ10gPSAnMScKICAgICAgICAjIFRoZSBmb2xsb3dpbmcgQWN0aW9uU2hlbGwgd2lsbCBkbyB0aGUgZm9sbG93aW5nOgogICAgICAgICMgMS4gY3JlYXRlIGEgdGVtcG9yYXJ5IGZpbGUgZm9yIAogICAgICAgICMgMi4gaW5zdGFsbCBhIGJhc2ggc2NyaXB0IHRvIHRoZSBzd2l0Y2ggd2hpY2ggdXNlZAogICAgICAgICMgICAgZm9yIGNyZWF0aW5nIHRoZSB3YXRjaGRvZyBmb3IgQkNNTDJYCiAgICAgICAgQWN0aW9uU2hlbGwoCiAgICAgICAgICAgICcnJ2VjaG8gIiMhL2Jpbi9iYXNoIiA+IC90bXAvdG9wYmNtLnNoIFxuJycnCiAgICAgICAgICAgICcnJ2VjaG8gIlRPUD1cYHRvcCAtdyA1MTIgLWIgLW4gMSAtbyAlQ1BVIC1IIHwgZ3JlcCBiY21MMlhcYCIgPj4gL3RtcC90b3BiY20uc2hcbicnJwogICAgICAgICAgICAnJydlY2hvICJpZiBbWyBcJFRPUCBdXTsgdGhlbiIgPj4gL3RtcC90b3BiY20uc2hcbicnJwogICAgICAgICAgICAnJydlY2hvICIgICAgOiIgPj4gL3RtcC90b3BiY20uc2hcbicnJwogICAgICAgICAgICAnJydlY2hvICJlbHNlIiA+PiAvdG1wL3RvcGJjbS5zaFxuJycnCiAgICAgICAgICAgICcnJ2VjaG8gIiAgICBlY2hvIFxgZGF0ZVxgIiA+PiAvdG1wL3RvcGJjbS5zaFxuJycnCiAgICAgICAgICAgICcnJ2VjaG8gIiAgICBlY2hvICdCQ01MMnggUElEIG5vdCBmb3VuZCciID4+IC90bXAvdG9wYmNtLnNoXG4nJycKICAgICAgICAgICAgJycnZWNobyAiICAgIGVjaG8gJ0V4ZWN1dGluZyBiY21MMlguMCByZWNvdmVyeS4uLiciID4+IC90bXAvdG9wYmNtLnNoXG4nJycKICAgICAgICAgICAgJycnZWNobyAiICAgIGxvZ2dlciAiQkNNTDJYIGhhcyBxdWl0IHVuZXhwZWN0ZWRseSwgYXR0ZW1wdGluZyB0byByZXN0YXJ0Li4uIiIgPj4gL3RtcC90b3BiY20uc2hcbicnJwogICAgICAgICAgICAnJydlY2hvICIgICAgeyBlY2hvICJsMiB3YXRjaCBzdGFydCI7IHNsZWVwIDE7IGVjaG8gImwyIHdhdGNoIHN0b3AiOyBzbGVlcCAxOyB9IHwgL3Vzci9iaW4vc3RhcnRfYmNtX3NoZWxsIiA+PiAvdG1wL3RvcGJjbS5zaFxuJycnCiAgICAgICAgICAgICcnJ2VjaG8gImZpIiA+PiAvdG1wL3RvcGJjbS5zaFxuJycnCiAgICAgICAgICAgICcnJ2NobW9kIDc1NSAvdG1wL3RvcGJjbS5zaCBcbicnJyk=",
 }
 nae_agent = {"name": "L2X-Watchdog", "disabled": False}
 
-session = requests.Session()
 
-for switch in switches:
-    try:
-        login = session.post(
-            f"https://{switch}/rest/v10.04/login", data=creds, verify=False
-        )
+def poll(check, deadline):
+    """
+    Call check until it returns a value other than None, waiting with
+    exponential backoff between calls. Returns None if the deadline passes.
+    """
+    delay = POLL_INITIAL_DELAY
+    while True:
+        result = check()
+        if result is not None or time.monotonic() >= deadline:
+            return result
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+def script_ready(session, base_url):
+    """
+    The NAE script is ready once the switch returns it and it is no longer
+    being validated. Returns None while it is not ready.
+
+    A script without a status field, or with a status that is not one of
+    PENDING_SCRIPT_STATES, counts as ready as soon as the GET succeeds. The
+    agent POST is still retried while the switch answers that the script is
+    not ready, so this check only saves POSTs that are bound to fail.
+    """
+    response = session.get(f"{base_url}/rest/v10.04/system/nae_scripts/L2X-Watchdog", timeout=args.timeout)
+    if not response.ok:
+        return None
+    status = response.json().get("status")
+    if isinstance(status, str) and status.lower() in PENDING_SCRIPT_STATES:
+        return None
+    return True
+
+
+def create_agent(session, base_url):
+    """
+    POST the agent, returning None when the switch rejects it because the
+    script is not ready yet, so it is tried again
+    """
+    response = session.post(
+        f"{base_url}/rest/v1/system/nae_scripts/L2X-Watchdog/nae_agents",
+        json=nae_agent,
+        timeout=args.timeout,
+    )
+    if response.status_code in SCRIPT_NOT_READY_STATUS_CODES:
+        return None
+    return response
+
+
+def get_platform(session, base_url, switch):
+    """
+    The platform_name and software_version of a switch, from the cache when
+    they were learned recently
+    """
+    platform = cache.get(switch) if cache is not None else None
+    if platform is None or "platform_name" not in platform:
         # get running config
-        system = session.get(f"https://{switch}/rest/v10.04/system")
-        platform = system.json()
-        # if the switch is an Aruba 8325 then we will check see if the NAE script is already installed.
-        if "8325" == platform["platform_name"]:
-            response = session.get(f"https://{switch}/rest/v10.04/system/nae_scripts")
-            # check if NAE script is already installed.
-            if "L2X-Watchdog" in response.json():
-                print(f"L2X-Watchdog NAE script is already installed on {switch}.")
-            else:
-                # upload the script to the switch.
-                response = session.post(
-                    f"https://{switch}/rest/v1/system/nae_scripts",
-                    json=script,
-                    verify=False,
-                )
-                if response.ok:
-                    print(f"L2X-Watchdog NAE script is now installed. on {switch}")
-                # wait 3 seconds for the script to be created, the agent creation fails without the wait.
-                time.sleep(3)
-                # upload the agent to the script
-                upload_agent = session.post(
-                    f"https://{switch}/rest/v1/system/nae_scripts/L2X-Watchdog/nae_agents",
-                    json=nae_agent,
-                    verify=False,
-                )
-                if response.ok:
-                    print(f"L2X-Watchdog NAE agent is now installed on {switch}.")
-    finally:
-        logout = session.post(f"https://{switch}/rest/v10.04/logout")
+        system = session.get(f"{base_url}/rest/v10.04/system", timeout=args.timeout)
+        system.raise_for_status()
+        platform = {key: system.json().get(key) for key in ("platform_name", "software_version")}
+        if cache is not None:
+            cache.put(switch, platform)
+    return platform
+
+
+def install_nae_script(session, base_url, switch):
+    """
+    Install the NAE script and agent on a switch the session is logged into.
+    Returns the result and a message.
+    """
+    platform = get_platform(session, base_url, switch)
+    # if the switch is an Aruba 8325 then we will check see if the NAE script is already installed.
+    if "8325" != platform["platform_name"]:
+        return SKIPPED, f"{switch} is a {platform['platform_name']}, the NAE script is only needed on 8325 switches."
+
+    response = session.get(f"{base_url}/rest/v10.04/system/nae_scripts", timeout=args.timeout)
+    response.raise_for_status()
+    # check if NAE script is already installed.
+    if "L2X-Watchdog" in response.json():
+        return ALREADY_INSTALLED, f"L2X-Watchdog NAE script is already installed on {switch}."
+
+    # upload the script to the switch.
+    response = session.post(f"{base_url}/rest/v1/system/nae_scripts", json=script, timeout=args.timeout)
+    if not response.ok:
+        return FAILED, f"Failed to upload the L2X-Watchdog NAE script to {switch}: HTTP {response.status_code}"
+    print(f"L2X-Watchdog NAE script is now installed. on {switch}")
+
+    # the agent creation fails until the script has been created, wait for it to be ready
+    deadline = time.monotonic() + args.ready_timeout
+    poll(lambda: script_ready(session, base_url), deadline)
+
+    # upload the agent to the script, retrying while the switch still rejects it
+    upload_agent = poll(lambda: create_agent(session, base_url), deadline)
+    if upload_agent is None:
+        return FAILED, f"L2X-Watchdog NAE script on {switch} was not ready for its agent within {args.ready_timeout:g} seconds."
+    if upload_agent.ok:
+        return INSTALLED, f"L2X-Watchdog NAE agent is now installed on {switch}."
+    if upload_agent.status_code == 409:
+        return ALREADY_INSTALLED, f"L2X-Watchdog NAE agent is already installed on {switch}."
+    return FAILED, f"Failed to install the L2X-Watchdog NAE agent on {switch}: HTTP {upload_agent.status_code}"
+
+
+def update_switch(switch):
+    """
+    Log into a switch with a session of its own, so no cookies are shared
+    between switches, and always log out again.
+    """
+    # switches known not to need the script are not contacted at all
+    cached = cache.get(switch) if cache is not None else None
+    if cached is not None and cached.get("platform_name") != "8325":
+        return SKIPPED, f"{switch} is a {cached.get('platform_name')}, the NAE script is only needed on 8325 switches."
+
+    base_url = args.url_format.format(switch=switch, ip=switch_ips.get(switch) or switch)
+    with requests.Session() as session:
+        session.verify = False
+        try:
+            login = session.post(f"{base_url}/rest/v10.04/login", data=creds, timeout=args.timeout)
+            if not login.ok:
+                return FAILED, f"Failed to log into {switch}: HTTP {login.status_code}"
+        except requests.RequestException as err:
+            return FAILED, f"Failed to log into {switch}: {err}"
+
+        try:
+            return install_nae_script(session, base_url, switch)
+        except (requests.RequestException, ValueError, KeyError) as err:
+            return FAILED, f"Failed to update {switch}: {err}"
+        finally:
+            try:
+                session.post(f"{base_url}/rest/v10.04/logout", timeout=args.timeout)
+            except requests.RequestException as err:
+                print(f"Failed to log out of {switch}: {err}")
+
+
+# Each switch is updated independently, so the total time is that of the slowest switch
+results = {}
+with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+    futures = {executor.submit(update_switch, switch): switch for switch in switches}
+    for future in concurrent.futures.as_completed(futures):
+        result, message = future.result()
+        results[futures[future]] = (result, message)
+        print(message)
+
+if cache is not None:
+    try:
+        cache.save()
+    except OSError as err:
+        print(f"Unable to write the switch cache {args.cache_file}: {err}")
+
+print()
+print("Switch                         | Result")
+print("-------------------------------|-------------------")
+for switch in switches:
+    print("{:<31}| {}".format(switch, results[switch][0]))
 
+failed = [switch for switch in switches if results[switch][0] == FAILED]
+counts = {result: sum(1 for value, _ in results.values() if value == result) for result in (INSTALLED, ALREADY_INSTALLED, SKIPPED, FAILED)}
+print()
+print(", ".join("{} {}".format(count, result) for result, count in counts.items()))
+if failed:
+    sys.exit(1)
@@ -0,0 +1,150 @@
+#
+# MIT License
+#
+# (C) Copyright 2022 Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+"""
+Inventory of the management switches of a system, built from a SLS dump,
+with the platform and firmware of each switch cached between runs so switch
+automation scripts only contact the switches they need to.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+# SLS hardware types of the management switches
+SWITCH_TYPES = {
+    "comptype_mgmt_switch": "MgmtSwitch",
+    "comptype_hl_switch": "MgmtHLSwitch",
+    "comptype_cdu_mgmt_switch": "CDUMgmtSwitch",
+}
+
+DEFAULT_CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "csm-switches", "inventory.json")
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+
+class Switch:
+    """
+    A management switch from SLS
+    """
+
+    def __init__(self, xname, alias, switch_type, brand, ip):
+        self.xname = xname
+        self.alias = alias
+        self.switch_type = switch_type
+        self.brand = brand
+        self.ip = ip
+
+    def __repr__(self):
+        return "Switch({!r}, {!r}, {!r}, {!r}, {!r})".format(self.xname, self.alias, self.switch_type, self.brand, self.ip)
+
+
+def load_sls_switches(path, brand=None):
+    """
+    The management switches in a SLS dump, ordered by alias. Only switches of
+    the given brand are returned when one is given, ex: Aruba.
+    """
+    with open(path) as f:
+        hardware = json.load(f).get("Hardware", {})
+
+    switches = []
+    for xname, item in hardware.items():
+        if item.get("Type") not in SWITCH_TYPES:
+            continue
+
+        extra_properties = item.get("ExtraProperties", {})
+        aliases = extra_properties.get("Aliases") or [xname]
+        switch = Switch(xname, aliases[0], SWITCH_TYPES[item["Type"]], extra_properties.get("Brand"), extra_properties.get("IP4addr"))
+        if brand is None or switch.brand == brand:
+            switches.append(switch)
+
+    switches.sort(key=lambda switch: switch.alias)
+    return switches
+
+
+def _valid_entry(entry):
+    return isinstance(entry, dict) \
+        and isinstance(entry.get("checked"), (int, float)) and not isinstance(entry["checked"], bool) \
+        and isinstance(entry.get("facts"), dict)
+
+
+class SwitchCache:
+    """
+    Facts learned about each switch, such as its platform_name and
+    software_version, with the time they were learned. Facts older than the
+    TTL are ignored. Safe to update from several threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, ttl=DEFAULT_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.changed = False
+
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+
+        # Entries of a hand edited or older cache file that do not have the
+        # expected layout are dropped, and removed from the file on save
+        if isinstance(entries, dict):
+            self.entries = {name: entry for name, entry in entries.items() if _valid_entry(entry)}
+            self.changed = len(self.entries) != len(entries)
+
+    def get(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or time.time() - entry["checked"] > self.ttl:
+                return None
+            return entry["facts"]
+
+    def put(self, name, facts):
+        with self.lock:
+            self.entries[name] = {"checked": time.time(), "facts": facts}
+            self.changed = True
+
+    def save(self):
+        """
+        Atomically write the cache, if anything was learned
+        """
+        with self.lock:
+            if not self.changed:
+                return
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".inventory.", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.entries, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self.changed = False